@@ -2,6 +2,10 @@
 ASGI config for Lms project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn Lms.asgi:application``) so the
+async report progress endpoints in reports.streams and the notification push
+endpoints in notifications.streams can hold long-poll, SSE and WebSocket
+connections without tying up a worker thread each.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +17,21 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Lms.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from notifications.streams import notification_websocket  # noqa: E402  (needs the app registry)
+
+websocket_routes = {
+    '/ws/notifications/': notification_websocket,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] != 'websocket':
+        return await django_application(scope, receive, send)
+    handler = websocket_routes.get(scope['path'])
+    if handler is None:
+        await receive()
+        await send({'type': 'websocket.close'})
+        return
+    return await handler(scope, receive, send)
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'django_celery_beat',
     'rest_framework',
@@ -45,9 +46,13 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.backends.CachedJWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'utils.pagination.KeysetPagination',
+    # Reverse proxies in front of the app. Throttles key on the address the last of them saw;
+    # with 0 that is REMOTE_ADDR, and a client-supplied X-Forwarded-For is ignored.
+    'NUM_PROXIES': 0,
 }
 
 SIMPLE_JWT = {
@@ -57,6 +62,35 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Seconds an authenticated user's id, role and flags are cached (authentication.principals):
+# shared across processes, and in each process.
+AUTH_PRINCIPAL_CACHE_TIMEOUT = 300
+AUTH_PRINCIPAL_LOCAL_TTL = 5
+
+# Login and signup limits (authentication.throttling): (attempts, window in seconds) per
+# client IP or username. Over the limit, an identity is locked out for AUTH_LOCKOUT_BASE,
+# doubling per repeat up to AUTH_LOCKOUT_MAX; repeats are forgotten after AUTH_LOCKOUT_RESET.
+AUTH_THROTTLE_RATES = {
+    'login_ip': (30, 60),
+    'login_username': (10, 15 * 60),
+    'register_ip': (10, 60 * 60),
+}
+AUTH_LOCKOUT_BASE = timedelta(seconds=30)
+AUTH_LOCKOUT_MAX = timedelta(hours=1)
+AUTH_LOCKOUT_RESET = timedelta(days=1)
+
+# Signup password hashing (authentication.services): threads hashing at once, further
+# signups allowed to wait for one, and seconds they wait before getting a 503.
+PASSWORD_HASH_WORKERS = 4
+PASSWORD_HASH_QUEUE_SIZE = 64
+PASSWORD_HASH_TIMEOUT = 10
+
+# Expired refresh tokens are deleted from the outstanding/blacklist tables on this
+# schedule, TOKEN_GC_BATCH_SIZE rows per transaction with TOKEN_GC_PAUSE seconds between.
+TOKEN_GC_SCHEDULE = timedelta(hours=1)
+TOKEN_GC_BATCH_SIZE = 1000
+TOKEN_GC_PAUSE = 0.1
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -135,6 +169,20 @@ STATIC_URL = 'static/'
 # Media Files
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
 MEDIA_URL = "/media/"
+
+# Reports are written to an in-memory buffer that spills to a temporary file past this many bytes.
+REPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Report retention: outputs are deleted past this age, or oldest first once together they exceed the size.
+REPORT_MAX_AGE = timedelta(days=30)
+REPORT_MAX_TOTAL_SIZE = 5 * 1024 ** 3
+REPORT_PENDING_TIMEOUT = timedelta(hours=1)
+
+# How long a report's published progress stays readable by the status endpoints.
+REPORT_PROGRESS_TIMEOUT = 60 * 60 * 24
+# Longest a long-poll request waits for a change, and how long one SSE connection stays open.
+REPORT_LONG_POLL_TIMEOUT = 25
+REPORT_STREAM_TIMEOUT = 10 * 60
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -158,8 +206,67 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'notifications.tasks.send_overdue_alert',
         'schedule': timedelta(days=1),
     },
+    'archive_old_notifications_every_day': {
+        'task': 'notifications.tasks.archive_old_notifications',
+        'schedule': timedelta(days=1),
+    },
+    'refresh_circulation_rollups': {
+        'task': 'reports.tasks.refresh_circulation_stats',
+        'schedule': timedelta(minutes=5),
+    },
+    'evict_old_reports': {
+        'task': 'reports.tasks.evict_old_reports',
+        'schedule': timedelta(hours=1),
+    },
+    'expire_reservation_holds': {
+        'task': 'borrowing.tasks.expire_reservation_holds',
+        'schedule': timedelta(minutes=15),
+    },
+    'deliver_notifications': {
+        'task': 'notifications.tasks.deliver_notifications',
+        'schedule': timedelta(minutes=1),
+    },
+    'collect_expired_tokens': {
+        'task': 'authentication.tasks.collect_expired_tokens',
+        'schedule': TOKEN_GC_SCHEDULE,
+    },
 }
 
+# Loans younger than this are left for the next rollup run, so slow transactions can commit first.
+CIRCULATION_ROLLUP_LAG = timedelta(minutes=5)
+
+# How long a returned copy is set aside for the patron at the head of the hold queue.
+RESERVATION_HOLD_PERIOD = timedelta(days=3)
+
+# Days before the due date at which a return reminder is sent, once per loan and tier.
+RETURN_REMINDER_TIERS = (3, 1, 0)
+
+# Read notifications older than this are moved to the archive table.
+NOTIFICATION_ARCHIVE_AFTER = timedelta(days=90)
+# Pub/sub for pushing new notifications to connected clients (notifications.push).
+NOTIFICATION_PUSH_REDIS_URL = "redis://redis:6379/2"
+NOTIFICATION_PUSH_HEARTBEAT = 15
+# Undelivered events buffered per connection before a slow client is disconnected.
+NOTIFICATION_PUSH_QUEUE_SIZE = 100
+NOTIFICATION_REPLAY_BATCH_SIZE = 200
+
+# Outbound delivery channels (notifications.delivery). RATE is sends per second,
+# BURST the token bucket size, BATCH_SIZE the messages sent per connection and UPDATE.
+# Only configured channels get deliveries; add 'sms' here once a provider transport exists.
+NOTIFICATION_TRANSPORTS = {
+    'email': {
+        'BACKEND': 'notifications.transports.EmailTransport',
+        'RATE': 10,
+        'BURST': 100,
+        'BATCH_SIZE': 100,
+    },
+}
+NOTIFICATION_DELIVERY_MAX_ATTEMPTS = 6
+NOTIFICATION_DELIVERY_BACKOFF = timedelta(seconds=30)
+NOTIFICATION_DELIVERY_MAX_BACKOFF = timedelta(hours=1)
+NOTIFICATION_DELIVERY_LEASE = timedelta(minutes=5)
+NOTIFICATION_DELIVERY_TIME_LIMIT = 50
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -182,3 +289,6 @@ CACHES = {
         }
     }
 }
+
+# Catalog responses are invalidated by version bumps, so this only bounds how long unused entries linger.
+CATALOG_CACHE_TIMEOUT = 60 * 60
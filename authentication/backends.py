@@ -0,0 +1,41 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .principals import LazyUser, get_principal, token_rejection
+from .tokens import MEMBERSHIP_EXPIRY_CLAIM, ROLE_CLAIM
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user query. Tokens carrying
+    role claims authenticate as a LazyUser with no lookup at all. Older
+    tokens are served from the principal cache. Revoked tokens, and tokens
+    whose claims went stale, are rejected with one shared cache round trip.
+    See authentication.principals.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        user_id = token.get(api_settings.USER_ID_CLAIM)
+        reason = token_rejection(token, user_id)
+        if reason is not None:
+            raise InvalidToken({'detail': reason, 'code': 'token_not_valid'})
+        return token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        if ROLE_CLAIM in validated_token:
+            return LazyUser(user_id, validated_token[ROLE_CLAIM], validated_token.get(MEMBERSHIP_EXPIRY_CLAIM))
+
+        user = get_principal(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
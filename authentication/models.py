@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from .principals import mark_claims_stale
+
 
 class LibraryUser(AbstractUser):
     ROLE_CHOICES = (
@@ -16,6 +18,15 @@ class LibraryUser(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.role})"
 
+    def save(self, *args, **kwargs):
+        previous = None
+        if not self._state.adding:
+            previous = type(self).objects.filter(pk=self.pk).values_list('role', 'is_active').first()
+        super(LibraryUser, self).save(*args, **kwargs)
+        # Tokens carry the role as a claim; an active flag change must also end existing sessions.
+        if previous is not None and previous != (self.role, self.is_active):
+            mark_claims_stale(self.pk)
+
     @property
     def is_admin(self):
         return self.role == 'admin'
@@ -36,3 +47,12 @@ class MemberProfile(models.Model):
 
     def __str__(self):
         return f"{self.user.username}'s profile"
+
+    def save(self, *args, **kwargs):
+        previous = None
+        if not self._state.adding:
+            previous = (MemberProfile.objects.filter(pk=self.pk)
+                        .values_list('membership_expiry', flat=True).first())
+        super(MemberProfile, self).save(*args, **kwargs)
+        if previous != self.membership_expiry:
+            mark_claims_stale(self.user_id)
@@ -0,0 +1,189 @@
+"""
+Cached identity for token authentication.
+
+A principal is the handful of user columns that authentication and
+permission checks need. It is cached in this process for
+AUTH_PRINCIPAL_LOCAL_TTL seconds and in the shared cache for
+AUTH_PRINCIPAL_CACHE_TIMEOUT seconds. Saving or deleting a user drops the
+entry, so role changes and deactivation take effect on the next request
+(other processes notice within the short local TTL). The user comes back as
+a model instance with only those columns loaded. Any other field is read
+from the database the first time it is accessed.
+
+Revoked token ids are kept in the shared cache until the token would have
+expired anyway. While that cache is unreachable, tokens are refused.
+
+Tokens issued by authentication.tokens carry the role and membership expiry
+as claims. For those, request.user is a LazyUser that answers from the
+claims and only loads the principal when anything else is needed. When a
+user's claims change, tokens issued before the change are refused (see
+mark_claims_stale) and the client gets fresh claims by refreshing.
+"""
+import logging
+import time
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.functional import SimpleLazyObject
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_KEY = 'auth:principal:{}'
+REVOKED_KEY = 'auth:revoked:{}'
+CLAIMS_CHANGED_KEY = 'auth:claims-changed:{}'
+# When a token's claims were read from the database, in fractional epoch seconds.
+CLAIMS_READ_AT_CLAIM = 'claims_at'
+# In model field order, as Model.from_db expects for a partial row.
+PRINCIPAL_FIELDS = ('id', 'is_superuser', 'username', 'is_staff', 'is_active', 'role')
+# Entries kept in the per-process cache before it is cleared.
+LOCAL_MAX_ENTRIES = 10000
+
+_local = {}
+
+
+def _load(user_id):
+    now = time.monotonic()
+    entry = _local.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    try:
+        values = cache.get(PRINCIPAL_KEY.format(user_id))
+        cache_available = True
+    except Exception:
+        # Without the shared cache, authentication reads the database rather than failing.
+        logger.warning('Principal cache unavailable', exc_info=True)
+        values, cache_available = None, False
+    if values is None:
+        values = get_user_model().objects.filter(pk=user_id).values_list(*PRINCIPAL_FIELDS).first()
+        if values is None:
+            return None
+        if cache_available:
+            cache.set(PRINCIPAL_KEY.format(user_id), values, settings.AUTH_PRINCIPAL_CACHE_TIMEOUT)
+    if len(_local) >= LOCAL_MAX_ENTRIES:
+        _local.clear()
+    _local[user_id] = (now + settings.AUTH_PRINCIPAL_LOCAL_TTL, tuple(values))
+    return values
+
+
+def get_principal(user_id):
+    """The user with PRINCIPAL_FIELDS loaded and the rest deferred, or None if there is no such user."""
+    values = _load(user_id)
+    if values is None:
+        return None
+    return get_user_model().from_db(DEFAULT_DB_ALIAS, PRINCIPAL_FIELDS, values)
+
+
+def _drop_principal(user_id):
+    _local.pop(user_id, None)
+    try:
+        cache.delete(PRINCIPAL_KEY.format(user_id))
+    except Exception:
+        # A failed delete must not fail the user write; the entry expires within AUTH_PRINCIPAL_CACHE_TIMEOUT.
+        logger.warning('Could not drop the cached principal of user %s', user_id, exc_info=True)
+
+
+def forget_principal(user_id):
+    """
+    Drop the cached principal now and again once the transaction commits.
+    The second drop discards anything a concurrent request cached from the
+    pre-commit row in between.
+    """
+    _drop_principal(user_id)
+    transaction.on_commit(lambda: _drop_principal(user_id))
+
+
+class LazyUser(SimpleLazyObject):
+    """request.user for a token with claims; the principal is loaded only for attributes the claims lack."""
+
+    def __init__(self, user_id, role, membership_expiry):
+        super().__init__(lambda: get_principal(user_id))
+        self.__dict__['_claims'] = {
+            'pk': user_id,
+            'id': user_id,
+            'role': role,
+            'membership_expiry': date.fromisoformat(membership_expiry) if membership_expiry else None,
+            'is_active': True,
+            'is_authenticated': True,
+            'is_anonymous': False,
+            'is_admin': role == 'admin',
+            'is_librarian': role == 'librarian',
+            'is_member': role == 'member',
+        }
+
+    def __getattr__(self, name):
+        claims = self.__dict__['_claims']
+        if name in claims:
+            return claims[name]
+        return super().__getattr__(name)
+
+    def __bool__(self):
+        # IsAuthenticated tests ``request.user`` for truth before reading is_authenticated.
+        return True
+
+
+def _set_claims_changed(user_id):
+    try:
+        cache.set(CLAIMS_CHANGED_KEY.format(user_id), time.time(),
+                  timeout=int(settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds()))
+    except Exception:
+        # Refresh still re-reads the claims, so stale ones outlive this only until the access token expires.
+        logger.warning('Could not mark the claims of user %s as stale', user_id, exc_info=True)
+
+
+def mark_claims_stale(user_id):
+    """
+    Refuse the user's tokens whose claims were read before now; they carry
+    an outdated role, membership or active flag. Marked again once the
+    transaction commits, so claims read from the pre-commit row in between
+    are refused too.
+    """
+    _set_claims_changed(user_id)
+    transaction.on_commit(lambda: _set_claims_changed(user_id))
+
+
+def token_rejection(token, user_id):
+    """Why ``token`` may no longer be used, or None; one cache round trip."""
+    jti_key, claims_key = REVOKED_KEY.format(token['jti']), CLAIMS_CHANGED_KEY.format(user_id)
+    try:
+        found = cache.get_many([jti_key, claims_key])
+    except Exception:
+        # Revocations are kept only in the cache, so the database cannot stand in; fail closed.
+        logger.warning('Token revocation cache unavailable', exc_info=True)
+        return 'Token status could not be verified'
+    if jti_key in found:
+        return 'Token is blacklisted'
+    if claims_key in found:
+        # Tokens without claims fall back to ``iat``. It is rounded down to whole
+        # seconds, so a token from the second of the change counts as older.
+        read_at = token.get(CLAIMS_READ_AT_CLAIM, token.get('iat', 0))
+        if read_at < found[claims_key]:
+            return 'Token claims are out of date'
+    return None
+
+
+def revoke_token(token):
+    """Reject ``token`` (a validated simplejwt token) from now until it expires."""
+    remaining = token['exp'] - time.time()
+    if remaining > 0:
+        cache.set(REVOKED_KEY.format(token['jti']), True, timeout=int(remaining) + 1)
+
+
+def _forget_saved_user(sender, instance, **kwargs):
+    forget_principal(instance.pk)
+
+
+def _forget_deleted_user(sender, instance, **kwargs):
+    forget_principal(instance.pk)
+    mark_claims_stale(instance.pk)
+
+
+def connect_principal_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    user_model = get_user_model()
+    post_save.connect(_forget_saved_user, sender=user_model, dispatch_uid='auth_principal_save')
+    post_delete.connect(_forget_deleted_user, sender=user_model, dispatch_uid='auth_principal_delete')
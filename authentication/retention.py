@@ -0,0 +1,52 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+logger = logging.getLogger(__name__)
+
+
+def flush_expired_tokens(batch_size=None, pause=None):
+    """
+    Delete refresh tokens that have expired from the outstanding and
+    blacklist tables. Returns the number of outstanding tokens deleted.
+
+    The tables are walked in primary-key order. ``expires_at`` has no index,
+    but ids grow with issue time, so each batch is an index range scan over
+    the oldest rows. Each batch runs in its own short transaction. It locks
+    at most ``batch_size`` rows with SKIP LOCKED, then deletes them and
+    their blacklist entries by primary key. ``pause`` seconds between
+    batches lets replicas and autovacuum keep up. Both default to the
+    TOKEN_GC_* settings.
+    """
+    batch_size = batch_size or settings.TOKEN_GC_BATCH_SIZE
+    pause = settings.TOKEN_GC_PAUSE if pause is None else pause
+    expired = OutstandingToken.objects.filter(expires_at__lt=timezone.now())
+    deleted = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            pks = list(
+                expired.filter(pk__gt=last_pk).select_for_update(skip_locked=True)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                return deleted
+            last_pk = pks[-1]
+            # Only ids are loaded; the blacklist rows go in the same cascade.
+            counts = OutstandingToken.objects.filter(pk__in=pks).only('pk').delete()[1]
+            deleted += counts.get(OutstandingToken._meta.label, 0)
+        if len(pks) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def token_table_sizes():
+    return {
+        'outstanding': OutstandingToken.objects.count(),
+        'blacklisted': BlacklistedToken.objects.count(),
+    }
@@ -0,0 +1,36 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import LibraryRefreshToken, read_claims, set_claims
+
+
+class LibraryTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = LibraryRefreshToken
+
+
+class LibraryTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Rotates like simplejwt's serializer, but stamps the new tokens with the
+    user's current claims. A role change therefore reaches clients at their
+    next refresh, and inactive users cannot refresh.
+    """
+    token_class = LibraryRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        claims = read_claims(refresh[api_settings.USER_ID_CLAIM])
+        if claims is None:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        set_claims(refresh, *claims)
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
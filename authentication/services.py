@@ -0,0 +1,83 @@
+import threading
+from concurrent import futures
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+User = get_user_model()
+
+
+class RegistrationError(Exception):
+    pass
+
+
+class HashingBusy(Exception):
+    """Too many passwords are already waiting to be hashed."""
+
+
+class PasswordHasherPool:
+    """
+    Hashes passwords on at most ``workers`` threads. hashlib releases the GIL
+    during PBKDF2, so the workers run in parallel, while a signup burst
+    cannot take more cores than that from the rest of the site. At most
+    ``queue_size`` more requests wait for a worker; beyond that HashingBusy
+    is raised at once, and callers that waited ``timeout`` seconds get it
+    too.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+    def hash(self, password):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(make_password, password)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            # The hash still finishes on its worker; only this request gives up on it.
+            raise HashingBusy()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hasher_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PasswordHasherPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_SIZE,
+                                       settings.PASSWORD_HASH_TIMEOUT)
+    return _pool
+
+
+def register_user(username, password, contact_number, email=None, role='member'):
+    """
+    Create a user and return it. Taken usernames and phone numbers are
+    refused with one query before the password is hashed, so duplicates cost
+    no hashing. The unique constraints on both columns settle signups that
+    race past that check, and are reported the same way.
+    """
+    if User.objects.filter(Q(username=username) | Q(contact_number=contact_number)).exists():
+        raise RegistrationError('Username or phone number already exist ')
+
+    user = User(username=User.normalize_username(username), email=User.objects.normalize_email(email),
+                role=role, contact_number=contact_number)
+    user.password = get_hasher_pool().hash(password)
+    try:
+        with transaction.atomic():
+            user.save()
+    except IntegrityError:
+        raise RegistrationError('Username or phone number already exist ')
+    return user
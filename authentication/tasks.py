@@ -0,0 +1,17 @@
+import logging
+
+from celery import shared_task
+
+from .retention import flush_expired_tokens, token_table_sizes
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def collect_expired_tokens(batch_size=None):
+    """Delete expired refresh tokens in batches and report what is left in the token tables."""
+    deleted = flush_expired_tokens(batch_size=batch_size)
+    sizes = token_table_sizes()
+    logger.info('Flushed %d expired tokens; %d outstanding and %d blacklisted remain',
+                deleted, sizes['outstanding'], sizes['blacklisted'])
+    return {'deleted': deleted, **sizes}
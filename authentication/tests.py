@@ -1,10 +1,30 @@
-from django.test import TestCase
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 from authentication.models import LibraryUser, MemberProfile
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
+from authentication.retention import flush_expired_tokens
+from authentication.services import (HashingBusy, PasswordHasherPool, RegistrationError, get_hasher_pool,
+                                     register_user)
+from authentication import throttling
+from authentication.tasks import collect_expired_tokens
+from authentication.principals import LazyUser, forget_principal, get_principal
+from authentication.tokens import LibraryRefreshToken
+from utils.permissions import HasActiveMembership, IsAdminOrLibrarian, IsAdminOrLibrarianOrOwner
 
 
 class LibraryUserTest(TestCase):
@@ -201,3 +221,318 @@ class RefreshTokenTest(APITestCase):
         response = self.client.post(self.url, {'refresh': 'invalid_refresh_token'})
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CachedAuthenticationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cached', password='testpassword', role='member')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        self.addCleanup(forget_principal, self.user.pk)
+
+    def test_authentication_is_query_free_once_cached(self):
+        self.client.get(reverse('protected'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_principal_defers_other_fields(self):
+        user = get_principal(self.user.pk)
+        self.assertEqual((user.pk, user.role, user.is_active), (self.user.pk, 'member', True))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, self.user.email)
+
+    def test_role_change_and_deactivation_apply_immediately(self):
+        self.client.get(reverse('protected'))
+        self.user.role = 'librarian'
+        self.user.save()
+        self.assertEqual(get_principal(self.user.pk).role, 'librarian')
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_writes_and_authentication_survive_a_cache_outage(self):
+        with mock.patch.object(cache, 'delete', side_effect=ConnectionError), \
+                self.assertLogs('authentication.principals', 'WARNING'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.user.address = 'Elsewhere'
+            self.user.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).address, 'Elsewhere')
+
+        forget_principal(self.user.pk)
+        with mock.patch.object(cache, 'get', side_effect=ConnectionError), \
+                self.assertLogs('authentication.principals', 'WARNING'):
+            self.assertEqual(get_principal(self.user.pk).role, 'member')
+
+    def test_logout_revokes_the_access_token(self):
+        response = self.client.post(reverse('logout'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+        response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_are_refused_when_revocations_cannot_be_read(self):
+        with mock.patch.object(cache, 'get_many', side_effect=ConnectionError), \
+                self.assertLogs('authentication.principals', 'WARNING'):
+            response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['code'], 'token_not_valid')
+
+
+class RoleClaimTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='claims', password='testpassword', role='member')
+        self.addCleanup(forget_principal, self.user.pk)
+
+    def authenticate(self, refresh):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_login_issues_role_claims(self):
+        response = self.client.post(reverse('login'), {'username': 'claims', 'password': 'testpassword'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        refresh = LibraryRefreshToken(response.data['refresh'])
+        self.assertEqual(refresh['role'], 'member')
+        self.assertEqual(refresh.access_token['role'], 'member')
+
+    def test_claims_authenticate_without_queries(self):
+        self.authenticate(LibraryRefreshToken.for_user(self.user))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_role_change_rejects_older_tokens(self):
+        refresh = LibraryRefreshToken.for_user(self.user)
+        self.authenticate(refresh)
+        # Issued within the same second as the change, but before it.
+        with mock.patch('time.time', return_value=refresh['claims_at'] + 0.001):
+            self.user.role = 'librarian'
+            self.user.save()
+        response = self.client.get(reverse('protected'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.authenticate(LibraryRefreshToken.for_user(self.user))
+        self.assertEqual(self.client.get(reverse('protected')).status_code, status.HTTP_200_OK)
+
+    def test_role_change_is_saved_when_the_cache_is_down(self):
+        with mock.patch.object(cache, 'set', side_effect=ConnectionError), \
+                mock.patch.object(cache, 'delete', side_effect=ConnectionError), \
+                self.assertLogs('authentication.principals', 'WARNING'):
+            self.user.role = 'librarian'
+            self.user.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).role, 'librarian')
+
+    def test_refresh_restamps_claims(self):
+        refresh = LibraryRefreshToken.for_user(self.user)
+        User.objects.filter(pk=self.user.pk).update(role='librarian')
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(LibraryRefreshToken(response.data['refresh'])['role'], 'librarian')
+
+    def test_refresh_refuses_inactive_user(self):
+        refresh = LibraryRefreshToken.for_user(self.user)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_permissions_read_claims_only(self):
+        request = type('Request', (), {'method': 'GET', 'user': LazyUser(self.user.pk, 'librarian', '2000-01-01')})
+        obj = type('Owned', (), {'user_id': self.user.pk + 1})
+        with self.assertNumQueries(0):
+            self.assertTrue(IsAdminOrLibrarian().has_permission(request, None))
+            self.assertTrue(IsAdminOrLibrarianOrOwner().has_object_permission(request, None, obj))
+            self.assertTrue(HasActiveMembership().has_permission(request, None))
+
+        request.user = LazyUser(self.user.pk, 'member', '2000-01-01')
+        with self.assertNumQueries(0):
+            self.assertFalse(IsAdminOrLibrarian().has_permission(request, None))
+            self.assertFalse(IsAdminOrLibrarianOrOwner().has_object_permission(request, None, obj))
+            obj.user_id = self.user.pk
+            self.assertTrue(IsAdminOrLibrarianOrOwner().has_object_permission(request, None, obj))
+            self.assertFalse(HasActiveMembership().has_permission(request, None))
+
+
+class TokenGarbageCollectionTests(TestCase):
+    def setUp(self):
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+        self.user = User.objects.create_user(username='tokens', password='testpassword')
+        now = timezone.now()
+        for index in range(5):
+            expires_at = now - timedelta(days=1) if index < 3 else now + timedelta(days=1)
+            token = OutstandingToken.objects.create(user=self.user, jti=f'jti-{index}', token='token',
+                                                    expires_at=expires_at)
+            if index % 2 == 0:
+                BlacklistedToken.objects.create(token=token)
+
+    def test_deletes_expired_tokens_in_batches(self):
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+        # Per batch: savepoint, claim, load ids, two deletes, release; then an empty claim.
+        with self.assertNumQueries(3 * 6 + 3):
+            deleted = flush_expired_tokens(batch_size=1, pause=0)
+        self.assertEqual(deleted, 3)
+        self.assertEqual(sorted(OutstandingToken.objects.values_list('jti', flat=True)), ['jti-3', 'jti-4'])
+
+    def test_task_reports_table_sizes(self):
+        result = collect_expired_tokens()
+        self.assertEqual(result, {'deleted': 3, 'outstanding': 2, 'blacklisted': 1})
+
+
+class RegistrationServiceTests(TestCase):
+    def test_duplicates_are_refused_before_hashing(self):
+        User.objects.create_user(username='taken', password='testpassword', contact_number='09120000000')
+        with mock.patch('authentication.services.make_password') as make_password:
+            with self.assertNumQueries(1), self.assertRaises(RegistrationError):
+                register_user('fresh', 'testpassword', '09120000000')
+        make_password.assert_not_called()
+
+    def test_signup_racing_past_the_check_gets_400(self):
+        def hash_and_lose_the_race(password):
+            User.objects.create_user(username='racer', password='x', contact_number='09120000001')
+            return 'hashed'
+
+        with mock.patch.object(get_hasher_pool(), 'hash', side_effect=hash_and_lose_the_race):
+            response = self.client.post(reverse('register'), {
+                'username': 'racer', 'password': 'testpassword', 'phone_number': '09120000002'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(User.objects.filter(username='racer').count(), 1)
+
+    def test_saturated_pool_refuses_work(self):
+        release = threading.Event()
+        pool = PasswordHasherPool(workers=1, queue_size=0, timeout=5)
+        with mock.patch('authentication.services.make_password', side_effect=lambda password: release.wait()):
+            waiting = threading.Thread(target=pool.hash, args=('first',))
+            waiting.start()
+            time.sleep(0.05)
+            with self.assertRaises(HashingBusy):
+                pool.hash('second')
+            release.set()
+            waiting.join()
+        self.assertTrue(make_password('third') and pool.hash('third'))
+
+    def test_slow_hash_times_out_as_busy(self):
+        release = threading.Event()
+        pool = PasswordHasherPool(workers=1, queue_size=0, timeout=0.01)
+        with mock.patch('authentication.services.make_password', side_effect=lambda password: release.wait()):
+            with self.assertRaises(HashingBusy):
+                pool.hash('slow')
+            release.set()
+
+
+class RegistrationBurstTests(TransactionTestCase):
+    """A burst of concurrent signups all succeed, and hashing never exceeds the configured workers."""
+    signups = 12
+    clients = 8
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def test_signup_burst(self):
+        running = peak = 0
+        lock = threading.Lock()
+
+        def counted_make_password(password):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            try:
+                return make_password(password)
+            finally:
+                with lock:
+                    running -= 1
+
+        def signup(index):
+            try:
+                return APIClient().post(reverse('register'), {
+                    'username': f'burst{index}', 'password': 'testpassword', 'phone_number': f'0913{index:07d}',
+                }, REMOTE_ADDR=f'10.1.0.{index}').status_code
+            finally:
+                connection.close()
+
+        with mock.patch('authentication.services.make_password', side_effect=counted_make_password):
+            with ThreadPoolExecutor(max_workers=self.clients) as executor:
+                codes = list(executor.map(signup, range(self.signups)))
+
+        self.assertEqual(codes, [status.HTTP_201_CREATED] * self.signups)
+        self.assertEqual(User.objects.filter(username__startswith='burst').count(), self.signups)
+        self.assertLessEqual(peak, settings.PASSWORD_HASH_WORKERS)
+
+
+@override_settings(AUTH_THROTTLE_RATES={'login_ip': (5, 60), 'login_username': (3, 60), 'register_ip': (2, 60)})
+class ThrottlingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='target', password='testpassword', role='admin')
+        self.addCleanup(cache.clear)
+
+    def login(self, username='target', password='wrong', address='10.0.0.1'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password},
+                                REMOTE_ADDR=address)
+
+    def test_username_is_locked_out_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+        with mock.patch('django.contrib.auth.hashers.PBKDF2PasswordHasher.verify') as verify, \
+                self.assertLogs('authentication.throttling', 'WARNING'):
+            response = self.login(password='testpassword', address='10.0.0.2')
+        verify.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(int(response['Retry-After']), 30)
+        self.assertEqual(self.login(username='someone-else', address='10.0.0.2').status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_lockout_doubles_on_repeat(self):
+        with self.assertLogs('authentication.throttling', 'WARNING'):
+            for _ in range(4):
+                self.login()
+            cache.delete(throttling.LOCK_KEY.format('login_username', hashlib.blake2b(b'target', digest_size=16)
+                                                    .hexdigest()))
+            response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(int(response['Retry-After']), 60)
+
+    def test_ip_limit_spans_usernames(self):
+        for index in range(5):
+            self.login(username=f'user{index}')
+        with self.assertLogs('authentication.throttling', 'WARNING'):
+            response = self.login(username='user5')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_header_does_not_reset_the_ip_limit(self):
+        for index in range(5):
+            self.client.post(reverse('login'), {'username': f'user{index}', 'password': 'wrong'},
+                             HTTP_X_FORWARDED_FOR=f'203.0.113.{index}')
+        with self.assertLogs('authentication.throttling', 'WARNING'):
+            response = self.client.post(reverse('login'), {'username': 'user5', 'password': 'wrong'},
+                                        HTTP_X_FORWARDED_FOR='203.0.113.99')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_non_object_body_has_no_username(self):
+        response = self.client.post(reverse('login'), ['target'], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_registration_is_limited_per_ip(self):
+        for index in range(2):
+            self.client.post(reverse('register'), {'username': f'new{index}', 'password': 'testpassword',
+                                                   'phone_number': f'0915000000{index}'})
+        with self.assertLogs('authentication.throttling', 'WARNING'):
+            response = self.client.post(reverse('register'), {'username': 'new2', 'password': 'testpassword',
+                                                              'phone_number': '09150000002'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_falls_back_to_local_counters_without_the_cache(self):
+        with mock.patch.object(cache, 'get_many', side_effect=ConnectionError), \
+                mock.patch.object(cache, 'incr', side_effect=ConnectionError), \
+                mock.patch.object(cache, 'set', side_effect=ConnectionError), \
+                self.assertLogs('authentication.throttling', 'WARNING'):
+            for _ in range(3):
+                self.login(username='offline')
+            self.assertEqual(self.login(username='offline').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.addCleanup(throttling._local.clear)
+
+    def test_rejections_are_counted(self):
+        with self.assertLogs('authentication.throttling', 'WARNING'):
+            for _ in range(5):
+                self.login()
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('throttle-stats'))
+        self.assertEqual(response.data['rejected'], {'login_ip': 0, 'login_username': 2, 'register_ip': 0})
@@ -0,0 +1,163 @@
+"""
+Rate limits for login and registration, checked before any password is
+hashed, so a credential-stuffing burst is turned away cheaply.
+
+Each limit counts attempts per client IP or per username in a sliding
+window, estimated from two fixed-window counters: the current window's
+count plus the previous window's, weighted by how much of it still
+overlaps. Counters are atomic increments in the shared cache (Redis in
+production). If the cache is unreachable they fall back to counters in
+this process, which still limit each worker on its own.
+
+An identity that goes over its limit is locked out. The lockout starts at
+AUTH_LOCKOUT_BASE and doubles with every further lockout, up to
+AUTH_LOCKOUT_MAX. The strike count is forgotten after AUTH_LOCKOUT_RESET.
+Rejected attempts are counted per scope (see rejection_counts).
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+COUNT_KEY = 'auth:throttle:{}:{}:{}'
+LOCK_KEY = 'auth:throttle:lock:{}:{}'
+STRIKES_KEY = 'auth:throttle:strikes:{}:{}'
+REJECTED_KEY = 'auth:throttle:rejected:{}'
+# Entries kept in the per-process fallback before it is cleared.
+LOCAL_MAX_ENTRIES = 10000
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def _local_get_many(keys):
+    now = time.monotonic()
+    with _local_lock:
+        entries = {key: _local.get(key) for key in keys}
+    return {key: entry[1] for key, entry in entries.items() if entry is not None and entry[0] > now}
+
+
+def _local_incr(key, timeout):
+    now = time.monotonic()
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is None or entry[0] <= now:
+            if len(_local) >= LOCAL_MAX_ENTRIES:
+                _local.clear()
+            entry = (now + timeout, 0)
+        _local[key] = (entry[0], entry[1] + 1)
+        return entry[1] + 1
+
+
+def _local_set(key, value, timeout):
+    with _local_lock:
+        _local[key] = (time.monotonic() + timeout, value)
+
+
+# Cache backends raise their own connection errors, so any failure falls back to this process.
+
+def _get_many(keys):
+    try:
+        return cache.get_many(keys)
+    except Exception:
+        logger.warning('Throttle cache unavailable, using local counters', exc_info=True)
+        return _local_get_many(keys)
+
+
+def _incr(key, timeout):
+    try:
+        try:
+            return cache.incr(key)
+        except ValueError:
+            if cache.add(key, 1, timeout):
+                return 1
+            return cache.incr(key)
+    except Exception:
+        return _local_incr(key, timeout)
+
+
+def _set(key, value, timeout):
+    try:
+        cache.set(key, value, timeout)
+    except Exception:
+        _local_set(key, value, timeout)
+
+
+def rejection_counts():
+    """Rejected attempts per scope since the counters were last evicted."""
+    keys = {scope: REJECTED_KEY.format(scope) for scope in settings.AUTH_THROTTLE_RATES}
+    found = _get_many(list(keys.values()))
+    return {scope: found.get(key, 0) for scope, key in keys.items()}
+
+
+def _hit(scope, ident):
+    """
+    Count an attempt by ``ident`` against ``scope`` and return the seconds
+    it must wait, or None if the attempt is allowed.
+    """
+    limit, window = settings.AUTH_THROTTLE_RATES[scope]
+    now = time.time()
+    current = int(now // window)
+    lock_key, previous_key = LOCK_KEY.format(scope, ident), COUNT_KEY.format(scope, ident, current - 1)
+    found = _get_many([lock_key, previous_key])
+    if lock_key in found and found[lock_key] > now:
+        return found[lock_key] - now
+
+    count = _incr(COUNT_KEY.format(scope, ident, current), 2 * window)
+    overlap = 1 - (now % window) / window
+    if count + found.get(previous_key, 0) * overlap <= limit:
+        return None
+
+    strikes = _incr(STRIKES_KEY.format(scope, ident), settings.AUTH_LOCKOUT_RESET.total_seconds())
+    lockout = min(settings.AUTH_LOCKOUT_BASE.total_seconds() * 2 ** (strikes - 1),
+                  settings.AUTH_LOCKOUT_MAX.total_seconds())
+    _set(lock_key, now + lockout, lockout)
+    logger.warning('Locked out %s %s for %ds after %d attempts', scope, ident, lockout, count)
+    return lockout
+
+
+class AttemptThrottle(BaseThrottle):
+    """
+    Applies the AUTH_THROTTLE_RATES limits named in ``scopes``: ``<name>_ip``
+    is keyed on the client address and ``<name>_username`` on the submitted
+    username.
+    """
+    scopes = ()
+
+    def allow_request(self, request, view):
+        self.wait_time = None
+        for scope in self.scopes:
+            ident = self.get_username(request) if scope.endswith('_username') else self.get_ident(request)
+            if not ident:
+                continue
+            wait = _hit(scope, ident)
+            if wait is not None:
+                _incr(REJECTED_KEY.format(scope), settings.AUTH_LOCKOUT_RESET.total_seconds())
+                self.wait_time = wait
+                return False
+        return True
+
+    def get_username(self, request):
+        # A JSON body may be a list or a scalar; it has no username then.
+        username = request.data.get('username') if isinstance(request.data, dict) else None
+        if not isinstance(username, str) or not username:
+            return None
+        # Hashed, so any submitted string makes a valid, bounded cache key.
+        return hashlib.blake2b(username.lower().encode(), digest_size=16).hexdigest()
+
+    def wait(self):
+        return self.wait_time
+
+
+class LoginThrottle(AttemptThrottle):
+    scopes = ('login_ip', 'login_username')
+
+
+class RegisterThrottle(AttemptThrottle):
+    scopes = ('register_ip',)
@@ -0,0 +1,42 @@
+import time
+
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .principals import CLAIMS_READ_AT_CLAIM
+
+# Claims copied from each refresh token into the access tokens it issues.
+ROLE_CLAIM = 'role'
+MEMBERSHIP_EXPIRY_CLAIM = 'membership_expiry'
+
+
+def read_claims(user_id):
+    """
+    The active user's (role, membership_expiry) and the time just before
+    they were read, or None. principals.token_rejection compares that time
+    with the user's last claims change.
+    """
+    read_at = time.time()
+    claims = (get_user_model().objects.filter(pk=user_id, is_active=True)
+              .values_list('role', 'profile__membership_expiry').first())
+    return None if claims is None else (*claims, read_at)
+
+
+def set_claims(token, role, membership_expiry, read_at):
+    token[ROLE_CLAIM] = role
+    token[MEMBERSHIP_EXPIRY_CLAIM] = membership_expiry.isoformat() if membership_expiry else None
+    token[CLAIMS_READ_AT_CLAIM] = read_at
+
+
+class LibraryRefreshToken(RefreshToken):
+    """Refresh token carrying the user's role and membership expiry, so permission checks need no lookup."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        # Read afresh rather than from ``user``, so a change since it was loaded cannot slip through.
+        claims = read_claims(user.pk)
+        if claims is None:
+            claims = (user.role, None, 0)
+        set_claims(token, *claims)
+        return token
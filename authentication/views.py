@@ -1,16 +1,21 @@
-from django.contrib.auth import get_user_model
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-User = get_user_model()
+from utils.permissions import IsAdminOrLibrarian
+from .principals import revoke_token
+from .serializers import LibraryTokenObtainPairSerializer, LibraryTokenRefreshSerializer
+from .services import HashingBusy, RegistrationError, register_user
+from .throttling import LoginThrottle, RegisterThrottle, rejection_counts
+from .tokens import LibraryRefreshToken
 
 
 class RegisterView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [RegisterThrottle]
 
     def post(self, request):
         username = request.data.get("username")
@@ -22,14 +27,15 @@ class RegisterView(APIView):
         if not username or not password or not phone_number:
             return Response({'error': 'Username and password and phone number are required'}
                             , status=status.HTTP_400_BAD_REQUEST)
-        if User.objects.filter(username=username).exists() or User.objects.filter(contact_number=phone_number).exists():
-            return Response({"error": 'Username or phone number already exist '}, status=status.HTTP_400_BAD_REQUEST)
-
-        user = User.objects.create_user(username=username, password=password, email=email, role=role,
-                                        contact_number=phone_number)
-        user.save()
+        try:
+            user = register_user(username, password, phone_number, email=email, role=role)
+        except RegistrationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except HashingBusy:
+            return Response({"error": 'Too many signups right now, please retry shortly'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
 
-        refresh = RefreshToken.for_user(user)
+        refresh = LibraryRefreshToken.for_user(user)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -37,7 +43,12 @@ class RegisterView(APIView):
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
-    pass
+    serializer_class = LibraryTokenObtainPairSerializer
+    throttle_classes = [LoginThrottle]
+
+
+class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = LibraryTokenRefreshSerializer
 
 
 class LogoutView(APIView):
@@ -48,6 +59,9 @@ class LogoutView(APIView):
             refresh_token = request.data['refresh']
             token = RefreshToken(refresh_token)
             token.blacklist()
+            # The access token used for this request stops working too, not just at its expiry.
+            if request.auth is not None:
+                revoke_token(request.auth)
 
             return Response(status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
@@ -59,3 +73,10 @@ class ProtectedView(APIView):
 
     def get(self, request):
         return Response({'message': 'this is a protected API'}, status=200)
+
+
+class ThrottleStatsView(APIView):
+    permission_classes = [IsAdminOrLibrarian]
+
+    def get(self, request):
+        return Response({'rejected': rejection_counts()})
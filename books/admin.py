@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Book, Category, BookCopy, Author, Publisher
+from .search import search_books
 
 
 @admin.register(Author)
@@ -30,6 +31,12 @@ class BookAdmin(admin.ModelAdmin):
     ordering = ['title']
     fields = ('title', 'author', 'category', 'publisher', 'publication_date', 'isbn', 'description', 'total_copies', 'available_copies', 'number_of_pages', 'cover_image', 'is_borrowed')
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        matches, _ = search_books(search_term)
+        return queryset.filter(pk__in=matches.values('pk')), False
+
 
 @admin.register(BookCopy)
 class BookCopyAdmin(admin.ModelAdmin):
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books'
+
+    def ready(self):
+        from .signals import connect_catalog_cache_signals, connect_search_signals
+        connect_catalog_cache_signals()
+        connect_search_signals()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'catalog:version:{}'
+
+
+def _version_keys(namespaces):
+    return [VERSION_KEY.format(namespace) for namespace in namespaces]
+
+
+def get_versions(namespaces):
+    """
+    Current version of each namespace. A missing version (never set or evicted)
+    starts from the clock rather than from 1, so entries cached under an older
+    incarnation of the counter can never be served again. None if the cache
+    is unavailable; callers then serve uncached data.
+    """
+    keys = _version_keys(namespaces)
+    try:
+        versions = cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                cache.add(key, time.time_ns(), None)
+                versions[key] = cache.get(key)
+    except Exception:
+        # Cache backends raise their own connection errors; reads must not depend on the cache.
+        logger.warning('Catalog cache unavailable', exc_info=True)
+        return None
+    return [versions[key] for key in keys]
+
+
+def bump_versions(namespaces):
+    """
+    Bump each namespace's version. A failure is only logged, so writes never
+    depend on the cache; entries cached before it then live until
+    CATALOG_CACHE_TIMEOUT.
+    """
+    try:
+        for key in _version_keys(namespaces):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), None)
+    except Exception:
+        logger.warning('Could not bump catalog cache versions %s', namespaces, exc_info=True)
+
+
+def invalidate(namespaces):
+    """
+    Bump now and again once the transaction commits. The second bump drops
+    anything a concurrent reader cached from the pre-commit rows in between.
+    """
+    bump_versions(namespaces)
+    transaction.on_commit(lambda: bump_versions(namespaces))
+
+
+class CatalogCacheMixin:
+    """
+    Read-through cache for list and retrieve actions.
+
+    Responses are keyed on the view, the object id, the normalized query
+    string, the caller's role and the current version of every namespace in
+    ``cache_namespaces``. Writes never delete keys; the signal handlers in
+    books.signals bump the namespace versions, and stale entries simply age
+    out. Cached responses carry an ETag, and a matching If-None-Match gets a
+    304 without touching the database.
+    """
+    cache_namespaces = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request,
+                                    lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs))
+
+    def get_cache_role(self, request):
+        if not request.user or not request.user.is_authenticated:
+            return 'anonymous'
+        return request.user.role
+
+    def get_cache_key(self, request):
+        """The response's cache key, or None when the cache is unavailable."""
+        versions = get_versions(self.cache_namespaces)
+        if versions is None:
+            return None
+        query = urlencode(sorted((key, value) for key, values in request.query_params.lists() for value in values))
+        parts = [
+            request.build_absolute_uri(request.path),
+            query,
+            self.get_cache_role(request),
+            *map(str, versions),
+        ]
+        digest = hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+        return f'catalog:response:{self.__class__.__name__}:{digest}'
+
+    def cached_response(self, request, get_response):
+        key = self.get_cache_key(request)
+        if key is None:
+            return get_response()
+        try:
+            entry = cache.get(key)
+        except Exception:
+            logger.warning('Catalog cache unavailable', exc_info=True)
+            return get_response()
+        response = None
+        if entry is None:
+            response = get_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            payload = json.dumps(response.data, cls=JSONEncoder, sort_keys=True).encode()
+            entry = {'data': response.data, 'etag': quote_etag(hashlib.md5(payload, usedforsecurity=False).hexdigest())}
+            try:
+                cache.set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+            except Exception:
+                logger.warning('Could not cache a catalog response', exc_info=True)
+
+        if entry['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif response is None:
+            response = Response(entry['data'])
+        response['ETag'] = entry['etag']
+        patch_vary_headers(response, ['Authorization'])
+        return response
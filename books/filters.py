@@ -0,0 +1,13 @@
+import django_filters
+
+from .models import Book
+
+
+class BookFilter(django_filters.FilterSet):
+    min_rating = django_filters.NumberFilter(field_name='rating_average', lookup_expr='gte')
+    max_rating = django_filters.NumberFilter(field_name='rating_average', lookup_expr='lte')
+    min_rating_count = django_filters.NumberFilter(field_name='rating_count', lookup_expr='gte')
+
+    class Meta:
+        model = Book
+        fields = ['author__first_name', 'author__last_name', 'category__title', 'publisher__name', 'is_borrowed']
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from books.models import Book
+from rating_and_review.models import Review
+
+
+def actual_rating_aggregates():
+    reviews = Review.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    return {
+        'rating_count': Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0,
+                                 output_field=models.IntegerField()),
+        'rating_sum': Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0,
+                               output_field=models.IntegerField()),
+    }
+
+
+class Command(BaseCommand):
+    help = "Recompute Book.rating_count/rating_sum from reviews and report books whose stored values drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only report drift; exit with an error if any book is out of sync.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of books rebuilt per transaction.")
+
+    def handle(self, *args, **options):
+        aggregates = actual_rating_aggregates()
+        drifted = (
+            Book.objects.annotate(actual_count=aggregates['rating_count'], actual_sum=aggregates['rating_sum'])
+            .exclude(rating_count=F('actual_count'), rating_sum=F('actual_sum'))
+        )
+
+        drifted_ids = list(drifted.values_list('pk', flat=True))
+        if not drifted_ids:
+            self.stdout.write(self.style.SUCCESS("Rating aggregates are in sync."))
+            return
+
+        self.stdout.write(f"{len(drifted_ids)} book(s) with drifted rating aggregates: "
+                          f"{', '.join(map(str, drifted_ids[:20]))}{' ...' if len(drifted_ids) > 20 else ''}")
+        if options['check']:
+            raise CommandError("Rating aggregates drifted.")
+
+        updated = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(drifted_ids), batch_size):
+            with transaction.atomic():
+                updated += Book.objects.filter(pk__in=drifted_ids[start:start + batch_size]).update(**aggregates)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} book(s)."))
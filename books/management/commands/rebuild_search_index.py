@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from books.models import Book
+from books.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Recompute Book.search_vector for every book (PostgreSQL only)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of primary keys covered by each UPDATE.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write("The in-memory search index is rebuilt on demand; nothing to do.")
+            return
+
+        batch_size = options['batch_size']
+        last_id = Book.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+        for start in range(0, last_id + 1, batch_size):
+            with transaction.atomic():
+                update_search_vectors(Book.objects.filter(pk__gte=start, pk__lt=start + batch_size))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search vectors for books up to id {last_id}."))
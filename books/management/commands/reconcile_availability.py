@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+
+from books.cache import invalidate
+from books.models import Book, BookCopy, copy_availability
+from borrowing.models import Borrowing, Reservation
+
+
+class Command(BaseCommand):
+    help = ("Repair availability drift: copy flags that disagree with open loans and ready holds, "
+            "and book counters that disagree with their copies.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only report drift; exit with an error if anything is out of sync.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of books repaired per transaction.")
+
+    def handle(self, *args, **options):
+        in_use = (Exists(Borrowing.objects.filter(copy=OuterRef('pk'), return_date__isnull=True))
+                  | Exists(Reservation.objects.filter(copy=OuterRef('pk'), status='ready')))
+        stuck = BookCopy.objects.filter(~in_use, is_borrowed=True)
+        lent = BookCopy.objects.filter(in_use, is_borrowed=False)
+
+        actual = copy_availability()
+        drifted = (
+            Book.objects.filter(Exists(BookCopy.objects.filter(book=OuterRef('pk'))))
+            .annotate(actual_available=actual['available_copies'], actual_total=actual['total_copies'])
+            .filter(~Q(available_copies=F('actual_available')) | ~Q(total_copies=F('actual_total'))
+                    | Q(is_borrowed=True, actual_available__gt=0) | Q(is_borrowed=False, actual_available=0))
+        )
+
+        stuck_count, lent_count = stuck.count(), lent.count()
+        drifted_ids = list(drifted.values_list('pk', flat=True))
+        if not (stuck_count or lent_count or drifted_ids):
+            self.stdout.write(self.style.SUCCESS("Availability is in sync."))
+            return
+
+        self.stdout.write(f"{stuck_count} copy(ies) marked borrowed without a loan or hold, "
+                          f"{lent_count} on loan but marked free, {len(drifted_ids)} book(s) with drifted counters.")
+        if options['check']:
+            raise CommandError("Availability drifted.")
+
+        with transaction.atomic():
+            touched = set(stuck.values_list('book_id', flat=True)) | set(lent.values_list('book_id', flat=True))
+            stuck.update(is_borrowed=False)
+            lent.update(is_borrowed=True)
+        book_ids = sorted(touched.union(drifted_ids))
+        updated = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(book_ids), batch_size):
+            with transaction.atomic():
+                updated += Book.refresh_availability(book_ids[start:start + batch_size])
+        invalidate(('book', 'bookcopy'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Repaired {stuck_count + lent_count} copy flag(s) and the availability of {updated} book(s)."))
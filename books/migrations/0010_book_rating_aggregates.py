@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:46
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_alter_book_author'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Rating Count'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Rating Sum'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_average',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(rating_count=0, then=None), default=django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('rating_sum', models.FloatField()), '/', models.F('rating_count')), output_field=models.FloatField()), output_field=models.FloatField(null=True), verbose_name='Average Rating'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['rating_average'], name='books_rating_average_idx'),
+        ),
+    ]
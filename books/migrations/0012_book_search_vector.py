@@ -0,0 +1,52 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:56
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS books_search_vector_idx ON "Books" USING gin (search_vector)',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS books_title_trgm_idx ON "Books" USING gin (title gin_trgm_ops)',
+    """
+    UPDATE "Books" SET search_vector =
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce((
+            SELECT first_name || ' ' || last_name FROM books_author WHERE books_author.id = "Books".author_id
+        ), '')), 'B')
+        || setweight(to_tsvector('simple', coalesce((
+            SELECT name FROM books_publisher WHERE books_publisher.id = "Books".publisher_id
+        ), '')), 'C')
+        || setweight(to_tsvector('simple', coalesce(description, '')), 'D')
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX CONCURRENTLY IF EXISTS books_title_trgm_idx',
+    'DROP INDEX CONCURRENTLY IF EXISTS books_search_vector_idx',
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('books', '0011_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgres(POSTGRES_FORWARD), run_on_postgres(POSTGRES_BACKWARD)),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookcopy',
+            index=models.Index(condition=models.Q(('is_borrowed', False)), fields=['book', 'copy_number'], name='bookcopy_available_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
-from django.db.models import Avg
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Case, Count, Exists, F, FloatField, IntegerField, OuterRef, Subquery, When
+from django.db.models.functions import Cast, Coalesce
 from django.utils.translation import gettext_lazy as _
 
 
@@ -19,18 +21,66 @@ class Book(models.Model):
     total_copies = models.IntegerField(default=1, verbose_name=_("Total Copies"))
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
     is_borrowed = models.BooleanField(default=False)
+    rating_count = models.IntegerField(default=0, editable=False, verbose_name=_("Rating Count"))
+    rating_sum = models.IntegerField(default=0, editable=False, verbose_name=_("Rating Sum"))
+    rating_average = models.GeneratedField(
+        expression=Case(
+            When(rating_count=0, then=None),
+            default=Cast('rating_sum', FloatField()) / F('rating_count'),
+            output_field=FloatField(),
+        ),
+        output_field=FloatField(null=True),
+        db_persist=True,
+        verbose_name=_("Average Rating"),
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.title
 
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews.exists():
-            return reviews.aggregate(Avg('rating'))['rating__avg']
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return "-"
 
+    @classmethod
+    def refresh_availability(cls, book_ids):
+        """ recompute the stored availability of books that have copies from their BookCopy rows, in one UPDATE """
+        copies = BookCopy.objects.filter(book=OuterRef('pk'))
+        return cls.objects.filter(pk__in=book_ids).filter(Exists(copies)).update(**copy_availability())
+
+    @classmethod
+    def availability_by_isbn(cls, isbns):
+        """
+        ``{isbn: {'available': n, 'total': m}}`` for the known ISBNs, counted from
+        BookCopy in one query; a title without copies counts as one copy.
+        """
+        counts = copy_availability()
+        rows = cls.objects.filter(isbn__in=isbns).annotate(
+            has_copies=Exists(BookCopy.objects.filter(book=OuterRef('pk'))),
+            free=counts['available_copies'],
+            copies=counts['total_copies'],
+        ).values_list('isbn', 'has_copies', 'free', 'copies', 'is_borrowed')
+        return {
+            isbn: {'available': free, 'total': copies} if has_copies else
+            {'available': int(not is_borrowed), 'total': 1}
+            for isbn, has_copies, free, copies, is_borrowed in rows
+        }
+
+    @classmethod
+    def adjust_rating(cls, book_id, count_delta, sum_delta):
+        """ apply a review change to the stored aggregates in a single UPDATE """
+        cls.objects.filter(pk=book_id).update(
+            rating_count=F('rating_count') + count_delta,
+            rating_sum=F('rating_sum') + sum_delta,
+        )
+
     class Meta:
         db_table = "Books"
+        indexes = [
+            models.Index(fields=['rating_average', 'id'], name='books_rating_average_idx'),
+            models.Index(fields=['title', 'id'], name='books_title_idx'),
+        ]
         verbose_name = _("Book")
         verbose_name_plural = _("Books")
 
@@ -78,6 +128,12 @@ class Publisher(models.Model):
 
 
 class BookCopy(models.Model):
+    """
+    A physical copy; the authoritative availability record. Book.available_copies,
+    total_copies and is_borrowed are derived from the copies of titles that have any.
+    Circulation updates both in the same transaction (borrowing.services); the
+    reconcile_availability command repairs drift.
+    """
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     copy_number = models.IntegerField()
     is_borrowed = models.BooleanField(default=False)
@@ -85,6 +141,35 @@ class BookCopy(models.Model):
     def __str__(self):
         return f"{self.book.title} - Copy {self.copy_number}"
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super(BookCopy, self).save(*args, **kwargs)
+            Book.refresh_availability([self.book_id])
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super(BookCopy, self).delete(*args, **kwargs)
+            Book.refresh_availability([self.book_id])
+        return result
+
     class Meta:
         verbose_name = _("BookCopy")
         verbose_name_plural = _("BookCopies")
+        indexes = [
+            # Free copies only: what borrowing claims and availability lookups scan.
+            models.Index(fields=['book', 'copy_number'], condition=models.Q(is_borrowed=False),
+                         name='bookcopy_available_idx'),
+        ]
+
+
+def copy_availability():
+    """ Book availability columns computed from BookCopy, as expressions for update() or annotate() """
+    copies = BookCopy.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    free = copies.filter(is_borrowed=False)
+    return {
+        'available_copies': Coalesce(Subquery(free.annotate(count=Count('id')).values('count')), 0,
+                                     output_field=IntegerField()),
+        'total_copies': Coalesce(Subquery(copies.annotate(count=Count('id')).values('count')), 0,
+                                 output_field=IntegerField()),
+        'is_borrowed': ~Exists(free),
+    }
@@ -0,0 +1,234 @@
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Concat
+
+from .cache import get_versions
+from .models import Author, Book, Publisher
+
+SEARCH_CONFIG = 'simple'
+ISBN_RE = re.compile(r'^(\d{9}[\dX]|\d{13})$')
+
+# Relative weight of a hit in each indexed field, mirroring the A-D weights of the tsvector.
+FIELD_WEIGHTS = {'title': 1.0, 'author': 0.4, 'publisher': 0.2, 'description': 0.1}
+# Index version used while the catalog cache is unavailable.
+UNVERSIONED = ['unversioned']
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return re.findall(r'\w+', text)
+
+
+def normalize_isbn(text):
+    isbn = re.sub(r'[\s-]', '', text or '').upper()
+    return isbn if ISBN_RE.match(isbn) else None
+
+
+def search_vector():
+    """Weighted tsvector over a book's title, author, publisher and description."""
+    author_name = Subquery(
+        Author.objects.filter(pk=OuterRef('author_id'))
+        .values(name=Concat('first_name', Value(' '), 'last_name'))[:1]
+    )
+    publisher_name = Subquery(Publisher.objects.filter(pk=OuterRef('publisher_id')).values('name')[:1])
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(author_name, weight='B', config=SEARCH_CONFIG)
+        + SearchVector(publisher_name, weight='C', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """Refresh the stored tsvector of every book in ``queryset`` with one UPDATE (PostgreSQL only)."""
+    if connection.vendor == 'postgresql':
+        queryset.update(search_vector=search_vector())
+
+
+class PostgresSearchBackend:
+    """
+    Prefix-matching tsquery over the GIN-indexed ``Book.search_vector``,
+    ranked with ts_rank. When no lexeme matches, the query is retried as a
+    trigram similarity search on the title to absorb typos.
+    """
+
+    def search(self, text, limit):
+        terms = tokenize(text)
+        if not terms:
+            return Book.objects.none(), []
+
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+        matches = Book.objects.filter(search_vector=query)
+        ranked = list(
+            matches.annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', 'pk').values_list('pk', flat=True)[:limit]
+        )
+        if ranked:
+            return matches, ranked
+
+        matches = Book.objects.filter(title__trigram_similar=text)
+        ranked = list(
+            matches.annotate(similarity=TrigramSimilarity('title', text))
+            .order_by('-similarity', 'pk').values_list('pk', flat=True)[:limit]
+        )
+        return matches, ranked
+
+
+class InMemorySearchBackend:
+    """
+    Inverted index held in process, for databases without full-text search.
+
+    The index is rebuilt lazily whenever the catalog cache version of books,
+    authors or publishers moves. Every query term must match (exactly, as a
+    prefix, or within a small edit distance) for a book to be returned.
+    """
+    namespaces = ('book', 'author', 'publisher')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._postings = {}
+        self._tokens = []
+        self._document_count = 0
+
+    def _build(self):
+        postings = defaultdict(dict)
+        rows = Book.objects.values_list(
+            'pk', 'title', 'author__first_name', 'author__last_name', 'publisher__name', 'description'
+        )
+        document_count = 0
+        for pk, title, first_name, last_name, publisher, description in rows.iterator(chunk_size=2000):
+            document_count += 1
+            fields = {
+                'title': title,
+                'author': f'{first_name or ""} {last_name or ""}',
+                'publisher': publisher,
+                'description': description,
+            }
+            for field, value in fields.items():
+                for token in tokenize(value):
+                    weight = FIELD_WEIGHTS[field]
+                    if postings[token].get(pk, 0) < weight:
+                        postings[token][pk] = weight
+        self._postings = dict(postings)
+        self._tokens = sorted(postings)
+        self._document_count = document_count
+
+    def _ensure_fresh(self):
+        # Without the cache, the index already built keeps being served (or one is built) rather than one per query.
+        version = get_versions(self.namespaces) or self._version or UNVERSIONED
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build()
+                    self._version = version
+
+    def _expand(self, term):
+        """Index tokens matching ``term``, with a penalty for prefix and fuzzy matches."""
+        if term in self._postings:
+            expansions = {term: 1.0}
+        else:
+            expansions = {}
+        start = bisect_left(self._tokens, term)
+        for token in self._tokens[start:]:
+            if not token.startswith(term):
+                break
+            expansions.setdefault(token, 0.8)
+        if expansions or len(term) < 4:
+            return expansions
+
+        max_distance = 1 if len(term) < 8 else 2
+        for token in self._tokens:
+            if abs(len(token) - len(term)) <= max_distance and _edit_distance(term, token, max_distance) <= max_distance:
+                expansions[token] = 0.5
+        return expansions
+
+    def search(self, text, limit):
+        self._ensure_fresh()
+        terms = tokenize(text)
+        if not terms:
+            return Book.objects.none(), []
+
+        scores = None
+        for term in terms:
+            term_scores = defaultdict(float)
+            for token, penalty in self._expand(term).items():
+                books = self._postings[token]
+                idf = math.log(1 + self._document_count / len(books))
+                for pk, weight in books.items():
+                    term_scores[pk] = max(term_scores[pk], weight * penalty * idf)
+            if scores is None:
+                scores = dict(term_scores)
+            else:
+                scores = {pk: score + term_scores[pk] for pk, score in scores.items() if pk in term_scores}
+            if not scores:
+                return Book.objects.none(), []
+
+        matching = sorted(scores, key=lambda pk: (-scores[pk], pk))
+        return Book.objects.filter(pk__in=matching), matching[:limit]
+
+
+def _edit_distance(a, b, cutoff):
+    """Optimal string alignment distance (a transposition counts as one edit), capped at ``cutoff + 1``."""
+    before_previous, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                distance = min(distance, before_previous[j - 2] + 1)
+            current.append(distance)
+        if min(current) > cutoff:
+            return cutoff + 1
+        before_previous, previous = previous, current
+    return previous[-1]
+
+
+_in_memory_backend = InMemorySearchBackend()
+
+
+def get_search_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return _in_memory_backend
+
+
+def search_books(text, limit=20):
+    """
+    Return ``(matches, ranked_ids)``: a queryset of every matching book, for
+    facets, and the primary keys of the best ``limit`` matches in rank order.
+    An ISBN (with or without hyphens) is looked up directly on its unique index.
+    """
+    isbn = normalize_isbn(text)
+    if isbn:
+        matches = Book.objects.filter(isbn=isbn)
+        return matches, list(matches.values_list('pk', flat=True))
+    return get_search_backend().search(text, limit)
+
+
+def _facet(matches, field, label):
+    rows = (
+        matches.values_list(f'{field}_id', f'{field}__{label}')
+        .annotate(count=Count('pk')).order_by('-count', f'{field}_id')
+    )
+    return [{'id': pk, label: value, 'count': count} for pk, value, count in rows]
+
+
+def facet_counts(matches):
+    matches = matches.order_by()
+    return {
+        'category': _facet(matches, 'category', 'title'),
+        'publisher': _facet(matches, 'publisher', 'name'),
+        'availability': matches.aggregate(
+            available=Count('pk', filter=Q(is_borrowed=False)),
+            borrowed=Count('pk', filter=Q(is_borrowed=True)),
+        ),
+    }
@@ -37,7 +37,9 @@ class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ['id', 'title', 'author', 'category', 'publisher', 'publication_date', 'isbn', 'description',
-                  'total_copies', 'available_copies', 'cover_image', 'number_of_pages', "is_borrowed", 'average_rating']
+                  'total_copies', 'available_copies', 'cover_image', 'number_of_pages', "is_borrowed", 'average_rating',
+                  'rating_count']
+        read_only_fields = ['rating_count']
 
 
 class BookCopySerializer(serializers.ModelSerializer):
@@ -45,4 +47,8 @@ class BookCopySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = BookCopy
-        fields = ['id', 'book', 'copy_number', 'is_borrowed']
\ No newline at end of file
+        fields = ['id', 'book', 'copy_number', 'is_borrowed']
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    isbns = serializers.ListField(child=serializers.CharField(max_length=13), allow_empty=False, max_length=1000)
@@ -0,0 +1,51 @@
+from django.db.models.signals import post_delete, post_save
+
+from .cache import invalidate
+from .search import update_search_vectors
+
+# Cache namespaces bumped when rows of each model change. Reviews only touch
+# the stored rating aggregates, which are written with UPDATE and so never
+# fire Book signals themselves. Saving a copy rewrites its book's availability
+# counters the same way. The borrowing namespace versions the report
+# outputs reused by reports.engines.
+CATALOG_NAMESPACES = {
+    'books.Book': ['book'],
+    'books.Author': ['author'],
+    'books.Category': ['category'],
+    'books.Publisher': ['publisher'],
+    'books.BookCopy': ['bookcopy', 'book'],
+    'rating_and_review.Review': ['book'],
+    'borrowing.Borrowing': ['borrowing'],
+}
+
+
+def _connect(sender, namespaces):
+    def handler(**kwargs):
+        invalidate(namespaces)
+
+    post_save.connect(handler, sender=sender, weak=False, dispatch_uid=f'catalog_cache_{sender}_save')
+    post_delete.connect(handler, sender=sender, weak=False, dispatch_uid=f'catalog_cache_{sender}_delete')
+
+
+def connect_catalog_cache_signals():
+    for sender, namespaces in CATALOG_NAMESPACES.items():
+        _connect(sender, namespaces)
+
+
+def _update_book_search_vector(sender, instance, **kwargs):
+    update_search_vectors(sender.objects.filter(pk=instance.pk))
+
+
+def _update_author_search_vectors(sender, instance, **kwargs):
+    update_search_vectors(instance.books.all())
+
+
+def _update_publisher_search_vectors(sender, instance, **kwargs):
+    update_search_vectors(instance.books.all())
+
+
+def connect_search_signals():
+    post_save.connect(_update_book_search_vector, sender='books.Book', dispatch_uid='search_vector_book')
+    post_save.connect(_update_author_search_vectors, sender='books.Author', dispatch_uid='search_vector_author')
+    post_save.connect(_update_publisher_search_vectors, sender='books.Publisher',
+                      dispatch_uid='search_vector_publisher')
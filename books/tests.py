@@ -131,8 +131,8 @@ class BookViewTests(APITestCase):
         url = reverse('books-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['title'], 'Test Book')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['title'], 'Test Book')
 
     def test_create_book(self):
         """ book creation test """
@@ -176,8 +176,8 @@ class BookViewTests(APITestCase):
         url = reverse('books-list') + f'?author__first_name=John&author__last_name=Doe'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['author']['first_name'], 'John')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['author']['first_name'], 'John')
 
 
 class AuthorViewTests(APITestCase):
@@ -190,7 +190,7 @@ class AuthorViewTests(APITestCase):
         url = reverse('author-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_create_author(self):
         """ author creation test """
@@ -210,8 +210,8 @@ class AuthorViewTests(APITestCase):
         url = reverse('author-list') + '?first_name=John&last_name=Doe'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['first_name'], 'John')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['first_name'], 'John')
 
 
 class CategoryViewTests(APITestCase):
@@ -224,7 +224,7 @@ class CategoryViewTests(APITestCase):
         url = reverse('category-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_create_category(self):
         """ category creation test """
@@ -249,7 +249,7 @@ class PublisherViewTests(APITestCase):
         url = reverse('publisher-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_create_publisher(self):
         """ publisher creation test """
@@ -284,7 +284,7 @@ class PublisherViewTests(APITestCase):
             url = reverse('bookcopy-list')
             response = self.client.get(url)
             self.assertEqual(response.status_code, status.HTTP_200_OK)
-            self.assertEqual(len(response.data), 1)
+            self.assertEqual(len(response.data['results']), 1)
 
         def test_create_book_copy(self):
             """ book copy creation test """
@@ -298,3 +298,275 @@ class PublisherViewTests(APITestCase):
             response = self.client.post(url, data, format='json')
             self.assertEqual(response.status_code, status.HTTP_201_CREATED)
             self.assertEqual(BookCopy.objects.count(), 2)
+
+
+class BookListQueryCountTests(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title="Fiction", description="Fictional books")
+        self.publisher = Publisher.objects.create(name="Best Publisher", address="123 Main St")
+        self.reviewer = User.objects.create_user(username='reviewer', password='reviewerpass')
+
+    def _create_books(self, count):
+        from rating_and_review.models import Review
+
+        start = Book.objects.count()
+        for i in range(start, start + count):
+            author = Author.objects.create(first_name=f"Author{i}", last_name="Doe")
+            book = Book.objects.create(
+                title=f"Book {i}",
+                author=author,
+                category=self.category,
+                publisher=self.publisher,
+                isbn=f"97800000{i:05d}",
+            )
+            BookCopy.objects.create(book=book, copy_number=1)
+            Review.objects.create(user=self.reviewer, book=book, rating=4)
+
+    def test_list_books_query_count_is_constant(self):
+        """ book list runs the same number of queries for 1 and 20 books """
+        url = reverse('books-list')
+        self._create_books(1)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['average_rating'], 4)
+
+        self._create_books(19)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_list_book_copies_query_count_is_constant(self):
+        """ book copy list joins the nested book """
+        self._create_books(5)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('bookcopy-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_average_rating_without_reviews_is_dash(self):
+        """ average rating keeps the "-" placeholder """
+        Book.objects.create(title="Unrated", isbn="9780000099999")
+        response = self.client.get(reverse('books-list'))
+        self.assertEqual(response.data['results'][0]['average_rating'], "-")
+
+
+class RatingAggregateTests(APITestCase):
+    def setUp(self):
+        from rating_and_review.models import Review
+
+        self.users = [User.objects.create_user(username=f'reader{i}', password='readerpass') for i in range(3)]
+        self.high = Book.objects.create(title="High", isbn="9780000000001")
+        self.low = Book.objects.create(title="Low", isbn="9780000000002")
+        for user, rating in zip(self.users, [5, 4, 5]):
+            Review.objects.create(user=user, book=self.high, rating=rating)
+        Review.objects.create(user=self.users[0], book=self.low, rating=2)
+
+    def test_aggregates_maintained_on_review_create(self):
+        """ stored rating count and sum follow new reviews """
+        self.high.refresh_from_db()
+        self.assertEqual(self.high.rating_count, 3)
+        self.assertEqual(self.high.rating_sum, 14)
+        self.assertAlmostEqual(self.high.rating_average, 14 / 3)
+
+    def test_order_and_filter_books_by_rating(self):
+        """ order and filter books by stored average rating """
+        response = self.client.get(reverse('books-list') + '?ordering=-rating_average')
+        self.assertEqual([book['title'] for book in response.data['results']], ['High', 'Low'])
+
+        response = self.client.get(reverse('books-list') + '?min_rating=3')
+        self.assertEqual([book['title'] for book in response.data['results']], ['High'])
+
+    def test_rebuild_rating_aggregates_command(self):
+        """ rebuild command detects and repairs drift """
+        from io import StringIO
+        from django.core.management import call_command, CommandError
+
+        Book.objects.filter(pk=self.low.pk).update(rating_count=7, rating_sum=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rating_aggregates', '--check', stdout=StringIO())
+
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.low.refresh_from_db()
+        self.assertEqual((self.low.rating_count, self.low.rating_sum), (1, 2))
+        call_command('rebuild_rating_aggregates', '--check', stdout=StringIO())
+
+    def test_rating_ordering_pages_through_unrated_books(self):
+        """ keyset pagination over a nullable ordering keeps unrated books """
+        Book.objects.create(title="Unrated 1", isbn="9780000000003")
+        Book.objects.create(title="Unrated 2", isbn="9780000000004")
+        url = reverse('books-list') + '?ordering=-rating_average&page_size=1'
+        titles = []
+        while url:
+            response = self.client.get(url)
+            titles.extend(book['title'] for book in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(titles, ['High', 'Low', 'Unrated 2', 'Unrated 1'])
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name="John", last_name="Doe")
+        self.book = Book.objects.create(title="Cached Book", author=self.author, isbn="9780000000101")
+        self.url = reverse('books-list')
+
+    def test_repeated_list_is_served_from_cache(self):
+        """ second identical request runs no queries """
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_query_params_are_normalized(self):
+        """ parameter order does not split the cache """
+        self.client.get(self.url + '?is_borrowed=false&page_size=5')
+        with self.assertNumQueries(0):
+            self.client.get(self.url + '?page_size=5&is_borrowed=false')
+
+    def test_model_change_invalidates_cache(self):
+        """ saving a related author invalidates the book list """
+        self.client.get(self.url)
+        self.author.first_name = "Jane"
+        self.author.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['author']['first_name'], "Jane")
+
+    def test_review_invalidates_rating(self):
+        """ a new review invalidates the cached rating """
+        from rating_and_review.models import Review
+
+        self.client.get(reverse('books-detail', args=[self.book.id]))
+        user = User.objects.create_user(username='reader', password='readerpass')
+        Review.objects.create(user=user, book=self.book, rating=5)
+        response = self.client.get(reverse('books-detail', args=[self.book.id]))
+        self.assertEqual(response.data['average_rating'], 5)
+
+    def test_if_none_match_returns_not_modified(self):
+        """ matching ETag gets a 304 """
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Book.objects.create(title="Another Book", author=self.author, isbn="9780000000102")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cache_outage_serves_uncached(self):
+        """ writes succeed and reads are served uncached while the cache is down """
+        from unittest import mock
+        from books import cache as catalog_cache
+
+        down = mock.Mock(side_effect=ConnectionError('cache down'))
+        with mock.patch.multiple(catalog_cache.cache, get=down, get_many=down, set=down, add=down, incr=down):
+            Book.objects.create(title="Written While Down", author=self.author, isbn="9780000000103")
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class BookSearchTests(APITestCase):
+    def setUp(self):
+        self.fiction = Category.objects.create(title="Fiction")
+        self.science = Category.objects.create(title="Science")
+        self.publisher = Publisher.objects.create(name="Orbit Press")
+        tolkien = Author.objects.create(first_name="John", last_name="Tolkien")
+        sagan = Author.objects.create(first_name="Carl", last_name="Sagan")
+        self.hobbit = Book.objects.create(title="The Hobbit", author=tolkien, category=self.fiction,
+                                          publisher=self.publisher, isbn="9780261102217")
+        self.cosmos = Book.objects.create(title="Cosmos", author=sagan, category=self.science,
+                                          description="A journey through space, hobbit free", isbn="9780345539434",
+                                          is_borrowed=True)
+        self.url = reverse('books-search')
+
+    def search(self, q):
+        response = self.client.get(self.url, {'q': q})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_title_match_ranks_above_description_match(self):
+        """ title hits outrank description hits """
+        response = self.search('hobbit')
+        self.assertEqual([book['title'] for book in response.data['results']], ['The Hobbit', 'Cosmos'])
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_prefix_and_author_search(self):
+        """ prefixes and author names match """
+        self.assertEqual([b['title'] for b in self.search('tolk').data['results']], ['The Hobbit'])
+        self.assertEqual([b['title'] for b in self.search('carl sagan').data['results']], ['Cosmos'])
+
+    def test_typo_tolerance(self):
+        """ a misspelled term still finds the book """
+        self.assertEqual([b['title'] for b in self.search('cosmso').data['results']], ['Cosmos'])
+
+    def test_isbn_lookup(self):
+        """ hyphenated isbn is looked up directly """
+        self.assertEqual([b['title'] for b in self.search('978-0-345-53943-4').data['results']], ['Cosmos'])
+
+    def test_facets(self):
+        """ facets count every match by category, publisher and availability """
+        facets = self.search('hobbit').data['facets']
+        self.assertEqual(sorted((c['title'], c['count']) for c in facets['category']),
+                         [('Fiction', 1), ('Science', 1)])
+        self.assertEqual(facets['availability'], {'available': 1, 'borrowed': 1})
+
+    def test_index_follows_catalog_changes(self):
+        """ new books are searchable immediately """
+        self.search('dune')
+        Book.objects.create(title="Dune", isbn="9780441172719")
+        self.assertEqual([b['title'] for b in self.search('dune').data['results']], ['Dune'])
+
+    def test_missing_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AvailabilityTests(APITestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title="Copies", isbn="9780000001001", available_copies=9, total_copies=9)
+        self.copies = [BookCopy.objects.create(book=self.book, copy_number=n) for n in (1, 2, 3)]
+        self.legacy = Book.objects.create(title="No copies", isbn="9780000001002", is_borrowed=True)
+
+    def test_copies_maintain_book_counters(self):
+        """ saving or deleting a copy recomputes its book's availability """
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.total_copies, self.book.is_borrowed), (3, 3, False))
+        for copy in self.copies[:2]:
+            copy.is_borrowed = True
+            copy.save()
+        self.copies[2].delete()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.total_copies, self.book.is_borrowed), (0, 2, True))
+
+    def test_availability_by_isbn_in_one_query(self):
+        """ many isbns are answered with a single query """
+        BookCopy.objects.filter(pk=self.copies[0].pk).update(is_borrowed=True)
+        isbns = [self.book.isbn, self.legacy.isbn, '9789999999999']
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('books-availability'), {'isbns': isbns}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            self.book.isbn: {'available': 2, 'total': 3},
+            self.legacy.isbn: {'available': 0, 'total': 1},
+            '9789999999999': None,
+        })
+
+    def test_availability_rejects_oversized_requests(self):
+        response = self.client.post(reverse('books-availability'), {'isbns': ['1'] * 1001}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reconcile_command(self):
+        """ reconcile repairs copy flags and book counters in bulk """
+        from io import StringIO
+        from django.core.management import call_command, CommandError
+
+        BookCopy.objects.filter(pk=self.copies[0].pk).update(is_borrowed=True)
+        Book.objects.filter(pk=self.book.pk).update(available_copies=7, is_borrowed=True)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_availability', '--check', stdout=StringIO())
+
+        call_command('reconcile_availability', stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (3, False))
+        self.assertFalse(BookCopy.objects.filter(is_borrowed=True).exists())
+        call_command('reconcile_availability', '--check', stdout=StringIO())
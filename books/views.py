@@ -1,44 +1,101 @@
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
 
+from .cache import CatalogCacheMixin
+from .filters import BookFilter
 from .models import Book, Author, Category, BookCopy, Publisher
-from .serializers import BookSerializer, AuthorSerializer, CategorySerializer, PublisherSerializer, BookCopySerializer
+from .search import facet_counts, search_books
+from .serializers import (AvailabilityQuerySerializer, BookSerializer, AuthorSerializer, CategorySerializer,
+                          PublisherSerializer, BookCopySerializer)
 from rest_framework import viewsets, generics
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAuthenticatedOrReadOnly
+from utils.pagination import KeysetPagination
 from utils.permissions import IsAdminOrLibrarianOrReadOnly
+from utils.query_planning import QueryPlanMixin, plan_queryset
 
 
 # Create your views here.
-class BookView(viewsets.ModelViewSet):
+class BookView(CatalogCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminOrLibrarianOrReadOnly]
-    queryset = Book.objects.all()
+    cache_namespaces = ('book', 'author', 'category', 'publisher')
+    queryset = Book.objects.defer('search_vector')
     serializer_class = BookSerializer
-    filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['author__first_name', 'author__last_name', 'category__title', 'publisher__name', 'is_borrowed']
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = BookFilter
+    ordering_fields = ['title', 'publication_date', 'rating_average', 'rating_count']
+    ordering = ['title', 'id']
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked full-text search over title, author, publisher and description,
+        with facet counts over every match. ``?q=`` may also be an ISBN.
+        """
+        return self.cached_response(request, lambda: self.search_response(request))
+
+    def search_response(self, request):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'This query parameter is required.'})
+
+        limit = KeysetPagination().get_page_size(request, self)
+        matches, ranked_ids = search_books(text, limit)
+        books = plan_queryset(self.queryset.filter(pk__in=ranked_ids), self.get_serializer_class()).in_bulk()
+        serializer = self.get_serializer([books[pk] for pk in ranked_ids if pk in books], many=True)
+        return Response({
+            'count': matches.count(),
+            'results': serializer.data,
+            'facets': facet_counts(matches),
+        })
+
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            serializer_class=AvailabilityQuerySerializer)
+    def availability(self, request):
+        """
+        Free and total copies for up to 1,000 ISBNs in one query. Unknown
+        ISBNs map to null. A read, so POST only carries the long ISBN list.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        isbns = serializer.validated_data['isbns']
+        found = Book.availability_by_isbn(isbns)
+        return Response({isbn: found.get(isbn) for isbn in isbns})
 
 
-class AuthorView(viewsets.ModelViewSet):
+class AuthorView(CatalogCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminOrLibrarianOrReadOnly]
+    cache_namespaces = ('author', 'book')
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
+    ordering = ['id']
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['first_name', 'last_name', 'date_of_birth']
 
 
-class CategoryView(viewsets.ModelViewSet):
+class CategoryView(CatalogCacheMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminOrLibrarianOrReadOnly]
+    cache_namespaces = ('category',)
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    ordering = ['id']
 
 
-class PublisherView(viewsets.ModelViewSet):
+class PublisherView(CatalogCacheMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminOrLibrarianOrReadOnly]
+    cache_namespaces = ('publisher',)
     queryset = Publisher.objects.all()
     serializer_class = PublisherSerializer
+    ordering = ['id']
 
 
-class BookCopyView(viewsets.ModelViewSet):
+class BookCopyView(CatalogCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminOrLibrarianOrReadOnly]
+    cache_namespaces = ('bookcopy', 'book', 'author', 'category', 'publisher')
     queryset = BookCopy.objects.all()
     serializer_class = BookCopySerializer
+    ordering = ['id']
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['is_borrowed', 'book']
@@ -30,8 +30,8 @@ class BorrowingAdmin(admin.ModelAdmin):
 
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
-    list_display = ['user', 'book', 'reserved_at', 'is_active']
-    list_filter = ['is_active', 'reserved_at']
+    list_display = ['user', 'book', 'reserved_at', 'status', 'expires_at']
+    list_filter = ['status', 'reserved_at']
     search_fields = ['user__username', 'book__title']
 
     def get_queryset(self, request):
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_book_keyset_indexes'),
+        ('borrowing', '0002_reservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(fields=['borrow_date', 'id'], name='borrowing_borrow_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(fields=['user', 'borrow_date', 'id'], name='borrowing_user_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user', 'reserved_at', 'id'], name='reservation_user_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_book_search_vector'),
+        ('borrowing', '0003_borrowing_borrowing_borrow_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowing',
+            name='copy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='borrowings', to='books.bookcopy'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_book_search_vector'),
+        ('borrowing', '0004_borrowing_copy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowing',
+            name='last_reminder_tier',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, help_text='Days-before-due of the most urgent return reminder sent for this loan.', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(fields=['status', 'due_date'], name='borrowing_status_due_idx'),
+        ),
+    ]
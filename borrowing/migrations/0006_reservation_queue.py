@@ -0,0 +1,59 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_statuses(apps, schema_editor):
+    Reservation = apps.get_model('borrowing', 'Reservation')
+    Reservation.objects.filter(is_active=False).update(status='cancelled')
+    # Keep only the oldest active hold per patron and book, as the new constraint requires.
+    seen = set()
+    duplicates = []
+    for pk, user_id, book_id in (Reservation.objects.filter(is_active=True)
+                                 .order_by('reserved_at', 'id').values_list('pk', 'user_id', 'book_id')):
+        if (user_id, book_id) in seen:
+            duplicates.append(pk)
+        seen.add((user_id, book_id))
+    Reservation.objects.filter(pk__in=duplicates).update(is_active=False, status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_book_search_vector'),
+        ('borrowing', '0005_borrowing_reminder_tier'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='copy',
+            field=models.ForeignKey(blank=True, help_text='Copy set aside for a ready hold.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='books.bookcopy'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='status',
+            field=models.CharField(choices=[('waiting', 'Waiting'), ('ready', 'Ready for pickup'), ('fulfilled', 'Fulfilled'), ('expired', 'Expired'), ('cancelled', 'Cancelled')], default='waiting', max_length=10),
+        ),
+        migrations.RunPython(set_statuses, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('status', 'waiting')), fields=['book', 'reserved_at', 'id'], name='reservation_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('status', 'ready')), fields=['expires_at'], name='reservation_ready_expiry_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('user', 'book'), name='reservation_one_active_per_user'),
+        ),
+    ]
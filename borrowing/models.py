@@ -1,6 +1,6 @@
 from django.db import models
 from django.conf import settings
-from books.models import Book
+from books.models import Book, BookCopy
 from django.contrib.auth.models import User
 
 from datetime import timedelta
@@ -15,11 +15,22 @@ class Borrowing(models.Model):
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='borrowings')
     book = models.ForeignKey(Book(is_borrowed=False), on_delete=models.CASCADE, related_name='borrowings')
+    copy = models.ForeignKey(BookCopy, on_delete=models.SET_NULL, null=True, blank=True, related_name='borrowings')
     borrow_date = models.DateTimeField(auto_now_add=True)
     due_date = models.DateTimeField()
     return_date = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='borrowed')
     late_fee = models.DecimalField(max_digits=6, decimal_places=2, default=0.0)
+    last_reminder_tier = models.PositiveSmallIntegerField(
+        null=True, blank=True, editable=False,
+        help_text="Days-before-due of the most urgent return reminder sent for this loan.")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'due_date'], name='borrowing_status_due_idx'),
+            models.Index(fields=['borrow_date', 'id'], name='borrowing_borrow_date_idx'),
+            models.Index(fields=['user', 'borrow_date', 'id'], name='borrowing_user_history_idx'),
+        ]
 
     def calculate_late_fee(self):
 
@@ -28,12 +39,15 @@ class Borrowing(models.Model):
             self.late_fee = delay_days * 1.0
         return self.late_fee
 
-    def save(self, *args, **kwargs):
+    def update_status(self):
         if self.return_date and self.return_date > self.due_date:
             self.status = 'overdue'
             self.calculate_late_fee()
         elif self.return_date:
             self.status = 'returned'
+
+    def save(self, *args, **kwargs):
+        self.update_status()
         super(Borrowing, self).save(*args, **kwargs)
 
     def __str__(self):
@@ -41,10 +55,40 @@ class Borrowing(models.Model):
 
 
 class Reservation(models.Model):
+    """
+    A hold on a title. Waiting holds form a FIFO queue per book, served by
+    borrowing.services when a copy comes back. A served hold is 'ready': its
+    copy is kept aside for the patron until ``expires_at``.
+    """
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('ready', 'Ready for pickup'),
+        ('fulfilled', 'Fulfilled'),
+        ('expired', 'Expired'),
+        ('cancelled', 'Cancelled'),
+    ]
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='reservations', on_delete=models.CASCADE)
     book = models.ForeignKey(Book, related_name='reservations', on_delete=models.CASCADE)
     reserved_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting')
+    copy = models.ForeignKey(BookCopy, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                             help_text="Copy set aside for a ready hold.")
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'reserved_at', 'id'], name='reservation_user_idx'),
+            models.Index(fields=['book', 'reserved_at', 'id'], condition=models.Q(status='waiting'),
+                         name='reservation_queue_idx'),
+            models.Index(fields=['expires_at'], condition=models.Q(status='ready'),
+                         name='reservation_ready_expiry_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], condition=models.Q(is_active=True),
+                                    name='reservation_one_active_per_user'),
+        ]
 
     def __str__(self):
         return f'Reservation: {self.book.title} by {self.user.username}'
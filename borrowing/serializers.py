@@ -3,28 +3,52 @@ from .models import Borrowing, Reservation
 from django.utils import timezone
 from datetime import timedelta
 
+BULK_MAX_ITEMS = 500
+
 
 class BorrowingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Borrowing
-        fields = ['id', 'user', 'book', 'borrow_date', 'due_date', 'return_date', 'status', 'late_fee']
-        read_only_fields = ['borrow_date', 'late_fee', 'status']
+        fields = ['id', 'user', 'book', 'copy', 'borrow_date', 'due_date', 'return_date', 'status', 'late_fee']
+        read_only_fields = ['copy', 'borrow_date', 'late_fee', 'status']
 
     def validate(self, data):
+        # Only a cheap early rejection; borrowing.services makes the authoritative claim.
         book = data.get('book')
-        if book.is_borrowed:
+        # The loan is for the patron in the payload, who may be collecting a ready hold.
+        if self.instance is None and book.is_borrowed and not (
+                Reservation.objects.filter(user=data.get('user'), book=book, status='ready').exists()):
             raise serializers.ValidationError("This book is already borrowed and cannot be borrowed again.")
 
-        if data['due_date'] < timezone.now():
+        if 'due_date' in data and data['due_date'] < timezone.now():
             raise serializers.ValidationError("Due date must be in the future.")
 
         return data
 
 
+class BulkBorrowItemSerializer(serializers.Serializer):
+    # Plain ids: existence and availability are checked by borrowing.services for the whole batch at once.
+    user = serializers.IntegerField(min_value=1)
+    book = serializers.IntegerField(min_value=1)
+    copy = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    due_date = serializers.DateTimeField()
+
+
+class BulkBorrowSerializer(serializers.Serializer):
+    items = BulkBorrowItemSerializer(many=True, allow_empty=False, max_length=BULK_MAX_ITEMS)
+
+
+class BulkReturnSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                max_length=BULK_MAX_ITEMS)
+    return_date = serializers.DateTimeField(required=False)
+
+
 class ReservationSerializer(serializers.ModelSerializer):
     book_title = serializers.ReadOnlyField(source='book.title')
     book = serializers.HiddenField(default=None)
 
     class Meta:
         model = Reservation
-        fields = ['id', 'book_title', 'reserved_at', 'is_active','book']
\ No newline at end of file
+        fields = ['id', 'book_title', 'reserved_at', 'is_active', 'status', 'expires_at', 'book']
+        read_only_fields = ['is_active', 'status', 'expires_at']
\ No newline at end of file
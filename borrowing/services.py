@@ -0,0 +1,384 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Value, When
+from django.utils import timezone
+
+from books.cache import invalidate
+from books.models import Book, BookCopy
+from notifications.models import Notification
+from notifications.services import create_notifications
+from .models import Borrowing, Reservation
+
+
+class BorrowingError(Exception):
+    pass
+
+
+def _claim_copy(book_id):
+    """
+    Atomically mark one free copy of the book as borrowed and return it.
+
+    Candidates are read with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+    borrowers of the same title lock different copies instead of queueing on
+    one row. The conditional UPDATE is what actually guarantees a copy is
+    issued once, including on databases without row locks.
+    """
+    candidates = (
+        BookCopy.objects.select_for_update(skip_locked=True)
+        .filter(book_id=book_id, is_borrowed=False)
+        .order_by('copy_number', 'pk')
+        .values_list('pk', flat=True)
+    )
+    while True:
+        # Lock a single candidate at a time so the other free copies stay claimable by others.
+        copy_id = candidates.first()
+        if copy_id is None:
+            return None
+        if BookCopy.objects.filter(pk=copy_id, is_borrowed=False).update(is_borrowed=True):
+            return copy_id
+
+
+def borrow_book(user, book, due_date):
+    """
+    Issue a copy of ``book`` to ``user`` in one transaction.
+
+    A patron with a ready hold on the book gets the copy set aside for them.
+    Otherwise, books that have BookCopy rows get a specific copy. Their
+    available_copies and is_borrowed are then adjusted with F-expressions.
+    The Book row is updated last, so its lock is held only until commit.
+    Books without copies fall back to claiming the book-level is_borrowed
+    flag with a conditional UPDATE.
+    """
+    with transaction.atomic():
+        hold = Reservation.objects.select_for_update().filter(user=user, book=book, status='ready').first()
+        copy_id = _claim_copy(book.pk) if hold is None else None
+        if hold is not None:
+            # The held copy never went back on the shelf, so the counters already account for it.
+            borrowing = Borrowing.objects.create(user=user, book=book, copy_id=hold.copy_id, due_date=due_date)
+            Reservation.objects.filter(pk=hold.pk).update(status='fulfilled', is_active=False)
+        elif copy_id is not None:
+            borrowing = Borrowing.objects.create(user=user, book=book, copy_id=copy_id, due_date=due_date)
+            Book.objects.filter(pk=book.pk).update(
+                available_copies=F('available_copies') - 1,
+                is_borrowed=Case(When(available_copies__lte=1, then=True), default=False),
+            )
+        elif BookCopy.objects.filter(book_id=book.pk).exists():
+            raise BorrowingError("No copy of this book is available.")
+        elif Book.objects.filter(pk=book.pk, is_borrowed=False).update(is_borrowed=True):
+            borrowing = Borrowing.objects.create(user=user, book=book, due_date=due_date)
+        else:
+            raise BorrowingError("This book is already borrowed and cannot be borrowed again.")
+
+    invalidate(('book', 'bookcopy', 'borrowing'))
+    book.refresh_from_db(fields=['available_copies', 'is_borrowed'])
+    return borrowing
+
+
+def return_borrowing(borrowing, returned_at=None):
+    """
+    Close a loan and release its copy, to the next hold on the book if there
+    is one. Returning an already returned loan is a no-op. ``borrowing`` is
+    updated in place.
+    """
+    with transaction.atomic():
+        locked = Borrowing.objects.select_for_update().get(pk=borrowing.pk)
+        if locked.return_date is not None:
+            return borrowing
+
+        borrowing.return_date = returned_at or timezone.now()
+        borrowing.save()
+
+        if borrowing.copy_id is None:
+            release_copies([(borrowing.book_id, None)])
+        elif BookCopy.objects.select_for_update().filter(pk=borrowing.copy_id, is_borrowed=True).exists():
+            release_copies([(borrowing.book_id, borrowing.copy_id)])
+
+    invalidate(('book', 'bookcopy', 'borrowing'))
+    return borrowing
+
+
+def _per_book(counts):
+    """CASE expression mapping each book id in ``counts`` to its count, for one UPDATE over many books."""
+    return Case(*[When(pk=pk, then=Value(n)) for pk, n in counts.items()], output_field=IntegerField())
+
+
+def bulk_borrow(items):
+    """
+    Issue many loans at once.
+
+    ``items`` are dicts with ``user``, ``book`` and ``due_date``, plus an
+    optional ``copy``; related objects are given by id. Returns one entry per
+    item, in order: the new Borrowing, or a BorrowingError explaining why that
+    item was not issued. Failing items do not affect the others. As in
+    borrow_book, a patron with a ready hold on the book gets the held copy.
+
+    The whole batch costs a fixed number of queries. These cover validation,
+    locking the free copies, claiming them, one bulk INSERT and one counter
+    UPDATE for all the books involved. The number does not grow with the
+    size of the batch.
+    """
+    results = [None] * len(items)
+    now = timezone.now()
+    user_ids = set(get_user_model().objects.filter(pk__in={item['user'] for item in items})
+                   .values_list('pk', flat=True))
+    book_ids = set(Book.objects.filter(pk__in={item['book'] for item in items}).values_list('pk', flat=True))
+
+    pending = []
+    for index, item in enumerate(items):
+        if item['user'] not in user_ids:
+            results[index] = BorrowingError("User does not exist.")
+        elif item['book'] not in book_ids:
+            results[index] = BorrowingError("Book does not exist.")
+        elif item['due_date'] < now:
+            results[index] = BorrowingError("Due date must be in the future.")
+        else:
+            pending.append(index)
+    if not pending:
+        return results
+
+    with transaction.atomic():
+        requested_books = {items[index]['book'] for index in pending}
+        # Same lock order as borrow_book: ready holds, then copies, then book rows.
+        ready_holds = {
+            (user_id, book_id): (pk, copy_id) for pk, user_id, book_id, copy_id in
+            Reservation.objects.select_for_update()
+            .filter(status='ready', book_id__in=requested_books,
+                    user_id__in={items[index]['user'] for index in pending})
+            .order_by('pk').values_list('pk', 'user_id', 'book_id', 'copy_id')
+        }
+        free_copies = defaultdict(list)
+        for copy_id, book_id in (
+            BookCopy.objects.select_for_update(skip_locked=True)
+            .filter(book_id__in=requested_books, is_borrowed=False)
+            .order_by('book_id', 'copy_number', 'pk').values_list('pk', 'book_id')
+        ):
+            free_copies[book_id].append(copy_id)
+        books_with_copies = set(BookCopy.objects.filter(book_id__in=requested_books)
+                                .values_list('book_id', flat=True).distinct())
+        free_books = set(
+            Book.objects.select_for_update()
+            .filter(pk__in=requested_books - books_with_copies, is_borrowed=False)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+        claimed, held = {}, {}
+        # Items asking for a specific copy go first so the others cannot take it from them.
+        for index in sorted(pending, key=lambda index: items[index].get('copy') is None):
+            item = items[index]
+            book_id, copy_id = item['book'], item.get('copy')
+            hold = ready_holds.get((item['user'], book_id))
+            if hold is not None and copy_id in (None, hold[1]):
+                # The held copy never went back on the shelf, so the counters already account for it.
+                held[index] = ready_holds.pop((item['user'], book_id))
+            elif book_id not in books_with_copies:
+                if copy_id is not None or book_id not in free_books:
+                    results[index] = BorrowingError("This book is already borrowed and cannot be borrowed again.")
+                else:
+                    free_books.discard(book_id)
+                    claimed[index] = None
+            elif copy_id is not None:
+                if copy_id in free_copies[book_id]:
+                    free_copies[book_id].remove(copy_id)
+                    claimed[index] = copy_id
+                else:
+                    results[index] = BorrowingError("This copy is not available.")
+            elif free_copies[book_id]:
+                claimed[index] = free_copies[book_id].pop(0)
+            else:
+                results[index] = BorrowingError("No copy of this book is available.")
+        if not claimed and not held:
+            return results
+
+        copy_ids = [copy_id for copy_id in claimed.values() if copy_id is not None]
+        if BookCopy.objects.filter(pk__in=copy_ids, is_borrowed=False).update(is_borrowed=True) != len(copy_ids):
+            raise BorrowingError("Copies were borrowed concurrently; retry the batch.")
+        legacy_books = [items[index]['book'] for index, copy_id in claimed.items() if copy_id is None]
+        if legacy_books:
+            Book.objects.filter(pk__in=legacy_books).update(is_borrowed=True)
+
+        if held:
+            Reservation.objects.filter(pk__in=[pk for pk, copy_id in held.values()]).update(
+                status='fulfilled', is_active=False)
+
+        issued = {**claimed, **{index: copy_id for index, (pk, copy_id) in held.items()}}
+        borrowings = Borrowing.objects.bulk_create([
+            Borrowing(user_id=items[index]['user'], book_id=items[index]['book'], copy_id=copy_id,
+                      due_date=items[index]['due_date'])
+            for index, copy_id in sorted(issued.items())
+        ])
+        for index, borrowing in zip(sorted(issued), borrowings):
+            results[index] = borrowing
+
+        taken = Counter(items[index]['book'] for index, copy_id in claimed.items() if copy_id is not None)
+        if taken:
+            delta = _per_book(taken)
+            Book.objects.filter(pk__in=taken).update(
+                available_copies=F('available_copies') - delta,
+                is_borrowed=Case(When(available_copies__lte=delta, then=True), default=False),
+            )
+
+    invalidate(('book', 'bookcopy', 'borrowing'))
+    return results
+
+
+def bulk_return(ids, returned_at=None):
+    """
+    Close many loans at once. Returns one entry per id, in order: the updated
+    Borrowing, or a BorrowingError for unknown or already returned loans.
+    Like bulk_borrow, the query count does not depend on the number of ids,
+    except for one query per returned title that has patrons waiting.
+    """
+    returned_at = returned_at or timezone.now()
+    results = []
+    with transaction.atomic():
+        borrowings = Borrowing.objects.select_for_update().in_bulk(set(ids))
+        returned = []
+        for pk in ids:
+            borrowing = borrowings.get(pk)
+            if borrowing is None:
+                results.append(BorrowingError("Borrowing does not exist."))
+            elif borrowing.return_date is not None:
+                results.append(BorrowingError("This book has already been returned."))
+            else:
+                borrowing.return_date = returned_at
+                borrowing.update_status()
+                returned.append(borrowing)
+                results.append(borrowing)
+        if not returned:
+            return results
+
+        Borrowing.objects.bulk_update(returned, ['return_date', 'status', 'late_fee'])
+
+        released = [
+            (book_id, copy_id) for copy_id, book_id in
+            BookCopy.objects.select_for_update()
+            .filter(pk__in=[borrowing.copy_id for borrowing in returned if borrowing.copy_id], is_borrowed=True)
+            .values_list('pk', 'book_id')
+        ]
+        released += [(book_id, None) for book_id in {borrowing.book_id for borrowing in returned
+                                                     if borrowing.copy_id is None}]
+        release_copies(released)
+
+    invalidate(('book', 'bookcopy', 'borrowing'))
+    return results
+
+
+def place_hold(user, book):
+    """Add ``user`` to the end of the book's hold queue. Only books with no copy on the shelf can be reserved."""
+    if not book.is_borrowed:
+        raise BorrowingError("This book has not been borrowed and cannot be reserved.")
+    try:
+        with transaction.atomic():
+            return Reservation.objects.create(user=user, book=book)
+    except IntegrityError:
+        raise BorrowingError("You already have an active reservation for this book.")
+
+
+def _next_holds(wanted):
+    """
+    Lock the first ``wanted[book_id]`` waiting holds of each book, oldest first.
+
+    SKIP LOCKED makes concurrent returns of the same title take successive
+    holds instead of queueing on the head of the line.
+    """
+    queued = set(Reservation.objects.filter(book_id__in=wanted, status='waiting')
+                 .values_list('book_id', flat=True).distinct())
+    holds = {}
+    for book_id in sorted(queued):
+        holds[book_id] = list(
+            Reservation.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(book_id=book_id, status='waiting')
+            .select_related('book').order_by('reserved_at', 'id')[:wanted[book_id]]
+        )
+    return holds
+
+
+def release_copies(releases):
+    """
+    Hand released copies to the front of their books' hold queues and put the
+    rest back on the shelf. ``releases`` are (book_id, copy_id) pairs for
+    copies still marked borrowed, with a None copy_id for books without
+    BookCopy rows. Must run inside a transaction. Patrons whose hold becomes
+    ready are notified. Returns those holds.
+    """
+    if not releases:
+        return []
+    now = timezone.now()
+    holds = _next_holds(Counter(book_id for book_id, copy_id in releases))
+
+    ready, shelved = [], []
+    for book_id, copy_id in releases:
+        if holds.get(book_id):
+            hold = holds[book_id].pop(0)
+            hold.status = 'ready'
+            hold.copy_id = copy_id
+            hold.expires_at = now + settings.RESERVATION_HOLD_PERIOD
+            ready.append(hold)
+        else:
+            shelved.append((book_id, copy_id))
+
+    if ready:
+        Reservation.objects.bulk_update(ready, ['status', 'copy', 'expires_at'])
+        create_notifications([
+            Notification(user_id=hold.user_id, book_id=hold.book_id, message=(
+                f'Your reservation for "{hold.book.title}" is ready. '
+                f'Please pick it up by {timezone.localtime(hold.expires_at):%Y-%m-%d %H:%M}.'))
+            for hold in ready
+        ])
+
+    copy_ids = [copy_id for book_id, copy_id in shelved if copy_id is not None]
+    if copy_ids:
+        BookCopy.objects.filter(pk__in=copy_ids).update(is_borrowed=False)
+        delta = _per_book(Counter(book_id for book_id, copy_id in shelved if copy_id is not None))
+        Book.objects.filter(pk__in={book_id for book_id, copy_id in shelved if copy_id is not None}).update(
+            available_copies=F('available_copies') + delta,
+            is_borrowed=False,
+        )
+    legacy_books = {book_id for book_id, copy_id in shelved if copy_id is None}
+    if legacy_books:
+        # A loan from before its book had copies names no copy; books that have copies since are recounted.
+        Book.objects.filter(pk__in=legacy_books).exclude(Exists(BookCopy.objects.filter(book=OuterRef('pk')))).update(
+            is_borrowed=False)
+        Book.refresh_availability(legacy_books)
+    return ready
+
+
+def cancel_hold(reservation):
+    """Withdraw an active hold; a copy already set aside for it passes to the next patron in line."""
+    with transaction.atomic():
+        hold = Reservation.objects.select_for_update().get(pk=reservation.pk)
+        if hold.status not in ('waiting', 'ready'):
+            raise BorrowingError("This reservation is no longer active.")
+        Reservation.objects.filter(pk=hold.pk).update(status='cancelled', is_active=False)
+        if hold.status == 'ready':
+            release_copies([(hold.book_id, hold.copy_id)])
+    invalidate(('book', 'bookcopy'))
+    reservation.refresh_from_db()
+    return reservation
+
+
+def expire_holds(batch_size=500):
+    """
+    Expire ready holds that were not picked up in time, passing their copies
+    down the queue, in batches of ``batch_size``. Returns the number expired.
+    """
+    expired = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Reservation.objects.select_for_update(skip_locked=True)
+                .filter(status='ready', expires_at__lte=timezone.now())
+                .order_by('expires_at', 'id').values_list('pk', 'book_id', 'copy_id')[:batch_size]
+            )
+            if not batch:
+                break
+            Reservation.objects.filter(pk__in=[pk for pk, book_id, copy_id in batch]).update(
+                status='expired', is_active=False)
+            release_copies([(book_id, copy_id) for pk, book_id, copy_id in batch])
+        expired += len(batch)
+    if expired:
+        invalidate(('book', 'bookcopy'))
+    return expired
@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from borrowing.services import expire_holds
+
+
+@shared_task
+def expire_reservation_holds(batch_size=500):
+    return expire_holds(batch_size=batch_size)
@@ -1,6 +1,12 @@
+import json
+import threading
+import time
+from base64 import urlsafe_b64encode
 from datetime import timedelta
 
-from django.test import TestCase
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
@@ -9,8 +15,11 @@ from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth.models import User
-from books.models import Book
+from books.models import Book, BookCopy
 from borrowing.models import Borrowing, Reservation
+from borrowing.services import (BorrowingError, borrow_book, bulk_borrow, bulk_return, cancel_hold, expire_holds,
+                                place_hold, return_borrowing)
+from notifications.models import Notification
 
 User = get_user_model()
 
@@ -52,7 +61,7 @@ class BorrowingTests(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_borrow_book_as_member(self):
         """
@@ -157,4 +166,310 @@ user borrow history test
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class BorrowingPaginationTests(APITestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name="J.K", last_name="Rowling")
+        self.librarian_user = User.objects.create_user(username='librarian', password='libpass', role='librarian')
+        book = Book.objects.create(title="Book 1", author=author, isbn=987654321)
+        due_date = timezone.now() + timedelta(days=14)
+        self.borrowings = [Borrowing.objects.create(user=self.librarian_user, book=book, due_date=due_date)
+                           for _ in range(5)]
+        # Two loans sharing a borrow date must still be paged exactly once each.
+        Borrowing.objects.filter(pk__in=[self.borrowings[1].pk, self.borrowings[2].pk]).update(
+            borrow_date=self.borrowings[1].borrow_date)
+        self.client.force_authenticate(user=self.librarian_user)
+
+    def test_cursor_walks_every_row_once(self):
+        url = reverse('borrowing-list') + '?page_size=2'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(b.id for b in self.borrowings))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_previous_link_returns_to_first_page(self):
+        first = self.client.get(reverse('borrowing-list') + '?page_size=2')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(reverse('borrowing-list') + '?page_size=100000')
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('borrowing-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_values_of_the_wrong_type(self):
+        for position in (['x', 'abc'], [[], 1], ['2024-01-01T00:00:00+00:00', 2 ** 80]):
+            cursor = urlsafe_b64encode(json.dumps({'p': position}).encode()).decode()
+            response = self.client.get(reverse('borrowing-list') + f'?cursor={cursor}')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+
+
+class BorrowServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='readerpass')
+        self.book = Book.objects.create(title="Copies", isbn="9780000000201", available_copies=2, total_copies=2)
+        self.copies = [BookCopy.objects.create(book=self.book, copy_number=n) for n in (1, 2)]
+        self.due_date = timezone.now() + timedelta(days=14)
+
+    def test_borrow_claims_copy_and_updates_counters(self):
+        first = borrow_book(self.user, self.book, self.due_date)
+        self.assertEqual(first.copy, self.copies[0])
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (1, False))
+
+        second = borrow_book(self.user, self.book, self.due_date)
+        self.assertEqual(second.copy, self.copies[1])
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (0, True))
+
+        with self.assertRaises(BorrowingError):
+            borrow_book(self.user, self.book, self.due_date)
+
+    def test_return_releases_copy_once(self):
+        borrowing = borrow_book(self.user, self.book, self.due_date)
+        return_borrowing(borrowing)
+        return_borrowing(borrowing)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+        self.assertFalse(BookCopy.objects.get(pk=borrowing.copy_id).is_borrowed)
+        self.assertEqual(borrowing.status, 'returned')
+
+    def test_returning_a_loan_without_a_copy_recounts_the_copies(self):
+        legacy = Borrowing.objects.create(user=self.user, book=self.book, due_date=self.due_date)
+        borrow_book(self.user, self.book, self.due_date)
+        borrow_book(self.user, self.book, self.due_date)
+        return_borrowing(legacy)
+
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (0, True))
+
+
+class ConcurrentBorrowTests(TransactionTestCase):
+    borrowers = 12
+    copies = 4
+
+    def setUp(self):
+        self.users = [User.objects.create(username=f'reader{i}') for i in range(self.borrowers)]
+        self.book = Book.objects.create(title="Popular", isbn="9780000000202",
+                                        available_copies=self.copies, total_copies=self.copies)
+        for n in range(1, self.copies + 1):
+            BookCopy.objects.create(book=self.book, copy_number=n)
+
+    def test_parallel_borrowers_never_share_a_copy(self):
+        due_date = timezone.now() + timedelta(days=14)
+        barrier = threading.Barrier(self.borrowers)
+        outcomes = []
+
+        def borrow(user):
+            barrier.wait()
+            try:
+                for attempt in range(50):
+                    try:
+                        outcomes.append(borrow_book(user, Book.objects.get(pk=self.book.pk), due_date).copy_id)
+                        return
+                    except OperationalError:
+                        # SQLite reports writer contention instead of blocking; PostgreSQL never gets here.
+                        time.sleep(0.01 * attempt)
+                    except BorrowingError:
+                        outcomes.append(None)
+                        return
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=borrow, args=(user,)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        issued = [copy_id for copy_id in outcomes if copy_id is not None]
+        self.assertEqual(len(outcomes), self.borrowers)
+        self.assertEqual(len(issued), self.copies)
+        self.assertEqual(len(set(issued)), self.copies)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (0, True))
+        self.assertEqual(Borrowing.objects.filter(book=self.book).count(), self.copies)
+
+
+class BulkCirculationTests(APITestCase):
+    def setUp(self):
+        self.librarian = User.objects.create_user(username='desk', password='deskpass', role='librarian')
+        self.members = [User.objects.create_user(username=f'member{i}', password='pass') for i in range(4)]
+        self.book = Book.objects.create(title="Stack", isbn="9780000000301", available_copies=3, total_copies=3)
+        self.copies = [BookCopy.objects.create(book=self.book, copy_number=n) for n in (1, 2, 3)]
+        self.legacy_book = Book.objects.create(title="No copies", isbn="9780000000302")
+        self.due_date = (timezone.now() + timedelta(days=14)).isoformat()
+        self.client.force_authenticate(self.librarian)
+
+    def item(self, user, book, **extra):
+        return {'user': user.pk, 'book': book.pk, 'due_date': self.due_date, **extra}
+
+    def test_bulk_borrow_reports_each_item(self):
+        items = [
+            self.item(self.members[0], self.book),
+            self.item(self.members[1], self.book, copy=self.copies[2].pk),
+            self.item(self.members[2], self.book),
+            self.item(self.members[3], self.book),
+            self.item(self.members[0], self.legacy_book),
+            self.item(self.members[1], self.legacy_book),
+            {'user': 999999, 'book': self.book.pk, 'due_date': self.due_date},
+        ]
+        response = self.client.post(reverse('borrowing-bulk'), {'items': items}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (4, 3))
+        self.assertEqual([result['success'] for result in response.data['results']],
+                         [True, True, True, False, True, False, False])
+        self.assertEqual(response.data['results'][1]['borrowing']['copy'], self.copies[2].pk)
+        self.book.refresh_from_db()
+        self.legacy_book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (0, True))
+        self.assertTrue(self.legacy_book.is_borrowed)
+        self.assertFalse(BookCopy.objects.filter(book=self.book, is_borrowed=False).exists())
+
+    def test_bulk_return_releases_copies(self):
+        borrowings = [borrow_book(member, self.book, timezone.now() + timedelta(days=14))
+                      for member in self.members[:2]]
+        ids = [borrowing.pk for borrowing in borrowings]
+        response = self.client.post(reverse('borrowing-bulk-return'), {'ids': ids + [ids[0], 999999]},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (2, 2))
+        self.assertEqual(set(Borrowing.objects.filter(pk__in=ids).values_list('status', flat=True)), {'returned'})
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (3, False))
+
+    def test_query_count_does_not_grow_with_batch(self):
+        books = [Book.objects.create(title=f"Bulk {n}", isbn=f"97800000010{n:02d}",
+                                     available_copies=5, total_copies=5) for n in range(40)]
+        BookCopy.objects.bulk_create(BookCopy(book=book, copy_number=n) for book in books for n in range(5))
+        items = [self.item(self.members[n % 4], book) for book in books for n in range(5)]
+
+        # A handful of queries for 200 items; the exact number depends on the backend's bulk batch size.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('borrowing-bulk'), {'items': items}, format='json')
+        self.assertEqual(response.data['succeeded'], 200)
+        self.assertLessEqual(len(queries), 12)
+
+        ids = [result['borrowing']['id'] for result in response.data['results']]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('borrowing-bulk-return'), {'ids': ids}, format='json')
+        self.assertEqual(response.data['succeeded'], 200)
+        self.assertLessEqual(len(queries), 12)
+        self.assertFalse(BookCopy.objects.filter(is_borrowed=True).exists())
+
+    def test_members_cannot_use_bulk_endpoints(self):
+        self.client.force_authenticate(self.members[0])
+        response = self.client.post(reverse('borrowing-bulk'), {'items': [self.item(self.members[0], self.book)]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class HoldQueueTests(TestCase):
+    def setUp(self):
+        self.lender = User.objects.create_user(username='lender', password='pass')
+        self.patrons = [User.objects.create_user(username=f'patron{n}', password='pass') for n in range(3)]
+        self.book = Book.objects.create(title="Queued", isbn="9780000000301", available_copies=2, total_copies=2)
+        self.copies = [BookCopy.objects.create(book=self.book, copy_number=n) for n in (1, 2)]
+        self.due_date = timezone.now() + timedelta(days=14)
+        self.loans = [borrow_book(self.lender, self.book, self.due_date) for _ in self.copies]
+        self.holds = [place_hold(patron, self.book) for patron in self.patrons]
+
+    def test_holds_queue_per_patron(self):
+        with self.assertRaises(BorrowingError):
+            place_hold(self.patrons[0], self.book)
+        shelf_book = Book.objects.create(title="On the shelf", isbn="9780000000302", is_borrowed=False)
+        with self.assertRaises(BorrowingError):
+            place_hold(self.patrons[0], shelf_book)
+
+    def test_return_serves_the_queue_in_order(self):
+        return_borrowing(self.loans[1])
+        for hold in self.holds:
+            hold.refresh_from_db()
+        self.assertEqual([hold.status for hold in self.holds], ['ready', 'waiting', 'waiting'])
+        self.assertEqual(self.holds[0].copy, self.copies[1])
+        self.assertIsNotNone(self.holds[0].expires_at)
+        self.assertTrue(Notification.objects.filter(user=self.patrons[0], book=self.book).exists())
+
+        # The copy stays off the shelf, so only the patron holding it can borrow it.
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (0, True))
+        with self.assertRaises(BorrowingError):
+            borrow_book(self.patrons[1], self.book, self.due_date)
+        loan = borrow_book(self.patrons[0], self.book, self.due_date)
+        self.assertEqual(loan.copy, self.copies[1])
+        self.holds[0].refresh_from_db()
+        self.assertEqual((self.holds[0].status, self.holds[0].is_active), ('fulfilled', False))
+
+    def test_bulk_return_serves_several_holds(self):
+        bulk_return([loan.pk for loan in self.loans])
+        statuses = list(Reservation.objects.order_by('reserved_at', 'id').values_list('status', 'copy'))
+        self.assertEqual(statuses, [('ready', self.copies[0].pk), ('ready', self.copies[1].pk), ('waiting', None)])
+
+    def test_expired_and_cancelled_holds_pass_the_copy_on(self):
+        return_borrowing(self.loans[0])
+        Reservation.objects.filter(pk=self.holds[0].pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(expire_holds(), 1)
+        self.holds[1].refresh_from_db()
+        self.assertEqual((self.holds[1].status, self.holds[1].copy), ('ready', self.copies[0]))
+
+        cancel_hold(self.holds[1])
+        self.holds[2].refresh_from_db()
+        self.assertEqual(self.holds[2].status, 'ready')
+        cancel_hold(self.holds[2])
+
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (1, False))
+        self.assertFalse(BookCopy.objects.get(pk=self.copies[0].pk).is_borrowed)
+
+    def test_patron_collects_ready_hold_through_the_api(self):
+        librarian = User.objects.create_user(username='desk', password='pass', role='librarian')
+        client = APIClient()
+        client.force_authenticate(librarian)
+        response = client.patch(reverse('borrowing-detail', args=[self.loans[1].pk]),
+                                {'return_date': timezone.now()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.holds[0].refresh_from_db()
+        self.assertEqual(self.holds[0].status, 'ready')
+
+        payload = {'book': self.book.pk, 'due_date': self.due_date}
+        response = client.post(reverse('borrowing-list'), {**payload, 'user': self.patrons[1].pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = client.post(reverse('borrowing-list'), {**payload, 'user': self.patrons[0].pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['user'], response.data['copy']), (self.patrons[0].pk, self.copies[1].pk))
+        self.holds[0].refresh_from_db()
+        self.assertEqual(self.holds[0].status, 'fulfilled')
+
+    def test_bulk_borrow_collects_ready_holds(self):
+        return_borrowing(self.loans[0])
+        results = bulk_borrow([
+            {'user': self.patrons[1].pk, 'book': self.book.pk, 'due_date': self.due_date},
+            {'user': self.patrons[0].pk, 'book': self.book.pk, 'due_date': self.due_date},
+        ])
+        self.assertIsInstance(results[0], BorrowingError)
+        self.assertEqual(results[1].copy_id, self.copies[0].pk)
+        self.holds[0].refresh_from_db()
+        self.assertEqual((self.holds[0].status, self.holds[0].is_active), ('fulfilled', False))
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.is_borrowed), (0, True))
+
+    def test_cancel_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.patrons[2])
+        response = client.post(reverse('reservation-cancel', args=[self.holds[2].pk]))
+        self.assertEqual((response.status_code, response.data['status']), (status.HTTP_200_OK, 'cancelled'))
+        response = client.post(reverse('reservation-cancel', args=[self.holds[0].pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
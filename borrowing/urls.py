@@ -1,13 +1,16 @@
 from django.urls import path
 from .views import BorrowingListCreateView, BorrowingDetailView, AvailableBooksListView, ReserveBookView, \
-    UserReservationsListView, UserBorrowingHistoryView
+    UserReservationsListView, UserBorrowingHistoryView, BulkBorrowView, BulkReturnView, CancelReservationView
 
 urlpatterns = [
     path('borrowings/', BorrowingListCreateView.as_view(), name='borrowing-list'),
     path('borrowings/<int:pk>/', BorrowingDetailView.as_view(), name='borrowing-detail'),
+    path('borrowings/bulk/', BulkBorrowView.as_view(), name='borrowing-bulk'),
+    path('borrowings/bulk-return/', BulkReturnView.as_view(), name='borrowing-bulk-return'),
     path('borrowings/available/', AvailableBooksListView.as_view(), name='Available-book'),
     path('reserve/', ReserveBookView.as_view(), name='reserve-book'),
     path('reservations/', UserReservationsListView.as_view(), name='user-reservations'),
+    path('reservations/<int:pk>/cancel/', CancelReservationView.as_view(), name='reservation-cancel'),
     path('borrow-history/', UserBorrowingHistoryView.as_view(), name='borrow-history'),
 
 ]
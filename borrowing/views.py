@@ -2,31 +2,35 @@ from rest_framework import generics, permissions, status,serializers
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
 from rest_framework.response import Response
 
+from books.cache import CatalogCacheMixin
 from books.models import Book
 from books.serializers import BookSerializer
 from .models import Borrowing, Reservation
-from .serializers import BorrowingSerializer, ReservationSerializer
-from django.utils import timezone
-from utils.permissions import IsAdminOrLibrarianOrReadOnly, IsAdminOrLibrarianOrOwner
+from .serializers import BorrowingSerializer, BulkBorrowSerializer, BulkReturnSerializer, ReservationSerializer
+from .services import (BorrowingError, borrow_book, bulk_borrow, bulk_return, cancel_hold, place_hold,
+                       return_borrowing)
+from utils.permissions import HasActiveMembership, IsAdminOrLibrarian, IsAdminOrLibrarianOrReadOnly
+from utils.query_planning import QueryPlanMixin
 
 
 class BorrowingListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsAdminOrLibrarianOrReadOnly]
     queryset = Borrowing.objects.all()
     serializer_class = BorrowingSerializer
+    ordering = ['-borrow_date', '-id']
 
     def perform_create(self, serializer):
-        borrowing = serializer.save(user=self.request.user)
-
-        borrowing.book.is_borrowed = True
-        borrowing.book.save()
+        try:
+            serializer.instance = borrow_book(
+                user=serializer.validated_data['user'],
+                book=serializer.validated_data['book'],
+                due_date=serializer.validated_data['due_date'],
+            )
+        except BorrowingError as e:
+            raise serializers.ValidationError(str(e))
 
     def perform_update(self, serializer):
-        borrowing = self.get_object()
-        if not borrowing.return_date:
-            borrowing.return_date = timezone.now()
-            borrowing.book.is_borrowed = False
-            borrowing.book.save()
+        return_borrowing(serializer.instance, returned_at=serializer.validated_data.pop('return_date', None))
         serializer.save()
 
 
@@ -36,22 +40,60 @@ class BorrowingDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = BorrowingSerializer
 
     def perform_update(self, serializer):
-        instance = self.get_object()
-        if not instance.return_date:
-            instance.return_date = timezone.now()
-            instance.save()
+        return_borrowing(serializer.instance, returned_at=serializer.validated_data.pop('return_date', None))
         serializer.save()
 
 
-class AvailableBooksListView(generics.ListAPIView):
+class BulkCirculationView(generics.GenericAPIView):
+    """Base for the circulation desk batch endpoints, which answer with one result per submitted item."""
+    permission_classes = [IsAuthenticated, IsAdminOrLibrarian]
+
+    def process(self, data):
+        raise NotImplementedError
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            outcomes = self.process(serializer.validated_data)
+        except BorrowingError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+
+        results = []
+        for index, outcome in enumerate(outcomes):
+            if isinstance(outcome, BorrowingError):
+                results.append({'index': index, 'success': False, 'error': str(outcome)})
+            else:
+                results.append({'index': index, 'success': True, 'borrowing': BorrowingSerializer(outcome).data})
+        succeeded = sum(result['success'] for result in results)
+        return Response({'succeeded': succeeded, 'failed': len(results) - succeeded, 'results': results})
+
+
+class BulkBorrowView(BulkCirculationView):
+    serializer_class = BulkBorrowSerializer
+
+    def process(self, data):
+        return bulk_borrow(data['items'])
+
+
+class BulkReturnView(BulkCirculationView):
+    serializer_class = BulkReturnSerializer
+
+    def process(self, data):
+        return bulk_return(data['ids'], returned_at=data.get('return_date'))
+
+
+class AvailableBooksListView(CatalogCacheMixin, QueryPlanMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminOrLibrarianOrReadOnly]
+    cache_namespaces = ('book', 'author', 'category', 'publisher')
     queryset = Book.objects.filter(is_borrowed=False)
     serializer_class = BookSerializer
+    ordering = ['title', 'id']
 
 
 class ReserveBookView(generics.CreateAPIView):
     serializer_class = ReservationSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, HasActiveMembership]
 
     def perform_create(self, serializer):
         book_id = self.request.data.get('book')
@@ -60,18 +102,31 @@ class ReserveBookView(generics.CreateAPIView):
         except Book.DoesNotExist:
             raise serializers.ValidationError('Book does not exist.')
 
-        if not book.is_borrowed:
-            raise serializers.ValidationError('This book has not been borrowed and cannot be reserved.')
+        try:
+            serializer.instance = place_hold(self.request.user, book)
+        except BorrowingError as e:
+            raise serializers.ValidationError(str(e))
 
-        if Reservation.objects.filter(book=book, is_active=True).exists():
-            raise serializers.ValidationError('This book has already been reserved.')
 
-        serializer.save(user=self.request.user, book=book)
+class CancelReservationView(generics.GenericAPIView):
+    serializer_class = ReservationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Reservation.objects.filter(user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            reservation = cancel_hold(self.get_object())
+        except BorrowingError as e:
+            raise serializers.ValidationError(str(e))
+        return Response(self.get_serializer(reservation).data)
 
 
 class UserReservationsListView(generics.ListAPIView):
     serializer_class = ReservationSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ['-reserved_at', '-id']
 
     def get_queryset(self):
         return Reservation.objects.filter(user=self.request.user, is_active=True)
@@ -80,6 +135,7 @@ class UserReservationsListView(generics.ListAPIView):
 class UserBorrowingHistoryView(generics.ListAPIView):
     serializer_class = BorrowingSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ['borrow_date', 'id']
 
     def get_queryset(self):
-        return Borrowing.objects.filter(user=self.request.user).order_by('borrow_date')
+        return Borrowing.objects.filter(user=self.request.user)
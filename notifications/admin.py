@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Notification
+from .delivery import requeue
+from .models import Delivery, Notification
 
 
 @admin.register(Notification)
@@ -8,3 +9,14 @@ class NotificationAdmin(admin.ModelAdmin):
     list_filter = ('is_read', 'created_at')
     search_fields = ('user__username', 'book__title', 'message')
 
+
+@admin.register(Delivery)
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ('notification', 'channel', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('channel', 'status')
+    raw_id_fields = ('notification',)
+    actions = ['requeue_dead']
+
+    @admin.action(description='Requeue dead letters')
+    def requeue_dead(self, request, queryset):
+        self.message_user(request, f'{requeue(queryset)} deliveries requeued.')
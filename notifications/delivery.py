@@ -0,0 +1,179 @@
+"""
+Sends queued Delivery rows through their channel's transport.
+
+One dispatcher runs per channel at a time, guarded by a cache lock. It
+claims due rows in batches sized by the channel's token bucket and sends
+each batch over one transport connection. The outcome of the whole batch
+is written back with one UPDATE. Claiming pushes ``next_attempt_at``
+forward by NOTIFICATION_DELIVERY_LEASE, so rows held by a crashed worker
+come back on their own. Failed sends are retried with exponential backoff
+until NOTIFICATION_DELIVERY_MAX_ATTEMPTS, then kept as 'dead' letters.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Delivery
+from .transports import PermanentDeliveryError, get_transport
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'notifications:delivery:lock:{}'
+BUCKET_KEY = 'notifications:delivery:bucket:{}'
+
+
+class TokenBucket:
+    """
+    Allows ``rate`` sends per second on average and bursts of up to
+    ``burst``. The state is kept in the cache between runs. Only the lock
+    holder writes it, so plain get/set is enough.
+    """
+
+    def __init__(self, channel, rate, burst):
+        self.key = BUCKET_KEY.format(channel)
+        self.rate = rate
+        self.burst = burst
+        self.tokens, self.updated = cache.get(self.key) or (burst, time.time())
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, count):
+        """Take up to ``count`` tokens, waiting until at least one is available. Returns the number taken."""
+        self._refill()
+        if self.tokens < 1:
+            time.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        taken = min(count, int(self.tokens))
+        self.tokens -= taken
+        self._save()
+        return taken
+
+    def refund(self, count):
+        self.tokens = min(self.burst, self.tokens + count)
+        self._save()
+
+    def _save(self):
+        cache.set(self.key, (self.tokens, self.updated), timeout=None)
+
+
+def _claim(channel, limit):
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            Delivery.objects.filter(channel=channel, status='pending', next_attempt_at__lte=now)
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('notification__user', 'notification__book')
+            .order_by('next_attempt_at', 'id')[:limit]
+        )
+        Delivery.objects.filter(pk__in=[delivery.pk for delivery in batch]).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + settings.NOTIFICATION_DELIVERY_LEASE,
+        )
+    for delivery in batch:
+        delivery.attempts += 1
+    return batch
+
+
+def _fail(delivery, error, now, permanent=False):
+    delivery.last_error = str(error) or type(error).__name__
+    if permanent or delivery.attempts >= settings.NOTIFICATION_DELIVERY_MAX_ATTEMPTS:
+        delivery.status = 'dead'
+        logger.warning('Dead-lettered %s: %s', delivery, delivery.last_error)
+    else:
+        backoff = settings.NOTIFICATION_DELIVERY_BACKOFF * 2 ** (delivery.attempts - 1)
+        delivery.next_attempt_at = now + min(backoff, settings.NOTIFICATION_DELIVERY_MAX_BACKOFF)
+
+
+def _send_batch(transport, batch):
+    for delivery in batch:
+        notification = delivery.notification
+        address = getattr(notification.user, Delivery.ADDRESS_FIELDS[delivery.channel])
+        try:
+            if not address:
+                raise PermanentDeliveryError('Recipient has no address for this channel.')
+            transport.send(address, f'Library notification: {notification.book.title}', notification.message)
+        except PermanentDeliveryError as exc:
+            _fail(delivery, exc, timezone.now(), permanent=True)
+        except Exception as exc:
+            _fail(delivery, exc, timezone.now())
+        else:
+            delivery.status = 'sent'
+            delivery.sent_at = timezone.now()
+            delivery.last_error = ''
+
+
+def deliver_pending(channel, time_limit=None):
+    """
+    Send the channel's due deliveries until none are left or ``time_limit``
+    seconds (default NOTIFICATION_DELIVERY_TIME_LIMIT) have passed. Returns
+    the number sent, or None if another worker holds the channel.
+    """
+    config = settings.NOTIFICATION_TRANSPORTS[channel]
+    if time_limit is None:
+        time_limit = settings.NOTIFICATION_DELIVERY_TIME_LIMIT
+    lock, owner = LOCK_KEY.format(channel), uuid.uuid4().hex
+    if not cache.add(lock, owner, timeout=time_limit + settings.NOTIFICATION_DELIVERY_LEASE.total_seconds()):
+        return None
+
+    sent = 0
+    transport = None
+    deadline = time.monotonic() + time_limit
+    try:
+        bucket = TokenBucket(channel, config['RATE'], config['BURST'])
+        while time.monotonic() < deadline:
+            limit = bucket.take(config['BATCH_SIZE'])
+            batch = _claim(channel, limit)
+            bucket.refund(limit - len(batch))
+            if not batch:
+                break
+            if transport is None:
+                transport = get_transport(channel)
+                try:
+                    transport.open()
+                except Exception as exc:
+                    transport = None
+                    now = timezone.now()
+                    for delivery in batch:
+                        _fail(delivery, exc, now)
+                    Delivery.objects.bulk_update(batch, ['status', 'next_attempt_at', 'last_error'])
+                    logger.warning('Could not open the %s transport', channel, exc_info=True)
+                    break
+            _send_batch(transport, batch)
+            Delivery.objects.bulk_update(batch, ['status', 'next_attempt_at', 'last_error', 'sent_at'])
+            sent += sum(delivery.status == 'sent' for delivery in batch)
+            if len(batch) < limit:
+                break
+    finally:
+        if transport is not None:
+            transport.close()
+        # A run that outlived its lock must not release the lock of the worker that took over.
+        if cache.get(lock) == owner:
+            cache.delete(lock)
+    return sent
+
+
+def dead_letter_unconfigured():
+    """
+    Dead-letter pending deliveries on channels that are no longer in
+    NOTIFICATION_TRANSPORTS, which no dispatcher would ever send. Returns
+    how many there were.
+    """
+    dead = (Delivery.objects.filter(status='pending').exclude(channel__in=list(settings.NOTIFICATION_TRANSPORTS))
+            .update(status='dead', last_error='No transport is configured for this channel.'))
+    if dead:
+        logger.warning('Dead-lettered %d deliveries on unconfigured channels', dead)
+    return dead
+
+
+def requeue(deliveries):
+    """Give dead-lettered deliveries a fresh set of attempts, due now."""
+    return deliveries.filter(status='dead').update(status='pending', attempts=0, next_attempt_at=timezone.now())
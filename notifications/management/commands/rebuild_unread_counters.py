@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from notifications.models import Notification, UnreadCounter
+
+
+def actual_unread_count():
+    unread = Notification.objects.filter(user=OuterRef('user'), is_read=False).order_by().values('user')
+    return Coalesce(Subquery(unread.annotate(count=Count('id')).values('count')), 0,
+                    output_field=models.IntegerField())
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user unread notification counters and report users whose stored count drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only report drift; exit with an error if any counter is out of sync.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            missing = (Notification.objects.filter(is_read=False)
+                       .exclude(user__notification_counter__isnull=False)
+                       .values_list('user_id', flat=True).distinct())
+            missing = list(missing)
+            drifted = list(
+                UnreadCounter.objects.annotate(actual=actual_unread_count())
+                .exclude(unread=F('actual')).values_list('user_id', flat=True)
+            )
+            if not missing and not drifted:
+                self.stdout.write(self.style.SUCCESS("Unread counters are in sync."))
+                return
+
+            self.stdout.write(f"{len(missing) + len(drifted)} user(s) with drifted unread counters.")
+            if options['check']:
+                raise CommandError("Unread counters drifted.")
+
+            UnreadCounter.objects.bulk_create([UnreadCounter(user_id=user_id) for user_id in missing],
+                                              ignore_conflicts=True)
+            updated = UnreadCounter.objects.filter(user_id__in=missing + drifted).update(unread=actual_unread_count())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {updated} unread counter(s)."))
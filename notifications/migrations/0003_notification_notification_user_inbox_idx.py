@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_book_keyset_indexes'),
+        ('notifications', '0002_notification_seen_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='notification_user_inbox_idx'),
+        ),
+    ]
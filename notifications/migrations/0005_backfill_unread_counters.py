@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    UnreadCounter = apps.get_model('notifications', 'UnreadCounter')
+
+    counts = (Notification.objects.filter(is_read=False).order_by().values('user')
+              .annotate(unread=Count('id')).values_list('user', 'unread'))
+    UnreadCounter.objects.bulk_create(
+        (UnreadCounter(user_id=user_id, unread=unread) for user_id, unread in counts.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notification_unread_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
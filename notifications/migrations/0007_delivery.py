@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notification_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Delivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(choices=[('email', 'Email'), ('sms', 'SMS')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('dead', 'Dead letter')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='notifications.notification')),
+            ],
+            options={
+                'verbose_name_plural': 'deliveries',
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['channel', 'next_attempt_at', 'id'], name='delivery_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('notification', 'channel'), name='delivery_notification_channel_unique')],
+            },
+        ),
+    ]
@@ -1,7 +1,12 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from books.models import Book
 
+from .push import publish_notifications
+
 
 class Notification(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -11,5 +16,145 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     seen_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='notification_user_inbox_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], condition=models.Q(is_read=False),
+                         name='notification_user_unread_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            adding = self._state.adding
+            if not adding:
+                previous = (Notification.objects.select_for_update().filter(pk=self.pk)
+                            .values('user_id', 'is_read').first())
+            super(Notification, self).save(*args, **kwargs)
+
+            deltas = {}
+            if previous and not previous['is_read']:
+                deltas[previous['user_id']] = -1
+            if not self.is_read:
+                deltas[self.user_id] = deltas.get(self.user_id, 0) + 1
+            UnreadCounter.adjust(deltas)
+            if adding:
+                Delivery.enqueue([self])
+                publish_notifications([self])
+
     def __str__(self):
         return f'Notification for {self.user.username} about {self.book.title}'
+
+
+class UnreadCounter(models.Model):
+    """Denormalized number of unread notifications per user, so the inbox badge never counts rows."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def adjust(cls, deltas):
+        """
+        Add ``{user_id: delta}`` to the counters with one UPDATE. Missing
+        counters are created first for increments only; a missing counter
+        already reads as zero, and a user being deleted must not get one back.
+        """
+        deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        created = [cls(user_id=user_id) for user_id, delta in deltas.items() if delta > 0]
+        if created:
+            cls.objects.bulk_create(created, ignore_conflicts=True)
+        delta = Case(*[When(user_id=user_id, then=Value(n)) for user_id, n in deltas.items()],
+                     output_field=IntegerField())
+        cls.objects.filter(user_id__in=deltas).update(unread=Greatest(F('unread') + delta, 0))
+
+    def __str__(self):
+        return f'{self.user_id}: {self.unread} unread'
+
+
+class NotificationArchive(models.Model):
+    """
+    Read notifications moved out of the hot Notification table by
+    notifications.retention. Plain integer columns with no foreign keys
+    keep the archive compact and cheap to insert into.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField()
+    book_id = models.BigIntegerField()
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    seen_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'created_at'], name='notification_archive_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'Archived notification {self.id} for user {self.user_id}'
+
+
+class Delivery(models.Model):
+    """
+    Outbound copy of a notification on one channel, sent by
+    notifications.delivery. A pending row is due at ``next_attempt_at``.
+    Rows that run out of attempts stay behind as 'dead' letters.
+    """
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead letter'),
+    ]
+
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='deliveries')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    # Recipient field holding each channel's address.
+    ADDRESS_FIELDS = {
+        'email': 'email',
+        'sms': 'contact_number',
+    }
+
+    class Meta:
+        verbose_name_plural = 'deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'channel'], name='delivery_notification_channel_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['channel', 'next_attempt_at', 'id'], condition=models.Q(status='pending'),
+                         name='delivery_due_idx'),
+        ]
+
+    @classmethod
+    def enqueue(cls, notifications):
+        """Queue saved notifications on every configured channel their recipient has an address for."""
+        channels = [channel for channel in settings.NOTIFICATION_TRANSPORTS if channel in cls.ADDRESS_FIELDS]
+        if not notifications or not channels:
+            return
+        users = Notification._meta.get_field('user').related_model.objects
+        addresses = {
+            pk: dict(zip(channels, values)) for pk, *values in
+            users.filter(pk__in={n.user_id for n in notifications})
+            .values_list('pk', *[cls.ADDRESS_FIELDS[channel] for channel in channels])
+        }
+        deliveries = [
+            cls(notification=notification, channel=channel)
+            for notification in notifications
+            for channel, address in addresses.get(notification.user_id, {}).items() if address
+        ]
+        if deliveries:
+            cls.objects.bulk_create(deliveries)
+
+    def __str__(self):
+        return f'{self.get_channel_display()} for notification {self.notification_id}: {self.status}'
@@ -0,0 +1,198 @@
+"""
+Real-time delivery of new notifications over Redis pub/sub.
+
+Writers publish every committed Notification to the recipient's channel.
+Each ASGI process holds a single pattern subscription (NotificationHub) and
+fans messages out to its open connections, so the number of Redis
+connections does not grow with the number of connected users.
+
+Pub/sub is fire-and-forget. The Notification table stays the source of
+truth: clients reconnect with the id of the last notification they saw,
+and anything newer is replayed from the database before live events
+resume (see notification_events).
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'notifications:user:{}'
+# Queued on a listener when it must disconnect: the hub lost Redis or the client fell behind.
+CLOSED = object()
+
+_client = None
+
+
+def get_redis():
+    """Shared synchronous client; its connection pool is reused by every publish."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.NOTIFICATION_PUSH_REDIS_URL, socket_connect_timeout=1)
+    return _client
+
+
+def get_async_redis():
+    return redis.asyncio.Redis.from_url(settings.NOTIFICATION_PUSH_REDIS_URL)
+
+
+def notification_payload(notification):
+    return {
+        'id': notification.pk,
+        'book': notification.book_id,
+        'message': notification.message,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+        'is_read': notification.is_read,
+    }
+
+
+def publish_notifications(notifications):
+    """
+    Publish saved notifications to their recipients once the current
+    transaction commits, in one pipelined round trip. A failed publish is
+    only logged: connected clients pick the rows up on their next reconnect.
+    """
+    messages = [(CHANNEL.format(n.user_id), json.dumps(notification_payload(n))) for n in notifications]
+    if not messages:
+        return
+
+    def publish():
+        try:
+            with get_redis().pipeline(transaction=False) as pipe:
+                for channel, data in messages:
+                    pipe.publish(channel, data)
+                pipe.execute()
+        except redis.RedisError:
+            logger.warning('Could not publish %d notifications', len(messages), exc_info=True)
+
+    transaction.on_commit(publish)
+
+
+class Listener:
+    """Bounded queue of raw payloads for one connection."""
+
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # A slow client is disconnected rather than buffered without limit;
+            # it replays what it missed from the database when it reconnects.
+            self.queue.get_nowait()
+            self.queue.put_nowait(CLOSED)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class NotificationHub:
+    """One Redis pattern subscription per process, fanned out to local listeners by user id."""
+
+    def __init__(self):
+        self._listeners = defaultdict(set)
+        self._task = None
+        self._subscribing = asyncio.Lock()
+
+    @asynccontextmanager
+    async def listen(self, user_id):
+        listener = Listener(settings.NOTIFICATION_PUSH_QUEUE_SIZE)
+        self._listeners[user_id].add(listener)
+        try:
+            await self._ensure_subscribed()
+            yield listener
+        finally:
+            listeners = self._listeners.get(user_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[user_id]
+
+    async def _ensure_subscribed(self):
+        # Concurrent first connections wait here instead of each opening a subscription.
+        async with self._subscribing:
+            if self._task is not None and not self._task.done():
+                return
+            pubsub = get_async_redis().pubsub()
+            await pubsub.psubscribe(CHANNEL.format('*'))
+            self._task = asyncio.create_task(self._run(pubsub))
+
+    async def _run(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                if message['type'] != 'pmessage':
+                    continue
+                user_id = int(message['channel'].rsplit(b':', 1)[1])
+                self.dispatch(user_id, message['data'])
+        except (redis.RedisError, OSError):
+            logger.warning('Notification subscription lost', exc_info=True)
+        finally:
+            # Every open connection closes; clients reconnect and replay from their cursor.
+            for listeners in self._listeners.values():
+                for listener in listeners:
+                    listener.put(CLOSED)
+            await pubsub.aclose()
+
+    def dispatch(self, user_id, data):
+        for listener in list(self._listeners.get(user_id, ())):
+            listener.put(data)
+
+
+hub = NotificationHub()
+
+
+async def _replay(user_id, after):
+    from .models import Notification
+
+    while True:
+        batch = [
+            notification async for notification in
+            Notification.objects.filter(user_id=user_id, pk__gt=after).order_by('pk')
+            [:settings.NOTIFICATION_REPLAY_BATCH_SIZE]
+        ]
+        for notification in batch:
+            yield notification_payload(notification)
+        if len(batch) < settings.NOTIFICATION_REPLAY_BATCH_SIZE:
+            return
+        after = batch[-1].pk
+
+
+async def notification_events(user_id, after=None):
+    """
+    Yield the user's new notifications as payload dicts, and None after
+    NOTIFICATION_PUSH_HEARTBEAT seconds without one. With an ``after``
+    cursor, stored notifications newer than it are replayed first. The
+    subscription is opened before the replay, and live events for
+    notifications the replay already sent are skipped, so nothing is lost or
+    repeated in between. Ids are compared one by one rather than against the
+    highest id seen: notifications can commit out of id order. Ends when the
+    hub drops the connection.
+    """
+    async with hub.listen(user_id) as listener:
+        replayed = set()
+        if after is not None:
+            async for payload in _replay(user_id, after):
+                replayed.add(payload['id'])
+                yield payload
+        while True:
+            try:
+                data = await asyncio.wait_for(listener.get(), settings.NOTIFICATION_PUSH_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if data is CLOSED:
+                return
+            payload = json.loads(data)
+            if payload['id'] in replayed:
+                # Each notification is published once, so its id can be forgotten after the duplicate.
+                replayed.discard(payload['id'])
+                continue
+            yield payload
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationArchive
+
+ARCHIVED_FIELDS = ('id', 'user_id', 'book_id', 'message', 'created_at', 'seen_at')
+
+
+def archive_notifications(older_than=None, batch_size=1000, pause=0):
+    """
+    Move read notifications created before ``older_than`` ago (default
+    settings.NOTIFICATION_ARCHIVE_AFTER) into NotificationArchive. Returns the
+    number moved.
+
+    Each batch runs in its own short transaction. It locks at most
+    ``batch_size`` rows with SKIP LOCKED, copies them with one INSERT and
+    deletes them by primary key. Locks are therefore held briefly, and the
+    inbox keeps being served while a large backlog drains. ``pause`` seconds
+    between batches lets replicas and autovacuum keep up. Unread
+    notifications are never archived.
+    """
+    cutoff = timezone.now() - (older_than or settings.NOTIFICATION_ARCHIVE_AFTER)
+    candidates = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                candidates.select_for_update(skip_locked=True).order_by('pk').values_list(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return archived
+            NotificationArchive.objects.bulk_create(
+                [NotificationArchive(**dict(zip(ARCHIVED_FIELDS, row))) for row in rows], ignore_conflicts=True,
+            )
+            Notification.objects.filter(pk__in=[row[0] for row in rows]).delete()
+            archived += len(rows)
+        if len(rows) < batch_size:
+            return archived
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,46 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Delivery, Notification, UnreadCounter
+from .push import publish_notifications
+
+BATCH_SIZE = 1000
+
+
+def create_notifications(notifications, batch_size=BATCH_SIZE):
+    """
+    Insert unsaved Notification instances with one bulk INSERT per batch, and
+    bump each recipient's unread counter with one UPDATE per batch. Email and
+    SMS deliveries are queued for the batch, and the new rows are pushed to
+    connected recipients once the transaction commits.
+    """
+    created = []
+    with transaction.atomic():
+        for start in range(0, len(notifications), batch_size):
+            batch = Notification.objects.bulk_create(notifications[start:start + batch_size])
+            UnreadCounter.adjust(Counter(notification.user_id for notification in batch
+                                         if not notification.is_read))
+            Delivery.enqueue(batch)
+            created.extend(batch)
+        publish_notifications(created)
+    return created
+
+
+def mark_read(user, ids=None):
+    """
+    Mark the user's unread notifications (only those in ``ids`` when given) as
+    read. Already read rows are not touched. Returns the number marked.
+    """
+    unread = Notification.objects.filter(user=user, is_read=False)
+    if ids is not None:
+        unread = unread.filter(pk__in=ids)
+    with transaction.atomic():
+        marked = unread.update(is_read=True, seen_at=timezone.now())
+        UnreadCounter.adjust({user.pk: -marked})
+    return marked
+
+
+def unread_count(user):
+    return UnreadCounter.objects.filter(user=user).values_list('unread', flat=True).first() or 0
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete
+
+from .models import UnreadCounter
+
+
+def _release_unread(sender, instance, **kwargs):
+    # post_delete also fires for queryset deletes and cascades (e.g. deleting the book).
+    if not instance.is_read:
+        UnreadCounter.adjust({instance.user_id: -1})
+
+
+def connect_unread_signals():
+    post_delete.connect(_release_unread, sender='notifications.Notification', dispatch_uid='notification_unread_delete')
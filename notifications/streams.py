@@ -0,0 +1,99 @@
+"""
+Push endpoints for new notifications, served by the ASGI application:
+server-sent events at notifications/stream/ and a WebSocket at
+/ws/notifications/ (routed in Lms/asgi.py). Both send one JSON payload per
+notification, and both resume from a cursor: the SSE Last-Event-ID header,
+or ``?after=<id>`` on either endpoint.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from authentication.backends import CachedJWTAuthentication
+from .push import notification_events
+
+
+def _cursor(value):
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _user_from_token(raw_token):
+    authentication = CachedJWTAuthentication()
+    return authentication.get_user(authentication.get_validated_token(raw_token))
+
+
+async def _sse(events):
+    async for payload in events:
+        if payload is None:
+            yield ": keep-alive\n\n"
+        else:
+            yield f"id: {payload['id']}\nevent: notification\ndata: {json.dumps(payload)}\n\n"
+
+
+async def notification_stream(request):
+    """Server-sent events: one ``notification`` event per new notification."""
+    try:
+        result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, InvalidToken):
+        result = None
+    if result is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    after = _cursor(request.headers.get('Last-Event-ID', request.GET.get('after')))
+
+    response = StreamingHttpResponse(_sse(notification_events(result[0].pk, after)),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def notification_websocket(scope, receive, send):
+    """
+    Raw ASGI WebSocket application. Browsers cannot set headers on a
+    WebSocket handshake, so the access token comes as ``?token=``. Heartbeats
+    are sent as ``{"type": "keep-alive"}`` messages.
+    """
+    query = parse_qs(scope['query_string'].decode())
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    try:
+        user = await sync_to_async(_user_from_token)(query.get('token', [''])[0])
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    await send({'type': 'websocket.accept'})
+
+    events = notification_events(user.pk, _cursor(query.get('after', [None])[0]))
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        while True:
+            next_event = asyncio.ensure_future(anext(events))
+            done, pending = await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_event.cancel()
+                await asyncio.gather(next_event, return_exceptions=True)
+                return
+            try:
+                payload = next_event.result()
+            except StopAsyncIteration:
+                await send({'type': 'websocket.close', 'code': 1012})
+                return
+            text = json.dumps({'type': 'keep-alive'} if payload is None else {'type': 'notification', **payload})
+            await send({'type': 'websocket.send', 'text': text})
+    finally:
+        disconnected.cancel()
+        await events.aclose()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'websocket.disconnect':
+        pass
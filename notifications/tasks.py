@@ -1,36 +1,96 @@
 from celery import shared_task
 from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from borrowing.models import Borrowing
+from notifications.delivery import dead_letter_unconfigured, deliver_pending
 from notifications.models import Notification
+from notifications.retention import archive_notifications
+from notifications.services import create_notifications
+
+
+def _notify_in_chunks(loans, mark, message, chunk_size):
+    """
+    Walk ``loans`` in primary-key keyset chunks. In one transaction per chunk,
+    lock the rows (skipping rows another worker holds), apply the ``mark``
+    update to them and bulk-insert one notification each. ``loans`` must stop
+    matching a row once it has been marked, which is what makes reruns and
+    overlapping workers harmless. Returns the number of loans notified.
+    """
+    notified = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(
+                loans.filter(pk__gt=last_pk).select_for_update(skip_locked=True, of=('self',))
+                .order_by('pk').values_list('pk', 'user_id', 'book_id', 'book__title', 'due_date')[:chunk_size]
+            )
+            if not chunk:
+                return notified
+            last_pk = chunk[-1][0]
+
+            Borrowing.objects.filter(pk__in=[row[0] for row in chunk]).update(**mark)
+            create_notifications([
+                Notification(user_id=user_id, book_id=book_id, message=message(title, due_date))
+                for pk, user_id, book_id, title, due_date in chunk
+            ])
+            notified += len(chunk)
 
 
 @shared_task
-def send_return_reminder():
+def send_return_reminder(chunk_size=500):
+    """
+    Remind borrowers of loans coming due. Each tier in
+    settings.RETURN_REMINDER_TIERS (days before the due date, counted in
+    calendar days) is sent at most once per loan. Loans that enter the window
+    late only get the most urgent tier that applies. The range on
+    (status, due_date) keeps the cost proportional to the loans in the window.
+    """
     now = timezone.now()
-    reminder_date = (now + timedelta(days=1))
+    today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    reminded = 0
+    for tier in sorted(settings.RETURN_REMINDER_TIERS):
+        loans = Borrowing.objects.filter(
+            status='borrowed',
+            due_date__gte=now,
+            due_date__lt=today + timedelta(days=tier + 1),
+        ).exclude(last_reminder_tier__lte=tier)
+        reminded += _notify_in_chunks(
+            loans,
+            mark={'last_reminder_tier': tier},
+            message=lambda title, due_date: f'Reminder: Please return the book "{title}" by {due_date}.',
+            chunk_size=chunk_size,
+        )
+    return reminded
 
-    borrowings = Borrowing.objects.filter(due_date=reminder_date, status='borrowed')
 
-    for borrowing in borrowings:
-        Notification.objects.create(
-            user=borrowing.user,
-            book=borrowing.book,
-            message=f'Reminder: Please return the book "{borrowing.book.title}" by {borrowing.due_date}.'
-        )
+@shared_task
+def send_overdue_alert(chunk_size=500):
+    """
+    Flag loans past their due date as overdue and alert their borrowers. The
+    'borrowed' to 'overdue' status change is the idempotency marker.
+    Returns the number of loans flagged.
+    """
+    return _notify_in_chunks(
+        Borrowing.objects.filter(due_date__lt=timezone.now(), status='borrowed'),
+        mark={'status': 'overdue'},
+        message=lambda title, due_date: f'Alert: The book "{title}" is overdue. Please return it immediately!',
+        chunk_size=chunk_size,
+    )
 
 
 @shared_task
-def send_overdue_alert():
-    now = timezone.now()
+def archive_old_notifications(batch_size=1000):
+    return archive_notifications(batch_size=batch_size)
 
-    borrowings = Borrowing.objects.filter(due_date__lt=now, status='borrowed')
 
-    for borrowing in borrowings:
-        Notification.objects.create(
-            user=borrowing.user,
-            book=borrowing.book,
-            message=f'Alert: The book "{borrowing.book.title}" is overdue. Please return it immediately!'
-        )
-        borrowing.status = 'overdue'
-        borrowing.save()
+@shared_task
+def deliver_notifications(channel=None):
+    """Send due email/SMS deliveries; without a channel, start one task per configured channel."""
+    if channel is None:
+        dead_letter_unconfigured()
+        for channel in settings.NOTIFICATION_TRANSPORTS:
+            deliver_notifications.delay(channel)
+        return None
+    return deliver_pending(channel)
@@ -1,15 +1,36 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
 from books.models import Book, Author
-from .models import Notification
+from .models import Notification, NotificationArchive, UnreadCounter
+from .retention import archive_notifications
+from .delivery import TokenBucket, dead_letter_unconfigured, deliver_pending
+from .models import Delivery
+from .push import CLOSED, NotificationHub, hub, notification_events
+from .services import create_notifications, unread_count
+from .streams import notification_websocket
 from django.urls import reverse
 from rest_framework import status
+from asgiref.sync import sync_to_async
+from redis import ConnectionError as RedisConnectionError
 from rest_framework.test import APITestCase
-from unittest.mock import patch
+from rest_framework_simplejwt.tokens import AccessToken
+from unittest.mock import AsyncMock, patch
 from django.utils import timezone
 from datetime import timedelta
 from borrowing.models import Borrowing
 from .tasks import send_return_reminder, send_overdue_alert
+from .transports import PermanentDeliveryError
 
 User = get_user_model()
 
@@ -90,20 +111,89 @@ class NotificationListViewTest(APITestCase):
         response = self.client.get(self.url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['message'], "Your reserved book is available now.")
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['message'], "Your reserved book is available now.")
 
-    def test_notifications_marked_as_read_after_retrieval(self):
+    def test_listing_does_not_mark_notifications_read(self):
         self.client.force_authenticate(user=self.user)
-        notification = Notification.objects.get(id=self.notification.id)
-        self.assertFalse(notification.is_read)
-
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        notification.refresh_from_db()
-        self.assertTrue(notification.is_read)
-        self.assertIsNotNone(notification.seen_at)
+        self.notification.refresh_from_db()
+        self.assertFalse(self.notification.is_read)
+
+    def test_mark_read_touches_only_unread_rows(self):
+        self.client.force_authenticate(user=self.user)
+        other = Notification.objects.create(user=self.user, book=self.book, message="Second")
+        self.assertEqual(self.client.get(reverse('notifications-unread-count')).data['unread'], 2)
+
+        response = self.client.post(reverse('notifications-mark-read'), {'ids': [self.notification.id]},
+                                    format='json')
+        self.assertEqual((response.data['marked'], response.data['unread']), (1, 1))
+        response = self.client.post(reverse('notifications-mark-read'), {'ids': [self.notification.id]},
+                                    format='json')
+        self.assertEqual((response.data['marked'], response.data['unread']), (0, 1))
+
+        self.notification.refresh_from_db()
+        self.assertTrue(self.notification.is_read)
+        self.assertIsNotNone(self.notification.seen_at)
+        unread = self.client.get(self.url, {'unread': 'true'})
+        self.assertEqual([item['id'] for item in unread.data['results']], [other.id])
+
+    def test_mark_all_read(self):
+        self.client.force_authenticate(user=self.user)
+        stranger = User.objects.create_user(username='stranger', password='pass')
+        Notification.objects.create(user=stranger, book=self.book, message="Not yours")
+
+        response = self.client.post(reverse('notifications-mark-all-read'))
+        self.assertEqual((response.data['marked'], response.data['unread']), (1, 0))
+        self.assertEqual(Notification.objects.filter(user=stranger, is_read=False).count(), 1)
+
+    def test_inbox_query_count_is_independent_of_history(self):
+        create_notifications([Notification(user=self.user, book=self.book, message=f"Old {n}") for n in range(150)])
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['results']), 20)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('notifications-unread-count')).data['unread'], 151)
+
+
+class UnreadCounterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='pass')
+        self.book = Book.objects.create(title="Counted", isbn="9780000000601")
+
+    def test_counter_follows_saves_and_deletes(self):
+        notification = Notification.objects.create(user=self.user, book=self.book, message="One")
+        create_notifications([Notification(user=self.user, book=self.book, message="Two")])
+        self.assertEqual(unread_count(self.user), 2)
+
+        notification.is_read = True
+        notification.save()
+        self.assertEqual(unread_count(self.user), 1)
+        Notification.objects.get(message="Two").delete()
+        self.assertEqual(unread_count(self.user), 0)
+
+    def test_counter_follows_cascade_deletes(self):
+        other = Book.objects.create(title="Kept", isbn="9780000000602")
+        create_notifications([Notification(user=self.user, book=self.book, message="One"),
+                              Notification(user=self.user, book=self.book, message="Two"),
+                              Notification(user=self.user, book=other, message="Three")])
+        self.book.delete()
+        self.assertEqual(unread_count(self.user), 1)
+        call_command('rebuild_unread_counters', '--check', stdout=io.StringIO())
+
+        self.user.delete()
+        self.assertFalse(UnreadCounter.objects.exists())
+
+    def test_rebuild_command_fixes_drift(self):
+        create_notifications([Notification(user=self.user, book=self.book, message="One")])
+        UnreadCounter.objects.update(unread=9)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_unread_counters', '--check', stdout=io.StringIO())
+        call_command('rebuild_unread_counters', stdout=io.StringIO())
+        self.assertEqual(unread_count(self.user), 1)
 
 
 class SendReturnReminderTest(TestCase):
@@ -119,15 +209,34 @@ class SendReturnReminderTest(TestCase):
             status='borrowed'
         )
 
-    @patch('notifications.tasks.Notification.objects.create')
-    def test_send_return_reminder_creates_notification(self, mock_create):
+    def test_send_return_reminder_creates_notification(self):
         send_return_reminder()
 
-        mock_create.assert_called_once_with(
-            user=self.borrowing.user,
-            book=self.book,
-            message=f'Reminder: Please return the book "{self.borrowing.book.title}" by {self.borrowing.due_date}.'
-        )
+        notification = Notification.objects.get(user=self.user)
+        self.assertEqual(notification.book, self.book)
+        self.assertEqual(notification.message,
+                         f'Reminder: Please return the book "{self.book.title}" by {self.borrowing.due_date}.')
+        self.borrowing.refresh_from_db()
+        self.assertEqual(self.borrowing.last_reminder_tier, 1)
+
+    def test_each_tier_is_sent_once(self):
+        send_return_reminder()
+        send_return_reminder()
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 1)
+
+        # The loan is now due today: the next tier goes out, once.
+        Borrowing.objects.filter(pk=self.borrowing.pk).update(due_date=timezone.now() + timedelta(seconds=30))
+        send_return_reminder()
+        send_return_reminder()
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 2)
+        self.borrowing.refresh_from_db()
+        self.assertEqual(self.borrowing.last_reminder_tier, 0)
+
+    def test_loans_outside_the_window_are_skipped(self):
+        Borrowing.objects.create(user=self.user, book=self.book, due_date=timezone.now() + timedelta(days=10))
+        Borrowing.objects.create(user=self.user, book=self.book, due_date=timezone.now() + timedelta(days=1),
+                                 return_date=timezone.now())
+        self.assertEqual(send_return_reminder(), 1)
 
 
 class SendOverdueAlertTest(TestCase):
@@ -161,3 +270,271 @@ class SendOverdueAlertTest(TestCase):
 
         self.assertEqual(self.borrowing1.status, 'overdue')
         self.assertEqual(self.borrowing2.status, 'overdue')
+
+    def test_rerun_does_not_alert_twice(self):
+        self.assertEqual(send_overdue_alert(), 2)
+        self.assertEqual(send_overdue_alert(), 0)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 2)
+
+    def test_sweeps_in_chunks_with_constant_queries_per_chunk(self):
+        Borrowing.objects.bulk_create(
+            Borrowing(user=self.user, book=self.book, due_date=timezone.now() - timedelta(days=1))
+            for _ in range(8)
+        )
+        returned = Borrowing.objects.create(user=self.user, book=self.book,
+                                            due_date=timezone.now() - timedelta(days=2),
+                                            return_date=timezone.now() - timedelta(days=3))
+
+        # Per chunk: savepoint, locked SELECT, UPDATE, a nested savepoint around the INSERT, the two unread
+        # counter queries and the recipients' delivery addresses, release; plus the final empty chunk.
+        with self.assertNumQueries(4 * 10 + 3):
+            self.assertEqual(send_overdue_alert(chunk_size=3), 10)
+
+        self.assertEqual(Notification.objects.count(), 10)
+        returned.refresh_from_db()
+        self.assertEqual(returned.status, 'returned')
+
+
+class NotificationArchiveTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='pass')
+        self.book = Book.objects.create(title="Archived", isbn="9780000000701")
+
+    def notify(self, count, age, is_read):
+        created = create_notifications([
+            Notification(user=self.user, book=self.book, message=f"{age.days} days", is_read=is_read)
+            for _ in range(count)
+        ])
+        Notification.objects.filter(pk__in=[n.pk for n in created]).update(created_at=timezone.now() - age)
+
+    def test_archives_only_old_read_notifications_in_batches(self):
+        self.notify(5, timedelta(days=120), is_read=True)
+        self.notify(2, timedelta(days=120), is_read=False)
+        self.notify(3, timedelta(days=10), is_read=True)
+
+        self.assertEqual(archive_notifications(batch_size=2), 5)
+        self.assertEqual(NotificationArchive.objects.count(), 5)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertFalse(Notification.objects.filter(is_read=True, created_at__lt=timezone.now() - timedelta(days=90))
+                         .exists())
+        self.assertEqual(unread_count(self.user), 2)
+
+        archived = NotificationArchive.objects.first()
+        self.assertEqual((archived.user_id, archived.book_id, archived.message), (self.user.pk, self.book.pk, "120 days"))
+
+    def test_rerun_is_a_no_op(self):
+        self.notify(2, timedelta(days=120), is_read=True)
+        archive_notifications()
+        self.assertEqual(archive_notifications(), 0)
+        self.assertEqual(NotificationArchive.objects.count(), 2)
+
+
+class NotificationPushTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='listener', password='pass')
+        self.book = Book.objects.create(title="Pushed", isbn="9780000000801")
+        self.token = str(AccessToken.for_user(self.user))
+        subscribe = patch.object(hub, '_ensure_subscribed', AsyncMock())
+        subscribe.start()
+        self.addCleanup(subscribe.stop)
+
+    def notify(self, count):
+        return create_notifications([Notification(user=self.user, book=self.book, message=f"#{i}")
+                                     for i in range(count)])
+
+    @patch('notifications.push.get_redis')
+    def test_new_notifications_are_published_after_commit(self, get_redis):
+        pipe = get_redis.return_value.pipeline.return_value.__enter__.return_value
+        with self.captureOnCommitCallbacks() as callbacks:
+            created = self.notify(2)
+        pipe.publish.assert_not_called()
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(pipe.publish.call_count, 2)
+        channel, data = pipe.publish.call_args_list[0].args
+        self.assertEqual(channel, f'notifications:user:{self.user.pk}')
+        self.assertEqual(json.loads(data)['id'], created[0].pk)
+        pipe.execute.assert_called_once()
+
+    @patch('notifications.push.get_redis')
+    def test_publish_failure_does_not_break_the_write(self, get_redis):
+        get_redis.return_value.pipeline.side_effect = RedisConnectionError
+        with self.assertLogs('notifications.push', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, book=self.book, message="Still saved")
+        self.assertEqual(Notification.objects.count(), 1)
+
+    async def test_stream_replays_missed_notifications_then_pushes_live_ones(self):
+        seen, missed, also_missed = await sync_to_async(self.notify)(3)
+        response = await self.async_client.get(reverse('notifications-stream'), headers={
+            'Authorization': f'Bearer {self.token}', 'Last-Event-ID': str(seen.pk)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+
+        replayed = [await anext(events), await anext(events)]
+        self.assertIn(f'id: {missed.pk}\n'.encode(), replayed[0])
+        self.assertIn(f'id: {also_missed.pk}\n'.encode(), replayed[1])
+
+        hub.dispatch(self.user.pk, json.dumps({'id': also_missed.pk}))
+        hub.dispatch(self.user.pk, json.dumps({'id': also_missed.pk + 1, 'message': 'live'}))
+        hub.dispatch(self.user.pk, CLOSED)
+        rest = [chunk async for chunk in events]
+        self.assertEqual(len(rest), 1)
+        self.assertEqual(json.loads(rest[0].decode().split('data: ')[1])['message'], 'live')
+
+    async def test_live_events_committed_out_of_id_order_are_kept(self):
+        seen, replayed = await sync_to_async(self.notify)(2)
+        events = notification_events(self.user.pk, after=seen.pk)
+        self.assertEqual((await anext(events))['id'], replayed.pk)
+
+        hub.dispatch(self.user.pk, json.dumps({'id': replayed.pk + 5}))
+        hub.dispatch(self.user.pk, json.dumps({'id': replayed.pk}))
+        hub.dispatch(self.user.pk, json.dumps({'id': replayed.pk + 4}))
+        hub.dispatch(self.user.pk, CLOSED)
+        self.assertEqual([payload['id'] async for payload in events], [replayed.pk + 5, replayed.pk + 4])
+
+    @override_settings(NOTIFICATION_PUSH_HEARTBEAT=0.01)
+    async def test_idle_stream_sends_heartbeats(self):
+        events = notification_events(self.user.pk)
+        self.assertIsNone(await asyncio.wait_for(anext(events), 1))
+        hub.dispatch(self.user.pk, json.dumps({'id': 1}))
+        self.assertEqual(await asyncio.wait_for(anext(events), 1), {'id': 1})
+        await events.aclose()
+
+    @patch('notifications.push.get_async_redis')
+    async def test_concurrent_connections_share_one_subscription(self, get_async_redis):
+        async def slow_subscribe(pattern):
+            await asyncio.sleep(0.01)
+
+        async def run_forever(pubsub):
+            await asyncio.sleep(60)
+
+        pubsub = get_async_redis.return_value.pubsub.return_value
+        pubsub.psubscribe = AsyncMock(side_effect=slow_subscribe)
+        fresh = NotificationHub()
+        with patch.object(fresh, '_run', side_effect=run_forever):
+            await asyncio.gather(*(fresh._ensure_subscribed() for _ in range(5)))
+            pubsub.psubscribe.assert_awaited_once()
+            fresh._task.cancel()
+
+    async def test_stream_requires_authentication(self):
+        response = await self.async_client.get(reverse('notifications-stream'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_websocket_replays_from_cursor_until_disconnect(self):
+        seen, missed = await sync_to_async(self.notify)(2)
+        incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+        await incoming.put({'type': 'websocket.connect'})
+        scope = {'type': 'websocket', 'query_string': f'token={self.token}&after={seen.pk}'.encode()}
+        connection = asyncio.create_task(notification_websocket(scope, incoming.get, outgoing.put))
+
+        self.assertEqual(await outgoing.get(), {'type': 'websocket.accept'})
+        message = json.loads((await outgoing.get())['text'])
+        self.assertEqual((message['type'], message['id']), ('notification', missed.pk))
+
+        await incoming.put({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(connection, 1)
+        self.assertFalse(hub._listeners)
+
+    async def test_websocket_rejects_bad_tokens(self):
+        incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+        await incoming.put({'type': 'websocket.connect'})
+        await notification_websocket({'type': 'websocket', 'query_string': b'token=nope'}, incoming.get, outgoing.put)
+        self.assertEqual(await outgoing.get(), {'type': 'websocket.close', 'code': 4401})
+
+
+class NotificationDeliveryTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.sms_log = os.path.join(directory, 'sms.jsonl')
+        override = override_settings(NOTIFICATION_TRANSPORTS={
+            'email': {'BACKEND': 'notifications.transports.EmailTransport', 'RATE': 1000, 'BURST': 1000,
+                      'BATCH_SIZE': 2},
+            'sms': {'BACKEND': 'notifications.transports.FileTransport', 'OPTIONS': {'path': self.sms_log},
+                    'RATE': 1000, 'BURST': 1000, 'BATCH_SIZE': 2},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='patron', password='pass', email='patron@example.com',
+                                             contact_number='5550100')
+        self.book = Book.objects.create(title="Delivered", isbn="9780000000901")
+
+    def notify(self, count, user=None):
+        return create_notifications([Notification(user=user or self.user, book=self.book, message=f"#{i}")
+                                     for i in range(count)])
+
+    def test_queues_one_delivery_per_channel_with_an_address(self):
+        self.notify(2)
+        Notification.objects.create(user=User.objects.create_user(username='no-contact', password='pass'),
+                                    book=self.book, message="Inbox only")
+        self.assertEqual(Delivery.objects.filter(channel='email').count(), 2)
+        self.assertEqual(Delivery.objects.filter(channel='sms').count(), 2)
+
+    def test_sends_batches_over_one_connection(self):
+        self.notify(5)
+        with patch('django.core.mail.backends.locmem.EmailBackend.open') as open_connection:
+            self.assertEqual(deliver_pending('email'), 5)
+        open_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].to, ['patron@example.com'])
+
+        self.assertEqual(deliver_pending('sms'), 5)
+        with open(self.sms_log) as log:
+            self.assertEqual([json.loads(line)['to'] for line in log], ['5550100'] * 5)
+        self.assertFalse(Delivery.objects.exclude(status='sent').exists())
+
+    def test_failures_back_off_then_dead_letter(self):
+        notification, = self.notify(1)
+        with override_settings(NOTIFICATION_DELIVERY_MAX_ATTEMPTS=2), \
+                patch('notifications.transports.FileTransport.send', side_effect=OSError('gateway down')):
+            self.assertEqual(deliver_pending('sms'), 0)
+            delivery = notification.deliveries.get(channel='sms')
+            self.assertEqual((delivery.status, delivery.attempts, delivery.last_error), ('pending', 1, 'gateway down'))
+            self.assertGreater(delivery.next_attempt_at, timezone.now())
+
+            self.assertEqual(deliver_pending('sms'), 0)
+            Delivery.objects.filter(pk=delivery.pk).update(next_attempt_at=timezone.now())
+            deliver_pending('sms')
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), ('dead', 2))
+
+    def test_permanent_errors_are_not_retried(self):
+        notification, = self.notify(1)
+        with patch('notifications.transports.FileTransport.send', side_effect=PermanentDeliveryError('refused')):
+            deliver_pending('sms')
+        self.assertEqual(notification.deliveries.get(channel='sms').status, 'dead')
+
+    def test_one_dispatcher_per_channel(self):
+        self.notify(1)
+        cache.add('notifications:delivery:lock:email', True)
+        self.assertIsNone(deliver_pending('email'))
+        self.assertEqual(mail.outbox, [])
+
+    def test_expired_run_keeps_its_successors_lock(self):
+        self.notify(1)
+        lock = 'notifications:delivery:lock:email'
+        with patch('django.core.mail.backends.locmem.EmailBackend.open',
+                   side_effect=lambda: cache.set(lock, 'successor')):
+            deliver_pending('email')
+        self.assertEqual(cache.get(lock), 'successor')
+
+    def test_unconfigured_channels_are_dead_lettered(self):
+        self.notify(1)
+        with override_settings(NOTIFICATION_TRANSPORTS={'email': settings.NOTIFICATION_TRANSPORTS['email']}):
+            self.assertEqual(dead_letter_unconfigured(), 1)
+        self.assertEqual(Delivery.objects.get(channel='sms').status, 'dead')
+        self.assertEqual(Delivery.objects.get(channel='email').status, 'pending')
+
+    @patch('notifications.delivery.time')
+    def test_token_bucket_limits_the_rate(self, clock):
+        clock.time.return_value = 1000.0
+        bucket = TokenBucket('test', rate=2, burst=3)
+        self.assertEqual(bucket.take(5), 3)
+
+        clock.sleep.side_effect = lambda seconds: setattr(clock.time, 'return_value', clock.time() + seconds)
+        self.assertEqual(bucket.take(5), 1)
+        clock.sleep.assert_called_once_with(0.5)
+        clock.time.return_value += 1
+        self.assertEqual(TokenBucket('test', rate=2, burst=3).take(5), 2)
@@ -0,0 +1,84 @@
+"""
+Transports send one channel's messages for notifications.delivery. A
+transport is opened once per batch and reused for every message in it.
+Each channel in settings.NOTIFICATION_TRANSPORTS names its transport class
+in BACKEND, and any OPTIONS are passed to the constructor.
+"""
+import json
+import smtplib
+import sys
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils.module_loading import import_string
+
+
+class PermanentDeliveryError(Exception):
+    """The message can never be delivered (e.g. the address is refused); it is not retried."""
+
+
+class Transport:
+    def __init__(self, **options):
+        self.options = options
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send(self, address, subject, body):
+        """Send one message; raise to have it retried, or PermanentDeliveryError to dead-letter it."""
+        raise NotImplementedError
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EmailTransport(Transport):
+    """Email through Django's EMAIL_BACKEND, keeping one SMTP connection open for the batch."""
+
+    def open(self):
+        self.connection = get_connection(fail_silently=False, **self.options)
+        self.connection.open()
+
+    def close(self):
+        self.connection.close()
+
+    def send(self, address, subject, body):
+        message = EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [address], connection=self.connection)
+        try:
+            message.send()
+        except smtplib.SMTPRecipientsRefused as exc:
+            raise PermanentDeliveryError(str(exc)) from exc
+
+
+class ConsoleTransport(Transport):
+    """Writes messages to stdout; for local development only, as it prints recipients' addresses."""
+
+    def send(self, address, subject, body):
+        stream = self.options.get('stream', sys.stdout)
+        stream.write(f'To {address}: {body}\n')
+        stream.flush()
+
+
+class FileTransport(Transport):
+    """Appends messages as JSON lines to the file at the ``path`` option; for tests and local development."""
+
+    def open(self):
+        self.file = open(self.options['path'], 'a', encoding='utf-8')
+
+    def close(self):
+        self.file.close()
+
+    def send(self, address, subject, body):
+        self.file.write(json.dumps({'to': address, 'subject': subject, 'body': body}) + '\n')
+
+
+def get_transport(channel):
+    config = settings.NOTIFICATION_TRANSPORTS[channel]
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
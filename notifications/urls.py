@@ -1,6 +1,11 @@
 from django.urls import path
-from .views import NotificationListView
+from .streams import notification_stream
+from .views import MarkAllReadView, MarkReadView, NotificationListView, UnreadCountView
 
 urlpatterns = [
     path('notifications/', NotificationListView.as_view(), name='notifications-list'),
+    path('notifications/unread-count/', UnreadCountView.as_view(), name='notifications-unread-count'),
+    path('notifications/mark-read/', MarkReadView.as_view(), name='notifications-mark-read'),
+    path('notifications/stream/', notification_stream, name='notifications-stream'),
+    path('notifications/mark-all-read/', MarkAllReadView.as_view(), name='notifications-mark-all-read'),
 ]
@@ -1,22 +1,47 @@
 # notifications/views.py
-from django.utils import timezone
-from rest_framework import generics
+from rest_framework import generics, serializers, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from .models import Notification
-from .serializers import NotificationSerializer
+from .serializers import MarkReadSerializer, NotificationSerializer
+from .services import mark_read, unread_count
 
 
 class NotificationListView(generics.ListAPIView):
+    """The user's inbox, newest first; ``?unread=true`` limits it to unread notifications."""
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ['-created_at', '-id']
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        queryset = Notification.objects.filter(user=self.request.user)
+        if serializers.BooleanField().to_internal_value(self.request.query_params.get('unread', False)):
+            queryset = queryset.filter(is_read=False)
+        return queryset
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        queryset.update(is_read=True, seen_at=timezone.now())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+
+class UnreadCountView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({'unread': unread_count(request.user)})
+
+
+class MarkReadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = MarkReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        marked = mark_read(request.user, serializer.validated_data['ids'])
+        return Response({'marked': marked, 'unread': unread_count(request.user)}, status=status.HTTP_200_OK)
+
+
+class MarkAllReadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        marked = mark_read(request.user)
+        return Response({'marked': marked, 'unread': unread_count(request.user)}, status=status.HTTP_200_OK)
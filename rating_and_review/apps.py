@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RatingAndReviewConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rating_and_review'
+
+    def ready(self):
+        from .signals import connect_rating_signals
+        connect_rating_signals()
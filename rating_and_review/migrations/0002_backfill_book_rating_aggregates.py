@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    Review = apps.get_model('rating_and_review', 'Review')
+
+    reviews = Review.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    Book.objects.update(
+        rating_count=Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0,
+                              output_field=models.IntegerField()),
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0,
+                            output_field=models.IntegerField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_book_rating_aggregates'),
+        ('rating_and_review', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_book_keyset_indexes'),
+        ('rating_and_review', '0002_backfill_book_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', 'created_at', 'id'], name='review_book_created_idx'),
+        ),
+    ]
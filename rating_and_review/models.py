@@ -1,9 +1,15 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from books.models import Book
 
 
 class Review(models.Model):
+    """
+    Keeps Book.rating_count and rating_sum in step: save() adjusts them, and
+    deletes of any kind are handled by a post_delete receiver
+    (rating_and_review.signals). QuerySet.update() and bulk_create() bypass
+    both; run rebuild_rating_aggregates after using them.
+    """
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reviews')
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews')
     rating = models.IntegerField(choices=[(i, str(i)) for i in range(1, 6)], default=3)
@@ -11,7 +17,25 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ['user', 'book']  
+        unique_together = ['user', 'book']
+        indexes = [
+            models.Index(fields=['book', 'created_at', 'id'], name='review_book_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = (Review.objects.select_for_update().filter(pk=self.pk)
+                            .values('book_id', 'rating').first())
+            super(Review, self).save(*args, **kwargs)
+
+            if previous and previous['book_id'] == self.book_id:
+                Book.adjust_rating(self.book_id, 0, self.rating - previous['rating'])
+            else:
+                if previous:
+                    Book.adjust_rating(previous['book_id'], -1, -previous['rating'])
+                Book.adjust_rating(self.book_id, 1, self.rating)
 
     def __str__(self):
         return f'Review for {self.book.title} by {self.user.username}'
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete
+
+from books.models import Book
+
+
+def _release_rating(sender, instance, **kwargs):
+    # post_delete also fires for queryset deletes and cascades (e.g. deleting the reviewer).
+    Book.adjust_rating(instance.book_id, -1, -instance.rating)
+
+
+def connect_rating_signals():
+    post_delete.connect(_release_rating, sender='rating_and_review.Review', dispatch_uid='review_rating_delete')
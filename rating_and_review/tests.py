@@ -115,7 +115,7 @@ class ReviewAPITest(APITestCase):
         url = reverse('book-reviews-list', kwargs={'book_id': self.book.id})
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_update_review(self):
         self.client.force_authenticate(user=self.user)
@@ -130,3 +130,32 @@ class ReviewAPITest(APITestCase):
         self.review.refresh_from_db()
         self.assertEqual(self.review.rating, 3)
         self.assertEqual(self.review.comment, 'Updated comment!')
+
+    def test_rating_aggregates_follow_review_changes(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('create-review'), {'book': self.book2.id, 'rating': 4}, format='json')
+        self.book2.refresh_from_db()
+        self.assertEqual((self.book2.rating_count, self.book2.rating_sum), (1, 4))
+
+        url = reverse('user-review-detail', kwargs={'pk': self.review.id})
+        self.client.put(url, {'book': self.book.id, 'rating': 2}, format='json')
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.rating_sum), (1, 2))
+
+        self.client.delete(url)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.rating_sum), (0, 0))
+        self.assertEqual(self.book.average_rating(), "-")
+
+    def test_cascading_and_queryset_deletes_release_ratings(self):
+        Review.objects.create(user=self.user, book=self.book2, rating=4)
+        self.user.delete()
+        for book in (self.book, self.book2):
+            book.refresh_from_db()
+            self.assertEqual((book.rating_count, book.rating_sum), (0, 0))
+
+        reviewer = User.objects.create_user(username='other', password='testpassword')
+        Review.objects.create(user=reviewer, book=self.book, rating=3)
+        Review.objects.filter(user=reviewer).delete()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_count, self.book.rating_sum), (0, 0))
@@ -21,6 +21,7 @@ class CreateReviewView(generics.CreateAPIView):
 
 class BookReviewsListView(generics.ListAPIView):
     serializer_class = ReviewSerializer
+    ordering = ['-created_at', '-id']
 
     def get_queryset(self):
         book_id = self.kwargs['book_id']
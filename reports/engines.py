@@ -0,0 +1,175 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Sum
+from django.utils.timezone import localdate, now
+
+from books.cache import get_versions
+from borrowing.models import Borrowing
+from .writers import FORMATS, ITERATOR_CHUNK_SIZE
+
+_registry = {}
+
+
+def register(engine):
+    """Class decorator making ``engine`` available under its ``report_type``."""
+    _registry[engine.report_type] = engine
+    return engine
+
+
+def get_engine(report_type):
+    return _registry[report_type]
+
+
+def report_type_choices():
+    return [(engine.report_type, engine.label) for engine in _registry.values()]
+
+
+class ReportEngine:
+    """
+    A report type. Subclasses declare ``columns`` as (name, header, lookup)
+    triples and return the filtered, ordered queryset from ``get_queryset``.
+    Rows are fetched with ``values_list`` over the lookups and streamed, so
+    every report shares the same writer and per-row code.
+
+    The output only changes when a cache namespace in ``namespaces`` is
+    bumped. A report that also depends on the clock sets ``time_bucket`` to
+    how long its output stays valid.
+    """
+    report_type = None
+    label = None
+    columns = ()
+    limit = None
+    formats = tuple(FORMATS)
+    namespaces = ('borrowing', 'book')
+    time_bucket = None
+
+    def __init__(self, parameters=None):
+        self.parameters = parameters or {}
+
+    def clean_parameters(self):
+        """Validate ``self.parameters``, raising ValueError with a message for the client."""
+
+    def prepare(self):
+        """Hook run by the report task before the rows are read."""
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    @property
+    def names(self):
+        return [name for name, header, lookup in self.columns]
+
+    @property
+    def headers(self):
+        return [header for name, header, lookup in self.columns]
+
+    def rows(self):
+        queryset = self.get_queryset().values_list(*[lookup for name, header, lookup in self.columns])
+        if self.limit is not None:
+            queryset = queryset[:self.limit]
+        return queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+    def fingerprint(self, output_format, compress):
+        """Identifies the output of this report for the current data; equal fingerprints mean equal files."""
+        data_version = get_versions(self.namespaces)
+        if data_version is None:
+            # The data version is unknown without the cache, so the output must not be reused.
+            data_version = [time.time_ns()]
+        if self.time_bucket is not None:
+            data_version.append(int(time.time() // self.time_bucket.total_seconds()))
+        key = [self.report_type, self.parameters, output_format, compress, data_version]
+        return hashlib.sha256(json.dumps(key, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+    def get_filename(self, report):
+        return f'{self.report_type.lower()}_{report.generated_at}'
+
+
+class CirculationRankingReport(ReportEngine):
+    """
+    Ranking read from a daily circulation rollup instead of grouping every
+    loan. The optional ``days`` parameter restricts it to the last N days.
+    """
+    rollup = None  # 'app_label.Model' of a DailyCirculation subclass
+    key = None
+    limit = 10
+    namespaces = ('borrowing', 'book', 'category')
+    time_bucket = timedelta(days=1)
+
+    def clean_parameters(self):
+        days = self.parameters.get('days')
+        if days is not None and (not isinstance(days, int) or isinstance(days, bool) or days < 1):
+            raise ValueError("'days' must be a positive integer.")
+
+    def prepare(self):
+        # Imported here: reports.models imports this module for its report type choices.
+        from .rollups import refresh_circulation_rollups
+        refresh_circulation_rollups()
+
+    def get_queryset(self):
+        rows = apps.get_model(self.rollup).objects.all()
+        days = self.parameters.get('days')
+        if days:
+            rows = rows.filter(day__gt=localdate() - timedelta(days=days))
+        return (
+            rows.values(self.key)
+            .annotate(total_borrows=Sum('borrows'))
+            .order_by('-total_borrows', self.key)
+        )
+
+
+@register
+class MostBorrowedBooksReport(CirculationRankingReport):
+    report_type = 'MOST_BORROWED_BOOKS'
+    label = 'Most Borrowed Books'
+    columns = (
+        ('title', 'Book Title', 'book__title'),
+        ('total_borrows', 'Total Borrows', 'total_borrows'),
+    )
+    rollup = 'reports.DailyBookCirculation'
+    key = 'book_id'
+
+
+@register
+class BusiestCategoriesReport(CirculationRankingReport):
+    report_type = 'BUSIEST_CATEGORIES'
+    label = 'Busiest Categories'
+    columns = (
+        ('category', 'Category', 'category__title'),
+        ('total_borrows', 'Total Borrows', 'total_borrows'),
+    )
+    rollup = 'reports.DailyCategoryCirculation'
+    key = 'category_id'
+
+
+@register
+class LateBorrowersReport(ReportEngine):
+    report_type = 'LATE_BORROWERS'
+    label = 'Late Borrowers'
+    columns = (
+        ('user', 'User', 'user__username'),
+        ('title', 'Book Title', 'book__title'),
+        ('due_date', 'Due Date', 'due_date'),
+    )
+    time_bucket = timedelta(minutes=15)
+
+    def get_queryset(self):
+        return Borrowing.objects.filter(return_date__isnull=True, due_date__lt=now()).order_by('due_date', 'id')
+
+
+@register
+class CurrentlyBorrowedBooksReport(ReportEngine):
+    report_type = 'CURRENTLY_BORROWED_BOOKS'
+    label = 'Currently Borrowed Books'
+    columns = (
+        ('user', 'User', 'user__username'),
+        ('title', 'Book Title', 'book__title'),
+        ('borrow_date', 'Borrow Date', 'borrow_date'),
+    )
+
+    def get_queryset(self):
+        return Borrowing.objects.filter(return_date__isnull=True).order_by('borrow_date', 'id')
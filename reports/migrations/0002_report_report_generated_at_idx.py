@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['generated_at', 'id'], name='report_generated_at_idx'),
+        ),
+    ]
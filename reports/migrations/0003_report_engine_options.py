@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:30
+
+import reports.engines
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_report_report_generated_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='compress',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='output_format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines'), ('columnar', 'Columnar JSON')], default='csv', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='parameters',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='row_count',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='report_type',
+            field=models.CharField(choices=reports.engines.report_type_choices, max_length=50),
+        ),
+    ]
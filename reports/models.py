@@ -1,21 +1,89 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from books.models import Book, Category
+
+from .engines import report_type_choices
+
 User = get_user_model()
 
 
 class Report(models.Model):
-    REPORT_CHOICES = [
-        ('MOST_BORROWED_BOOKS', 'Most Borrowed Books'),
-        ('LATE_BORROWERS', 'Late Borrowers'),
-        ('CURRENTLY_BORROWED_BOOKS', 'Currently Borrowed Books'),
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+        ('columnar', 'Columnar JSON'),
     ]
 
-    report_type = models.CharField(max_length=50, choices=REPORT_CHOICES)
+    report_type = models.CharField(max_length=50, choices=report_type_choices)
+    output_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    compress = models.BooleanField(default=False)
+    parameters = models.JSONField(default=dict, blank=True)
+    row_count = models.PositiveBigIntegerField(null=True, blank=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    # Hash of the report type, its options and the data version; see ReportEngine.fingerprint.
+    fingerprint = models.CharField(max_length=64, null=True, blank=True, editable=False)
     generated_at = models.DateTimeField(auto_now_add=True)
     generated_by = models.ForeignKey(User, on_delete=models.CASCADE)
     file = models.FileField(upload_to='reports/')
     status = models.CharField(max_length=20, default='pending')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['generated_at', 'id'], name='report_generated_at_idx'),
+            models.Index(fields=['fingerprint', 'generated_at'], name='report_fingerprint_idx'),
+        ]
+        constraints = [
+            # At most one run in flight per fingerprint: concurrent identical requests coalesce onto it.
+            models.UniqueConstraint(fields=['fingerprint'], condition=models.Q(status='pending'),
+                                    name='report_pending_fingerprint_unique'),
+        ]
+
     def __str__(self):
         return f'{self.get_report_type_display()} by {self.generated_by.username} at {self.generated_at}'
+
+
+class DailyCirculation(models.Model):
+    """Number of loans started on ``day``, per subclass key. Maintained by reports.rollups."""
+    day = models.DateField()
+    borrows = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailyBookCirculation(DailyCirculation):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'book'], name='daily_book_circulation_unique'),
+        ]
+
+
+class DailyCategoryCirculation(DailyCirculation):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='daily_category_circulation_unique'),
+        ]
+
+
+class DailyUserCirculation(DailyCirculation):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='daily_user_circulation_unique'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Highest Borrowing id already folded into the circulation rollups."""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} @ {self.last_id}'
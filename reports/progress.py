@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+PROGRESS_KEY = 'report:progress:{}'
+TERMINAL_STATUSES = ('success', 'failed', 'expired')
+
+
+def get_progress(report_id):
+    return cache.get(PROGRESS_KEY.format(report_id))
+
+
+async def aget_progress(report_id):
+    return await cache.aget(PROGRESS_KEY.format(report_id))
+
+
+def report_state(report):
+    """Progress payload rebuilt from the database, for reports with no published progress."""
+    return {
+        'id': report.pk,
+        'status': report.status,
+        'rows': report.row_count,
+        'bytes': report.file_size,
+        'eta_seconds': None,
+        'file': report.file.url if report.file else None,
+        'version': 0,
+    }
+
+
+class ProgressTracker:
+    """
+    Publish a report run's progress to the cache (Redis in production), where
+    the status endpoints read it without touching the database.
+
+    ``update`` is called for every chunk of rows written but publishes at
+    most once per ``interval`` seconds. The ETA extrapolates the current rate
+    to ``expected_rows`` when that estimate is known. Every payload carries
+    a ``version`` that increases, which long-poll and SSE clients use to
+    wait for changes.
+    """
+    interval = 1.0
+
+    def __init__(self, report_id, expected_rows=None):
+        self.report_id = report_id
+        self.expected_rows = expected_rows
+        self.started = time.monotonic()
+        self.last_published = None
+
+    def publish(self, status, rows=None, bytes_written=None, eta_seconds=None, file=None):
+        self.last_published = time.monotonic()
+        cache.set(PROGRESS_KEY.format(self.report_id), {
+            'id': self.report_id,
+            'status': status,
+            'rows': rows,
+            'bytes': bytes_written,
+            'eta_seconds': eta_seconds,
+            'file': file,
+            'version': time.time_ns(),
+        }, settings.REPORT_PROGRESS_TIMEOUT)
+
+    def update(self, rows, bytes_written):
+        now = time.monotonic()
+        if self.last_published is not None and now - self.last_published < self.interval:
+            return
+        eta_seconds = None
+        if self.expected_rows and 0 < rows < self.expected_rows:
+            eta_seconds = round((now - self.started) * (self.expected_rows - rows) / rows, 1)
+        self.publish('running', rows, bytes_written, eta_seconds)
+
+    def finish(self, report):
+        self.publish(report.status, report.row_count, report.file_size,
+                     file=report.file.url if report.file else None)
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Report
+
+
+def _expire(reports):
+    expired = 0
+    for pk, name in reports.values_list('pk', 'file').iterator():
+        if name:
+            Report.file.field.storage.delete(name)
+        expired += Report.objects.filter(pk=pk).update(status='expired', file='', file_size=None)
+    return expired
+
+
+def evict_reports():
+    """
+    Apply the report retention policy and return the number of reports expired.
+
+    Outputs older than settings.REPORT_MAX_AGE are deleted first. Then, while
+    the finished outputs together exceed settings.REPORT_MAX_TOTAL_SIZE, the
+    oldest ones are deleted. Expired reports keep their row as history but
+    are never reused. Runs stuck in 'pending' past
+    settings.REPORT_PENDING_TIMEOUT are marked as failed, so they stop
+    absorbing new identical requests.
+    """
+    now = timezone.now()
+    Report.objects.filter(status='pending', generated_at__lt=now - settings.REPORT_PENDING_TIMEOUT) \
+        .update(status='failed')
+
+    finished = Report.objects.filter(status__in=('success', 'failed'))
+    expired = _expire(finished.filter(generated_at__lt=now - settings.REPORT_MAX_AGE))
+
+    total = Report.objects.filter(status='success').aggregate(total=Sum('file_size'))['total'] or 0
+    excess = total - settings.REPORT_MAX_TOTAL_SIZE
+    if excess > 0:
+        evicted = []
+        for pk, size in finished.order_by('generated_at', 'id').values_list('pk', 'file_size').iterator():
+            if excess <= 0:
+                break
+            evicted.append(pk)
+            excess -= size or 0
+        expired += _expire(Report.objects.filter(pk__in=evicted))
+    return expired
@@ -1,9 +1,21 @@
 from rest_framework import serializers
+from .engines import get_engine
 from .models import Report
 
 
 class ReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = Report
-        fields = ['id', 'report_type', 'generated_at', 'generated_by', 'file', 'status']
-        read_only_fields = ['generated_at', 'generated_by', 'file', 'status']
+        fields = ['id', 'report_type', 'output_format', 'compress', 'parameters', 'generated_at', 'generated_by',
+                  'file', 'status', 'row_count', 'file_size']
+        read_only_fields = ['generated_at', 'generated_by', 'file', 'status', 'row_count', 'file_size']
+
+    def validate(self, data):
+        engine = get_engine(data['report_type'])(data.get('parameters'))
+        if data.get('output_format', 'csv') not in engine.formats:
+            raise serializers.ValidationError({'output_format': f"{engine.label} is not available in this format."})
+        try:
+            engine.clean_parameters()
+        except ValueError as e:
+            raise serializers.ValidationError({'parameters': str(e)})
+        return data
@@ -0,0 +1,40 @@
+from django.db import IntegrityError, transaction
+
+from .engines import get_engine
+from .models import Report
+from .tasks import generate_report
+
+REUSABLE_STATUSES = ('pending', 'success')
+# Lookups and inserts tried before a request that keeps colliding gives up.
+CREATE_ATTEMPTS = 3
+
+
+def request_report(user, report_type, output_format='csv', compress=False, parameters=None):
+    """
+    Return ``(report, created)`` for a report request.
+
+    A finished or in-flight report with the same fingerprint (type,
+    options, parameters and data version) is returned instead of starting
+    a new run. Concurrent identical requests are coalesced by the unique
+    constraint on pending fingerprints.
+    """
+    fingerprint = get_engine(report_type)(parameters).fingerprint(output_format, compress)
+    reusable = Report.objects.filter(fingerprint=fingerprint, status__in=REUSABLE_STATUSES).order_by('-generated_at')
+    for attempt in range(CREATE_ATTEMPTS):
+        existing = reusable.first()
+        if existing is not None:
+            return existing, False
+        try:
+            with transaction.atomic():
+                report = Report.objects.create(
+                    report_type=report_type, output_format=output_format, compress=compress,
+                    parameters=parameters or {}, generated_by=user, fingerprint=fingerprint,
+                )
+        except IntegrityError:
+            # The conflicting run may have failed or been evicted before it could be
+            # re-read; look again, and create a new report if nothing matches.
+            if attempt == CREATE_ATTEMPTS - 1:
+                raise
+            continue
+        generate_report.delay(report.id)
+        return report, True
@@ -0,0 +1,109 @@
+"""
+Async progress endpoints for long report runs.
+
+They only read the progress that ProgressTracker publishes to the cache,
+awaiting between polls. Under the ASGI application in Lms/asgi.py, an
+open long-poll or SSE connection therefore holds no worker thread and no
+database connection.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from authentication.backends import CachedJWTAuthentication
+from .models import Report
+from .progress import TERMINAL_STATUSES, aget_progress, report_state
+
+POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 15.0
+
+
+async def _authorize(request):
+    """Authenticate the bearer token like the DRF views do; return an error response or None."""
+    try:
+        result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, InvalidToken):
+        result = None
+    if result is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    if result[0].role not in ['admin', 'librarian']:
+        return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=403)
+    return None
+
+
+async def _state(pk):
+    """Published progress, falling back to the report row; None if the report does not exist."""
+    state = await aget_progress(pk)
+    if state is not None:
+        return state
+    report = await Report.objects.filter(pk=pk).afirst()
+    return report_state(report) if report is not None else None
+
+
+async def report_progress_poll(request, pk):
+    """
+    Long-poll: answer as soon as the progress version differs from ``?since=``,
+    or with the unchanged state after REPORT_LONG_POLL_TIMEOUT seconds.
+    """
+    error = await _authorize(request)
+    if error is not None:
+        return error
+    try:
+        since = int(request.GET.get('since', -1))
+    except ValueError:
+        since = -1
+
+    state = await _state(pk)
+    if state is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    deadline = time.monotonic() + settings.REPORT_LONG_POLL_TIMEOUT
+    while state['version'] == since and state['status'] not in TERMINAL_STATUSES and time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        state = await aget_progress(pk) or state
+    return JsonResponse(state)
+
+
+async def _events(pk, state, last_version):
+    deadline = time.monotonic() + settings.REPORT_STREAM_TIMEOUT
+    last_sent = time.monotonic()
+    while True:
+        if state['version'] != last_version:
+            last_version = state['version']
+            last_sent = time.monotonic()
+            yield f"id: {last_version}\nevent: progress\ndata: {json.dumps(state)}\n\n"
+        if state['status'] in TERMINAL_STATUSES or time.monotonic() >= deadline:
+            return
+        if time.monotonic() - last_sent >= HEARTBEAT_INTERVAL:
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(POLL_INTERVAL)
+        state = await aget_progress(pk) or state
+
+
+async def report_progress_stream(request, pk):
+    """
+    Server-sent events: one ``progress`` event per published change, ending
+    after a terminal status. Reconnecting clients send Last-Event-ID and
+    only get newer states.
+    """
+    error = await _authorize(request)
+    if error is not None:
+        return error
+    state = await _state(pk)
+    if state is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    try:
+        last_version = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        last_version = -1
+
+    response = StreamingHttpResponse(_events(pk, state, last_version), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,65 +1,58 @@
-from celery import shared_task
-from .models import Report
-from borrowing.models import Borrowing
-from django.utils.timezone import now
-from django.core.files.base import ContentFile
-from django.db.models import Count
+import logging
 
+from celery import shared_task
+from django.db import OperationalError
 
-@shared_task
-def generate_most_borrowed_books_report(report_id):
+from .engines import get_engine
+from .models import Report
+from .progress import ProgressTracker
+from .retention import evict_reports
+from .rollups import refresh_circulation_rollups
+from .writers import write_report
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def generate_report(self, report_id):
+    """
+    Build any registered report type. Transient database errors are retried;
+    anything else marks the report as failed.
+    """
+    report = Report.objects.get(id=report_id)
+    # The previous run of the same report is the row estimate behind the ETA.
+    expected_rows = (
+        Report.objects.filter(report_type=report.report_type, parameters=report.parameters, status='success')
+        .exclude(pk=report.pk).order_by('-generated_at').values_list('row_count', flat=True).first()
+    )
+    tracker = ProgressTracker(report.id, expected_rows)
+    tracker.publish('running', rows=0, bytes_written=0)
     try:
-        report = Report.objects.get(id=report_id)
-
-        most_borrowed_books = (
-            Borrowing.objects.values('book__title')
-            .annotate(total_borrows=Count('book'))
-            .order_by('-total_borrows')[:10]
+        engine = get_engine(report.report_type)(report.parameters)
+        engine.prepare()
+        report.row_count, report.file_size = write_report(
+            report, engine.get_filename(report), engine.names, engine.headers, engine.rows(),
+            output_format=report.output_format, compress=report.compress, progress=tracker.update,
         )
-
-        file_content = "Book Title,Total Borrows\n"
-        for book in most_borrowed_books:
-            file_content += f"{book['book__title']},{book['total_borrows']}\n"
-
-        report.file.save(f"most_borrowed_books_{report.generated_at}.csv", ContentFile(file_content))
         report.status = 'success'
-        report.save()
-    except Exception as e:
+    except OperationalError as e:
+        if self.request.retries < self.max_retries:
+            tracker.publish('retrying')
+            raise self.retry(exc=e)
+        logger.exception("Report %s failed", report_id)
         report.status = 'failed'
-        report.save()
-
-
-@shared_task
-def generate_late_borrowers_report(report_id):
-    try:
-        report = Report.objects.get(id=report_id)
-        late_borrowings = Borrowing.objects.filter(return_date__lt=now(), actual_return_date__isnull=True)
-
-        file_content = "User,Book Title,Due Date\n"
-        for borrowing in late_borrowings:
-            file_content += f"{borrowing.user.username},{borrowing.book.title},{borrowing.return_date}\n"
-
-        report.file.save(f"late_borrowers_{report.generated_at}.csv", ContentFile(file_content))
-        report.status = 'success'
-        report.save()
-    except Exception as e:
+    except Exception:
+        logger.exception("Report %s failed", report_id)
         report.status = 'failed'
-        report.save()
+    report.save()
+    tracker.finish(report)
 
 
 @shared_task
-def generate_currently_borrowed_books_report(report_id):
-    try:
-        report = Report.objects.get(id=report_id)
-        currently_borrowed_books = Borrowing.objects.filter(actual_return_date__isnull=True)
+def refresh_circulation_stats():
+    return refresh_circulation_rollups()
 
-        file_content = "User,Book Title,Borrow Date\n"
-        for borrowing in currently_borrowed_books:
-            file_content += f"{borrowing.user.username},{borrowing.book.title},{borrowing.borrow_date}\n"
 
-        report.file.save(f"currently_borrowed_books_{report.generated_at}.csv", ContentFile(file_content))
-        report.status = 'success'
-        report.save()
-    except Exception as e:
-        report.status = 'failed'
-        report.save()
+@shared_task
+def evict_old_reports():
+    return evict_reports()
@@ -1,13 +1,34 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import shutil
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from datetime import timedelta
 from django.core.files.uploadedfile import SimpleUploadedFile
-from reports.models import Report
+from reports.models import DailyBookCirculation, DailyCategoryCirculation, DailyUserCirculation, Report
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
 from unittest.mock import patch, MagicMock
-from .tasks import generate_most_borrowed_books_report
+from books.models import Book, Category
+from borrowing.models import Borrowing
+from .rollups import refresh_circulation_rollups
+from .engines import get_engine
+from .progress import PROGRESS_KEY, ProgressTracker, get_progress
+from .retention import evict_reports
+from .tasks import generate_report
 
 User = get_user_model()
 
@@ -68,7 +89,7 @@ class ReportAPITest(APITestCase):
         self.report_create_url = reverse('create-report')
         self.report_list_url = reverse('list-reports')
 
-    @patch('reports.tasks.generate_late_borrowers_report.delay')
+    @patch('reports.tasks.generate_report.delay')
     def test_create_report_as_librarian(self, mock_task):
         self.client.force_authenticate(user=self.librarian_user)
         data = {
@@ -79,7 +100,7 @@ class ReportAPITest(APITestCase):
         self.assertEqual(Report.objects.count(), 1)
         mock_task.assert_called_once()
 
-    @patch('reports.tasks.generate_late_borrowers_report.delay')
+    @patch('reports.tasks.generate_report.delay')
     def test_create_report_as_admin(self, mock_task):
         self.client.force_authenticate(user=self.admin_user)
         data = {
@@ -112,7 +133,7 @@ class ReportAPITest(APITestCase):
         response = self.client.get(self.report_list_url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_list_reports_as_librarian(self):
         Report.objects.create(report_type='MOST_BORROWED_BOOKS', generated_by=self.librarian_user)
@@ -123,7 +144,7 @@ class ReportAPITest(APITestCase):
         response = self.client.get(self.report_list_url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_list_reports_without_permission(self):
         regular_user = User.objects.create_user(username='regular', password='password', role='member')
@@ -147,26 +168,320 @@ class ReportTasksTest(TestCase):
         return User.objects.create(username='testuser', password='password')
 
     @patch('django.db.models.fields.files.FieldFile.save', MagicMock(name="save"))
-    @patch('reports.tasks.Borrowing.objects')
-    def test_generate_most_borrowed_books_report_success(self, mock_borrowing_objects):
-        mock_borrowing = MagicMock()
-        mock_borrowing.values.return_value.annotate.return_value.order_by.return_value = [
-            {'book__title': 'Book 1', 'total_borrows': 5},
-            {'book__title': 'Book 2', 'total_borrows': 3},
-        ]
-        mock_borrowing_objects.values.return_value = mock_borrowing
-
-        generate_most_borrowed_books_report(self.report.id)
+    def test_generate_most_borrowed_books_report_success(self):
+        generate_report(self.report.id)
 
         self.report.refresh_from_db()
         self.assertEqual(self.report.status, 'success')
 
     @patch('django.db.models.fields.files.FieldFile.save', MagicMock(name="save"))
-    @patch('reports.tasks.Borrowing.objects')
-    def test_generate_most_borrowed_books_report_failure(self, mock_borrowing_objects):
-        mock_borrowing_objects.values.side_effect = Exception('Database error')
+    @patch('reports.engines.MostBorrowedBooksReport.get_queryset')
+    def test_generate_most_borrowed_books_report_failure(self, mock_get_queryset):
+        mock_get_queryset.side_effect = Exception('Database error')
 
-        generate_most_borrowed_books_report(self.report.id)
+        generate_report(self.report.id)
 
         self.report.refresh_from_db()
         self.assertEqual(self.report.status, 'failed')
+
+
+class StreamingReportTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, REPORT_SPOOL_MAX_SIZE=64,
+                                     CIRCULATION_ROLLUP_LAG=timedelta(0))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create(username='reader')
+        self.report = Report.objects.create(report_type='MOST_BORROWED_BOOKS', generated_by=self.user)
+        books = [Book.objects.create(title=f'Book, {n}', isbn=f'97800000020{n:02d}') for n in range(3)]
+        for count, book in enumerate(books, 1):
+            Borrowing.objects.bulk_create(
+                Borrowing(user=self.user, book=book, due_date=timezone.now()) for _ in range(count)
+            )
+
+    def generate(self, report_type='MOST_BORROWED_BOOKS', **options):
+        report = Report.objects.create(report_type=report_type, generated_by=self.user, **options)
+        generate_report(report.id)
+        report.refresh_from_db()
+        with report.file.open('rb') as f:
+            content = f.read()
+        if report.compress:
+            content = gzip.decompress(content)
+        return report, content.decode()
+
+    def test_writes_csv_through_spooled_file(self):
+        report, content = self.generate()
+
+        self.assertEqual((report.status, report.row_count), ('success', 3))
+        self.assertEqual(list(csv.reader(io.StringIO(content))), [
+            ['Book Title', 'Total Borrows'], ['Book, 2', '3'], ['Book, 1', '2'], ['Book, 0', '1'],
+        ])
+
+    def test_gzip_output(self):
+        report, content = self.generate(compress=True)
+
+        self.assertTrue(report.file.name.endswith('.csv.gz'))
+        self.assertEqual(list(csv.reader(io.StringIO(content)))[1], ['Book, 2', '3'])
+
+    def test_jsonl_output(self):
+        report, content = self.generate(output_format='jsonl')
+
+        self.assertTrue(report.file.name.endswith('.jsonl'))
+        self.assertEqual(json.loads(content.splitlines()[0]), {'title': 'Book, 2', 'total_borrows': 3})
+
+    def test_columnar_output(self):
+        report, content = self.generate(output_format='columnar')
+
+        schema, group = map(json.loads, content.splitlines())
+        self.assertEqual(schema['columns'], ['title', 'total_borrows'])
+        self.assertEqual(group['total_borrows'], [3, 2, 1])
+
+    def test_loan_reports_only_include_open_loans(self):
+        Borrowing.objects.create(user=self.user, book=Book.objects.first(), return_date=timezone.now(),
+                                 due_date=timezone.now() - timedelta(days=1))
+        Borrowing.objects.create(user=self.user, book=Book.objects.first(),
+                                 due_date=timezone.now() + timedelta(days=1))
+
+        late, content = self.generate('LATE_BORROWERS')
+        self.assertEqual((late.status, late.row_count), ('success', 6))
+        current, content = self.generate('CURRENTLY_BORROWED_BOOKS')
+        self.assertEqual((current.status, current.row_count), ('success', 7))
+
+
+
+@override_settings(CIRCULATION_ROLLUP_LAG=timedelta(0))
+class CirculationRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.fiction = Category.objects.create(title='Fiction')
+        self.books = [Book.objects.create(title=f'Rolled {n}', isbn=f'97800000030{n:02d}', category=self.fiction)
+                      for n in range(2)]
+
+    def borrow(self, book, days_ago=0, count=1):
+        loans = Borrowing.objects.bulk_create(
+            Borrowing(user=self.user, book=book, due_date=timezone.now()) for _ in range(count)
+        )
+        Borrowing.objects.filter(pk__in=[loan.pk for loan in loans]).update(
+            borrow_date=timezone.now() - timedelta(days=days_ago))
+
+    def test_refresh_is_incremental(self):
+        self.borrow(self.books[0], count=2)
+        self.borrow(self.books[1], days_ago=40)
+        self.assertEqual(refresh_circulation_rollups(), 3)
+        self.assertEqual(refresh_circulation_rollups(), 0)
+
+        self.borrow(self.books[0])
+        self.assertEqual(refresh_circulation_rollups(batch_size=1), 1)
+        today = DailyBookCirculation.objects.get(book=self.books[0])
+        self.assertEqual((today.day, today.borrows), (timezone.localdate(), 3))
+        self.assertEqual(sorted(DailyCategoryCirculation.objects.values_list('borrows', flat=True)), [1, 3])
+        self.assertEqual(DailyUserCirculation.objects.count(), 2)
+
+    @override_settings(CIRCULATION_ROLLUP_LAG=timedelta(minutes=5))
+    def test_recent_loans_wait_for_the_lag(self):
+        self.borrow(self.books[0])
+        self.assertEqual(refresh_circulation_rollups(), 0)
+
+    def test_ranking_reports_read_the_rollup(self):
+        self.borrow(self.books[0], count=2)
+        self.borrow(self.books[1], days_ago=40, count=3)
+        refresh_circulation_rollups()
+
+        engine = get_engine('MOST_BORROWED_BOOKS')({'days': 30})
+        self.assertEqual(list(engine.rows()), [('Rolled 0', 2)])
+        engine = get_engine('MOST_BORROWED_BOOKS')()
+        self.assertEqual(list(engine.rows()), [('Rolled 1', 3), ('Rolled 0', 2)])
+        self.assertEqual(list(get_engine('BUSIEST_CATEGORIES')().rows()), [('Fiction', 5)])
+
+    def test_days_parameter_is_validated(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='desk', role='librarian'))
+        response = client.post(reverse('create-report'), {
+            'report_type': 'MOST_BORROWED_BOOKS', 'parameters': {'days': 'many'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('parameters', response.data)
+
+    def test_check_and_rebuild_command(self):
+        self.borrow(self.books[0], count=2)
+        refresh_circulation_rollups()
+        call_command('rebuild_circulation_stats', '--check', stdout=io.StringIO())
+
+        DailyBookCirculation.objects.update(borrows=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_circulation_stats', '--check', stdout=io.StringIO())
+
+        call_command('rebuild_circulation_stats', stdout=io.StringIO())
+        self.assertEqual(DailyBookCirculation.objects.get().borrows, 2)
+        call_command('rebuild_circulation_stats', '--check', stdout=io.StringIO())
+
+
+class ReportDeduplicationTest(APITestCase):
+    def setUp(self):
+        self.librarian = User.objects.create_user(username='desk', password='password', role='librarian')
+        self.client.force_authenticate(self.librarian)
+        self.url = reverse('create-report')
+
+    @patch('reports.services.generate_report.delay')
+    def test_identical_requests_coalesce(self, mock_task):
+        first = self.client.post(self.url, {'report_type': 'LATE_BORROWERS'}, format='json')
+        second = self.client.post(self.url, {'report_type': 'LATE_BORROWERS'}, format='json')
+
+        self.assertEqual((first.status_code, second.status_code), (status.HTTP_201_CREATED, status.HTTP_200_OK))
+        self.assertEqual(first.data['id'], second.data['id'])
+        mock_task.assert_called_once()
+
+        other = self.client.post(self.url, {'report_type': 'LATE_BORROWERS', 'output_format': 'jsonl'},
+                                 format='json')
+        self.assertEqual(other.status_code, status.HTTP_201_CREATED)
+
+    @patch('reports.services.generate_report.delay')
+    def test_finished_report_is_reused_until_data_changes(self, mock_task):
+        first = self.client.post(self.url, {'report_type': 'CURRENTLY_BORROWED_BOOKS'}, format='json')
+        Report.objects.filter(pk=first.data['id']).update(status='success')
+        reused = self.client.post(self.url, {'report_type': 'CURRENTLY_BORROWED_BOOKS'}, format='json')
+        self.assertEqual(reused.data['id'], first.data['id'])
+
+        Borrowing.objects.create(user=self.librarian, book=Book.objects.create(title='New', isbn='9780000000401'),
+                                 due_date=timezone.now() + timedelta(days=7))
+        fresh = self.client.post(self.url, {'report_type': 'CURRENTLY_BORROWED_BOOKS'}, format='json')
+        self.assertEqual(fresh.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(fresh.data['id'], first.data['id'])
+
+    @patch('reports.services.generate_report.delay')
+    def test_failed_report_is_not_reused(self, mock_task):
+        first = self.client.post(self.url, {'report_type': 'LATE_BORROWERS'}, format='json')
+        Report.objects.filter(pk=first.data['id']).update(status='failed')
+        retry = self.client.post(self.url, {'report_type': 'LATE_BORROWERS'}, format='json')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+
+    @patch('reports.services.generate_report.delay')
+    def test_conflicting_run_gone_before_reread_starts_a_new_one(self, mock_task):
+        # The insert collides with a pending run that fails before it can be re-read.
+        create = Report.objects.create
+        outcomes = [IntegrityError()]
+
+        def create_after_collision(**kwargs):
+            if outcomes:
+                raise outcomes.pop()
+            return create(**kwargs)
+
+        with patch.object(Report.objects, 'create', side_effect=create_after_collision) as mocked:
+            response = self.client.post(self.url, {'report_type': 'LATE_BORROWERS'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(mocked.call_count, 2)
+        mock_task.assert_called_once_with(response.data['id'])
+
+    def test_one_pending_run_per_fingerprint(self):
+        Report.objects.create(report_type='LATE_BORROWERS', generated_by=self.librarian, fingerprint='f' * 64)
+        with self.assertRaises(IntegrityError):
+            Report.objects.create(report_type='LATE_BORROWERS', generated_by=self.librarian, fingerprint='f' * 64)
+
+
+class ReportRetentionTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root, CIRCULATION_ROLLUP_LAG=timedelta(0))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create(username='desk')
+
+    def generate(self, age):
+        report = Report.objects.create(report_type='CURRENTLY_BORROWED_BOOKS', generated_by=self.user)
+        generate_report(report.id)
+        Report.objects.filter(pk=report.pk).update(generated_at=timezone.now() - age)
+        report.refresh_from_db()
+        return report
+
+    def test_old_reports_expire(self):
+        old, recent = self.generate(timedelta(days=40)), self.generate(timedelta(days=1))
+        old_file = old.file.name
+
+        self.assertEqual(evict_reports(), 1)
+        old.refresh_from_db()
+        self.assertEqual((old.status, old.file.name), ('expired', ''))
+        self.assertFalse(default_storage.exists(old_file))
+        recent.refresh_from_db()
+        self.assertEqual(recent.status, 'success')
+        self.assertTrue(recent.file.storage.exists(recent.file.name))
+
+    def test_oldest_reports_are_evicted_over_the_size_cap(self):
+        reports = [self.generate(timedelta(days=days)) for days in (3, 2, 1)]
+        with override_settings(REPORT_MAX_TOTAL_SIZE=reports[0].file_size * 2):
+            self.assertEqual(evict_reports(), 1)
+        self.assertEqual([Report.objects.get(pk=report.pk).status for report in reports],
+                         ['expired', 'success', 'success'])
+
+    def test_stuck_pending_runs_fail(self):
+        report = Report.objects.create(report_type='LATE_BORROWERS', generated_by=self.user, fingerprint='a' * 64)
+        Report.objects.filter(pk=report.pk).update(generated_at=timezone.now() - timedelta(hours=2))
+        evict_reports()
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'failed')
+
+
+class ReportProgressTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root, REPORT_LONG_POLL_TIMEOUT=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.librarian = User.objects.create(username='desk', role='librarian')
+        self.auth = {'headers': {'Authorization': f'Bearer {AccessToken.for_user(self.librarian)}'}}
+        self.report = Report.objects.create(report_type='CURRENTLY_BORROWED_BOOKS', generated_by=self.librarian)
+
+    def test_tracker_publishes_rate_limited_progress_with_eta(self):
+        tracker = ProgressTracker(self.report.id, expected_rows=1000)
+        tracker.update(100, 2048)
+        self.assertEqual(get_progress(self.report.id)['rows'], 100)
+        self.assertIsNotNone(get_progress(self.report.id)['eta_seconds'])
+        tracker.update(200, 4096)
+        self.assertEqual(get_progress(self.report.id)['rows'], 100)
+
+    def test_task_publishes_final_state(self):
+        book = Book.objects.create(title='Progress', isbn='9780000000501')
+        Borrowing.objects.create(user=self.librarian, book=book, due_date=timezone.now() + timedelta(days=3))
+        generate_report(self.report.id)
+
+        state = get_progress(self.report.id)
+        self.assertEqual((state['status'], state['rows']), ('success', 1))
+        self.assertGreater(state['bytes'], 0)
+        self.assertTrue(state['file'].endswith('.csv'))
+
+    def test_status_endpoint_reads_the_cache(self):
+        ProgressTracker(self.report.id).publish('running', rows=10, bytes_written=100)
+        client = APIClient()
+        client.force_authenticate(self.librarian)
+        with self.assertNumQueries(0):
+            response = client.get(reverse('report-status', args=[self.report.id]))
+        self.assertEqual((response.data['status'], response.data['rows']), ('running', 10))
+
+        cache.delete(PROGRESS_KEY.format(self.report.id))
+        response = client.get(reverse('report-status', args=[self.report.id]))
+        self.assertEqual(response.data['status'], 'pending')
+
+    async def test_long_poll_returns_current_state(self):
+        await sync_to_async(ProgressTracker(self.report.id).publish)('running', rows=5)
+        response = await self.async_client.get(reverse('report-progress', args=[self.report.id]), **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['rows'], 5)
+
+    async def test_stream_sends_events_until_finished(self):
+        await sync_to_async(ProgressTracker(self.report.id).publish)('success', rows=7)
+        response = await self.async_client.get(reverse('report-progress-stream', args=[self.report.id]), **self.auth)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('event: progress', body)
+        self.assertEqual(json.loads(body.split('data: ')[1])['rows'], 7)
+
+    async def test_progress_endpoints_require_staff(self):
+        response = await self.async_client.get(reverse('report-progress', args=[self.report.id]))
+        self.assertEqual(response.status_code, 401)
+        member = await User.objects.acreate(username='member', role='member')
+        response = await self.async_client.get(reverse('report-progress', args=[self.report.id]),
+                                               headers={'Authorization': f'Bearer {AccessToken.for_user(member)}'})
+        self.assertEqual(response.status_code, 403)
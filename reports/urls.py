@@ -1,7 +1,11 @@
 from django.urls import path
-from .views import ReportCreateView, ReportListView
+from .streams import report_progress_poll, report_progress_stream
+from .views import ReportCreateView, ReportListView, ReportStatusView
 
 urlpatterns = [
     path('create/', ReportCreateView.as_view(), name='create-report'),
     path('list/', ReportListView.as_view(), name='list-reports'),
+    path('<int:pk>/status/', ReportStatusView.as_view(), name='report-status'),
+    path('<int:pk>/progress/', report_progress_poll, name='report-progress'),
+    path('<int:pk>/progress/stream/', report_progress_stream, name='report-progress-stream'),
 ]
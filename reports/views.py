@@ -1,7 +1,12 @@
-from rest_framework import generics
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from .models import Report
 from .serializers import ReportSerializer
-from .tasks import generate_most_borrowed_books_report, generate_late_borrowers_report, generate_currently_borrowed_books_report
+from .progress import get_progress, report_state
+from .services import request_report
 from utils.permissions import IsAdminOrLibrarian
 
 
@@ -10,17 +15,27 @@ class ReportCreateView(generics.CreateAPIView):
     serializer_class = ReportSerializer
     permission_classes = [IsAdminOrLibrarian]
 
-    def perform_create(self, serializer):
-        report = serializer.save(generated_by=self.request.user)
-        if report.report_type == 'MOST_BORROWED_BOOKS':
-            generate_most_borrowed_books_report.delay(report.id)
-        elif report.report_type == 'LATE_BORROWERS':
-            generate_late_borrowers_report.delay(report.id)
-        elif report.report_type == 'CURRENTLY_BORROWED_BOOKS':
-            generate_currently_borrowed_books_report.delay(report.id)
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        report, created = request_report(request.user, **serializer.validated_data)
+        return Response(self.get_serializer(report).data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
 class ReportListView(generics.ListAPIView):
     queryset = Report.objects.all()
     serializer_class = ReportSerializer
     permission_classes = [IsAdminOrLibrarian]
+    ordering = ['-generated_at', '-id']
+
+
+class ReportStatusView(APIView):
+    """Progress of a report run, read from the cache; the database is only hit when nothing was published."""
+    permission_classes = [IsAuthenticated, IsAdminOrLibrarian]
+
+    def get(self, request, pk):
+        state = get_progress(pk)
+        if state is None:
+            state = report_state(get_object_or_404(Report, pk=pk))
+        return Response(state)
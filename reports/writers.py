@@ -0,0 +1,94 @@
+import csv
+import gzip
+import io
+import tempfile
+from itertools import islice
+
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Rows fetched per round trip by the server-side cursor behind QuerySet.iterator().
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def _write_csv(stream, names, headers, rows):
+    writer = csv.writer(stream)
+    writer.writerow(headers)
+    writer.writerows(rows)
+
+
+def _write_jsonl(stream, names, headers, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        stream.write(encoder.encode(dict(zip(names, row))))
+        stream.write('\n')
+
+
+def _write_columnar(stream, names, headers, rows):
+    """
+    Parquet-style row groups, one JSON object per line: a schema line, then
+    one line per group of up to ITERATOR_CHUNK_SIZE rows, holding one array per
+    column. Readers can load a single column without parsing the other
+    columns' values, and memory is bounded by the group size.
+    """
+    encoder = DjangoJSONEncoder()
+    stream.write(encoder.encode({'columns': names, 'headers': headers}))
+    stream.write('\n')
+    rows = iter(rows)
+    while group := list(islice(rows, ITERATOR_CHUNK_SIZE)):
+        stream.write(encoder.encode(dict(zip(names, map(list, zip(*group))))))
+        stream.write('\n')
+
+
+FORMATS = {
+    'csv': _write_csv,
+    'jsonl': _write_jsonl,
+    'columnar': _write_columnar,
+}
+
+
+class _Counted:
+    def __init__(self, rows, on_chunk=None):
+        self.rows = rows
+        self.on_chunk = on_chunk
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            if self.on_chunk is not None and self.count % ITERATOR_CHUNK_SIZE == 0:
+                self.on_chunk(self.count)
+            yield row
+
+
+def write_report(report, filename, names, headers, rows, output_format='csv', compress=False, progress=None):
+    """
+    Stream ``rows`` into ``report.file`` without holding the report in memory,
+    and return the number of rows and bytes written.
+
+    Rows are written in ``output_format`` (a key of FORMATS) into a temporary
+    file. The file stays in memory up to settings.REPORT_SPOOL_MAX_SIZE and
+    spills to disk past that. The storage backend then copies it in chunks.
+    ``rows`` should be a lazy iterable, typically
+    ``queryset.values_list(...).iterator(chunk_size=ITERATOR_CHUNK_SIZE)``.
+    ``filename`` gets the format's extension, plus ``.gz`` with ``compress``.
+    ``progress(rows, bytes)`` is called after every ITERATOR_CHUNK_SIZE rows.
+    The report is not saved.
+    """
+    rows = _Counted(rows, None if progress is None else lambda count: progress(count, spool.tell()))
+    filename = f'{filename}.{output_format}'
+    with tempfile.SpooledTemporaryFile(max_size=settings.REPORT_SPOOL_MAX_SIZE) as spool:
+        raw = gzip.GzipFile(fileobj=spool, mode='wb') if compress else spool
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        FORMATS[output_format](text, names, headers, rows)
+        text.flush()
+        text.detach()
+        if compress:
+            raw.close()
+            filename += '.gz'
+
+        size = spool.tell()
+        spool.seek(0)
+        report.file.save(filename, File(spool, name=filename), save=False)
+    return rows.count, size
@@ -0,0 +1,223 @@
+import datetime
+import decimal
+import json
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite ordering such as ('-borrow_date', '-id').
+
+    Unlike DRF's CursorPagination, the cursor stores the value of every ordering
+    field, and the next page is selected with a lexicographic keyset condition
+    instead of an offset, so each page costs one index range scan however deep
+    into the table it is. A primary key tiebreaker is appended to the ordering
+    when it is missing, which makes every position unique.
+
+    The ordering comes from the view's OrderingFilter when it has one, then
+    from ``view.ordering``, then from ``ordering`` here. Views may set
+    ``page_size`` and ``max_page_size``; clients may ask for a page size with
+    ``?page_size=`` up to that cap.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+    ordering = ('-id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request, view)
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        position, reverse = self.decode_cursor(request)
+        keys = [_Key(queryset.model, field, reverse) for field in self.ordering]
+        queryset = queryset.order_by(*[key.order_expression() for key in keys])
+        if position is not None:
+            queryset = queryset.filter(_keyset_condition(keys, self.parse_position(keys, position)))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def get_page_size(self, request, view):
+        page_size = getattr(view, 'page_size', self.page_size)
+        max_page_size = min(getattr(view, 'max_page_size', self.max_page_size), self.max_page_size)
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            requested = page_size
+        return max(1, min(requested, max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        if OrderingFilter in getattr(view, 'filter_backends', []):
+            ordering = OrderingFilter().get_ordering(request, queryset, view)
+        ordering = ordering or getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        ordering = tuple(ordering)
+
+        assert not any('__' in field for field in ordering), (
+            'Keyset pagination does not support related lookups in the ordering.'
+        )
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id' if ordering[-1].startswith('-') else 'id',)
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            tokens = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = tokens['p'], bool(tokens.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def parse_position(self, keys, position):
+        """The cursor's JSON values converted to each ordering field's type; a cursor is client input."""
+        try:
+            return [key.to_python(value) for key, value in zip(keys, position)]
+        except (ValidationError, TypeError, ValueError, OverflowError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        position = [_encode_value(_get_value(instance, field.lstrip('-'))) for field in self.ordering]
+        tokens = {'p': position, 'r': 1} if reverse else {'p': position}
+        encoded = urlsafe_b64encode(json.dumps(tokens).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query', 'schema': {'type': 'integer'}},
+        ]
+
+
+class _Key:
+    """
+    One column of the keyset, in the direction the current query walks it.
+
+    NULLs sort last going forward and first going backwards on every backend,
+    which is what the keyset condition assumes. The NULL ordering is only
+    spelled out for nullable columns so that NOT NULL columns keep using a
+    plain index scan.
+    """
+
+    def __init__(self, model, field, reverse):
+        self.name = field.lstrip('-')
+        self.descending = field.startswith('-') != reverse
+        self.nulls_first = reverse
+        model_field = model._meta.pk if self.name == 'pk' else model._meta.get_field(self.name)
+        self.field = getattr(model_field, 'output_field', model_field)
+        self.nullable = self.field.null
+
+    def to_python(self, value):
+        if value is None:
+            return None
+        value = self.field.to_python(value)
+        # Validators include the column's range, so an out of range integer is refused here, not by the driver.
+        self.field.run_validators(value)
+        return value
+
+    def order_expression(self):
+        nulls = {}
+        if self.nullable:
+            nulls = {'nulls_first': True} if self.nulls_first else {'nulls_last': True}
+        if self.descending:
+            return F(self.name).desc(**nulls)
+        return F(self.name).asc(**nulls)
+
+    def after(self, value):
+        """Rows strictly after ``value`` on this column, or None if there are none."""
+        if value is None:
+            return Q(**{f'{self.name}__isnull': False}) if self.nulls_first else None
+        after = Q(**{f'{self.name}__lt' if self.descending else f'{self.name}__gt': value})
+        if self.nullable and not self.nulls_first:
+            after |= Q(**{f'{self.name}__isnull': True})
+        return after
+
+    def equal(self, value):
+        if value is None:
+            return Q(**{f'{self.name}__isnull': True})
+        return Q(**{self.name: value})
+
+
+def _keyset_condition(keys, position):
+    conditions = []
+    equal_so_far = []
+    for key, value in zip(keys, position):
+        after = key.after(value)
+        if after is not None:
+            conditions.append(reduce(and_, equal_so_far + [after]))
+        equal_so_far.append(key.equal(value))
+    if not conditions:
+        return Q(pk__in=[])
+    return reduce(or_, conditions)
+
+
+def _get_value(instance, name):
+    if isinstance(instance, dict):
+        return instance[name]
+    return getattr(instance, name)
+
+
+def _encode_value(value):
+    # Full precision isoformat: DjangoJSONEncoder truncates to milliseconds, which would
+    # make a cursor skip rows that share the millisecond.
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
@@ -1,30 +1,56 @@
+from django.utils import timezone
 from rest_framework import permissions
 from rest_framework.permissions import BasePermission
 
-class IsAdminOrReadOnly(permissions.BasePermission):
+# Permission checks read only what the token claims carry (request.user.pk,
+# role and membership_expiry), so with an authentication.principals.LazyUser
+# they never touch the users table.
+STAFF_ROLES = ('admin', 'librarian')
 
-    def has_permission(self, request, view):
-        if request.method in permissions.SAFE_METHODS:
-            return True
 
-        return request.user.role == 'admin'
+def _role(request):
+    return getattr(request.user, 'role', None)
 
 
-class IsAdminOrLibrarianOrReadOnly(permissions.BasePermission):
+class HasRole(BasePermission):
+    """Allow users whose role is in ``roles``; with ``read_only_for_all``, anyone may use safe methods."""
+    roles = ()
+    read_only_for_all = False
 
     def has_permission(self, request, view):
-        if request.method in permissions.SAFE_METHODS:
+        if self.read_only_for_all and request.method in permissions.SAFE_METHODS:
             return True
+        return _role(request) in self.roles
+
+
+class IsAdminOrReadOnly(HasRole):
+    roles = ('admin',)
+    read_only_for_all = True
+
 
-        return request.user.role in ['admin', 'librarian']
+class IsAdminOrLibrarianOrReadOnly(HasRole):
+    roles = STAFF_ROLES
+    read_only_for_all = True
 
 
-class IsAdminOrLibrarianOrOwner(permissions.BasePermission):
+class IsAdminOrLibrarian(HasRole):
+    roles = STAFF_ROLES
+
+
+class IsAdminOrLibrarianOrOwner(BasePermission):
+    """Staff, or the user the object belongs to; compared by id so ``obj.user`` is not loaded."""
 
     def has_object_permission(self, request, view, obj):
-        return request.user == obj.user or request.user.role == ['admin', 'librarian']
+        return _role(request) in STAFF_ROLES or (
+            request.user.is_authenticated and obj.user_id == request.user.pk)
 
 
-class IsAdminOrLibrarian(permissions.BasePermission):
+class HasActiveMembership(BasePermission):
+    """Members whose membership has not expired, and all staff; a missing expiry never expires."""
+    message = 'Your membership has expired.'
+
     def has_permission(self, request, view):
-        return request.user.role in ['admin', 'librarian']
+        if _role(request) in STAFF_ROLES:
+            return True
+        expiry = getattr(request.user, 'membership_expiry', None)
+        return expiry is None or expiry >= timezone.localdate()
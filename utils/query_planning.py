@@ -0,0 +1,120 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+class QueryPlan:
+    """
+    select_related / prefetch_related / annotate calls needed to serialize a
+    queryset without issuing a query per row.
+    """
+
+    def __init__(self):
+        self.select_related = set()
+        self.prefetch_related = {}
+        self.annotations = {}
+
+    def merge(self, other, prefix):
+        self.select_related.add(prefix)
+        for path in other.select_related:
+            self.select_related.add(f'{prefix}__{path}')
+        for lookup, queryset in other.prefetch_related.items():
+            self.prefetch_related[f'{prefix}__{lookup}'] = queryset
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*[
+                Prefetch(lookup, queryset=prefetch_queryset)
+                for lookup, prefetch_queryset in sorted(self.prefetch_related.items())
+            ])
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        return queryset
+
+
+def _get_relation(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def _is_single_valued(relation):
+    return relation.many_to_one or relation.one_to_one
+
+
+def _plan_dotted_source(plan, model, source_attrs):
+    """ReadOnlyField(source='book.title') and friends: join every relation on the way."""
+    path = []
+    for attr in source_attrs[:-1]:
+        relation = _get_relation(model, attr)
+        if relation is None or not _is_single_valued(relation):
+            return
+        path.append(attr)
+        model = relation.related_model
+    if path:
+        plan.select_related.add('__'.join(path))
+
+
+def build_plan(serializer, model=None):
+    """
+    Walk the declared fields of a (bound or unbound) ModelSerializer and work
+    out how to load everything it will touch.
+
+    Single-valued nested serializers become select_related joins, unless the
+    nested serializer needs annotations of its own, in which case they are
+    prefetched with an annotated queryset. Many-valued nested serializers and
+    many related fields become Prefetch objects planned recursively. Aggregates
+    a serializer needs are declared on its Meta as ``annotations``.
+    """
+    if isinstance(serializer, type):
+        serializer = serializer()
+    model = model or serializer.Meta.model
+    plan = QueryPlan()
+    plan.annotations.update(getattr(serializer.Meta, 'annotations', {}))
+
+    for field in serializer.fields.values():
+        if field.source == '*':
+            continue
+        if len(field.source_attrs) > 1:
+            _plan_dotted_source(plan, model, field.source_attrs)
+            continue
+
+        relation = _get_relation(model, field.source)
+        if relation is None:
+            continue
+        related_model = relation.related_model
+
+        if isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+            child_plan = build_plan(field.child, related_model)
+            plan.prefetch_related[field.source] = child_plan.apply(related_model._default_manager.all())
+        elif isinstance(field, serializers.ModelSerializer):
+            child_plan = build_plan(field, related_model)
+            if child_plan.annotations or not _is_single_valued(relation):
+                plan.prefetch_related[field.source] = child_plan.apply(related_model._default_manager.all())
+            else:
+                plan.merge(child_plan, field.source)
+        elif isinstance(field, serializers.ManyRelatedField):
+            plan.prefetch_related[field.source] = related_model._default_manager.all()
+        elif isinstance(field, serializers.RelatedField) and not isinstance(field, serializers.PrimaryKeyRelatedField):
+            if _is_single_valued(relation):
+                plan.select_related.add(field.source)
+
+    return plan
+
+
+def plan_queryset(queryset, serializer_class):
+    return build_plan(serializer_class, queryset.model).apply(queryset)
+
+
+class QueryPlanMixin:
+    """
+    Generic view mixin that plans get_queryset() from the serializer in use, so
+    list endpoints run a fixed number of queries regardless of page size.
+    """
+
+    def get_queryset(self):
+        return plan_queryset(super().get_queryset(), self.get_serializer_class())